@@ -7,6 +7,7 @@ Main entry points:
 - calculate_return_rate_analytics() - Customer analytics
 - calculate_coupon_analytics() - Coupon analytics
 - export_analytics_to_excel() - Excel export
+- export_analytics_to_excel_bytes() - Excel export as saved .xlsx bytes
 - export_coupon_to_excel() - Coupon Excel export
 
 Version: 3.3
@@ -14,7 +15,7 @@ Version: 3.3
 
 from .core import calculate_return_rate_analytics
 from .coupon_analytics import calculate_coupon_analytics, export_coupon_to_excel
-from .excel_export import export_analytics_to_excel
+from .excel_export import export_analytics_to_excel, export_analytics_to_excel_bytes
 
 __version__ = '3.3'
 
@@ -22,5 +23,6 @@ __all__ = [
     'calculate_return_rate_analytics',
     'calculate_coupon_analytics',
     'export_analytics_to_excel',
+    'export_analytics_to_excel_bytes',
     'export_coupon_to_excel',
 ]
\ No newline at end of file
@@ -9,14 +9,28 @@ Version: 3.3 - Fixed within-season return calculation
 import logging
 from collections import defaultdict
 from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
 
 from .calculations import calculate_return_visits, create_empty_bucket
-from .customer_utils import GRADE_ORDER, get_all_time_grade_counts
+from .customer_utils import GRADE_ORDER, get_all_time_grade_counts, ordered_grades
 from .season_utils import session_sort_key, month_sort_key, year_sort_key, week_sort_key
 
 logger = logging.getLogger('customer_analytics')
 
 
+def _contiguous_runs(purchases_sorted, field):
+    """
+    Split date-sorted purchases into (key, purchases) runs of equal ``field``.
+
+    Period keys (season/month/week/year) are date ranges, so on a date-sorted
+    list every key occupies one contiguous run and no dict-of-lists bucketing
+    is needed. Runs come out in the same first-seen order the dict gave.
+    """
+    for key, group in groupby(purchases_sorted, itemgetter(field)):
+        yield key, list(group)
+
+
 def aggregate_by_grade(customer_details, new_members=None):
     """
     Aggregate customer data by VIP grade.
@@ -58,7 +72,7 @@ def aggregate_by_grade(customer_details, new_members=None):
 
     # Build stats list
     grade_stats = []
-    for grade in sorted(grade_buckets, key=lambda x: GRADE_ORDER.get(x, 99)):
+    for grade in ordered_grades(grade_buckets):
         s = grade_buckets[grade]
         tdb = grade_db.get(grade, 0)
         new_c = grade_new.get(grade, 0)
@@ -105,10 +119,7 @@ def aggregate_by_season(customer_purchases, get_customer_info_fn, new_members=No
     for vip_id, purchases in customer_purchases.items():
         # Track VIP 0 separately
         if vip_id == '0':
-            by_sess = defaultdict(list)
-            for p in purchases:
-                by_sess[p['session']].append(p)
-            for sk, sp in by_sess.items():
+            for sk, sp in _contiguous_runs(purchases, 'session'):
                 session_vip0_invoices[sk] += len(sp)
                 session_vip0_amount[sk] += sum(p['amount'] for p in sp)
             continue
@@ -119,12 +130,8 @@ def aggregate_by_season(customer_purchases, get_customer_info_fn, new_members=No
         # Get customer info from the EARLIEST purchase (consistent with core.py)
         grade, reg_date, name = get_customer_info_fn(vip_id, all_purchases_sorted[0]['customer'])
 
-        # Group by session
-        by_sess = defaultdict(list)
-        for p in all_purchases_sorted:
-            by_sess[p['session']].append(p)
-
-        for sk, sp in by_sess.items():
+        # Group by session — contiguous runs of the date-sorted list
+        for sk, sp in _contiguous_runs(all_purchases_sorted, 'session'):
             # sp is date-ordered (iterating sorted all_purchases_sorted)
             session_first_date = sp[0]['date']
             sp_amount = sum(p['amount'] for p in sp)
@@ -190,10 +197,7 @@ def aggregate_by_month(customer_purchases, get_customer_info_fn, new_members=Non
 
     for vip_id, purchases in customer_purchases.items():
         if vip_id == '0':
-            by_month = defaultdict(list)
-            for p in purchases:
-                by_month[p['month']].append(p)
-            for mk, mp in by_month.items():
+            for mk, mp in _contiguous_runs(purchases, 'month'):
                 month_vip0_invoices[mk] += len(mp)
                 month_vip0_amount[mk] += sum(p['amount'] for p in mp)
             continue
@@ -201,11 +205,7 @@ def aggregate_by_month(customer_purchases, get_customer_info_fn, new_members=Non
         all_purchases_sorted = purchases  # pre-sorted
         _, reg_date, _ = get_customer_info_fn(vip_id, all_purchases_sorted[0]['customer'])
 
-        by_month = defaultdict(list)
-        for p in all_purchases_sorted:
-            by_month[p['month']].append(p)
-
-        for mk, mp in by_month.items():
+        for mk, mp in _contiguous_runs(all_purchases_sorted, 'month'):
             month_first_date = mp[0]['date']
 
             mp_amount = sum(p['amount'] for p in mp)
@@ -269,11 +269,8 @@ def aggregate_by_week(customer_purchases, get_customer_info_fn, new_members=None
 
     for vip_id, purchases in customer_purchases.items():
         if vip_id == '0':
-            by_week = defaultdict(list)
-            for p in purchases:
-                by_week[p['week_sort']].append(p)
-                week_labels[p['week_sort']] = p['week_label']
-            for wk, wp in by_week.items():
+            for wk, wp in _contiguous_runs(purchases, 'week_sort'):
+                week_labels[wk] = wp[0]['week_label']
                 week_vip0_invoices[wk] += len(wp)
                 week_vip0_amount[wk] += sum(p['amount'] for p in wp)
             continue
@@ -281,12 +278,8 @@ def aggregate_by_week(customer_purchases, get_customer_info_fn, new_members=None
         all_purchases_sorted = purchases  # pre-sorted
         _, reg_date, _ = get_customer_info_fn(vip_id, all_purchases_sorted[0]['customer'])
 
-        by_week = defaultdict(list)
-        for p in all_purchases_sorted:
-            by_week[p['week_sort']].append(p)
-            week_labels[p['week_sort']] = p['week_label']
-
-        for wk, wp in by_week.items():
+        for wk, wp in _contiguous_runs(all_purchases_sorted, 'week_sort'):
+            week_labels[wk] = wp[0]['week_label']
             week_first_date = wp[0]['date']
             wp_amount = sum(p['amount'] for p in wp)
 
@@ -349,10 +342,7 @@ def aggregate_by_year(customer_purchases, get_customer_info_fn, new_members=None
 
     for vip_id, purchases in customer_purchases.items():
         if vip_id == '0':
-            by_year = defaultdict(list)
-            for p in purchases:
-                by_year[p['year']].append(p)
-            for yk, yp in by_year.items():
+            for yk, yp in _contiguous_runs(purchases, 'year'):
                 year_vip0_invoices[yk] += len(yp)
                 year_vip0_amount[yk] += sum(p['amount'] for p in yp)
             continue
@@ -360,11 +350,7 @@ def aggregate_by_year(customer_purchases, get_customer_info_fn, new_members=None
         all_purchases_sorted = purchases  # pre-sorted
         _, reg_date, _ = get_customer_info_fn(vip_id, all_purchases_sorted[0]['customer'])
 
-        by_year = defaultdict(list)
-        for p in all_purchases_sorted:
-            by_year[p['year']].append(p)
-
-        for yk, yp in by_year.items():
+        for yk, yp in _contiguous_runs(all_purchases_sorted, 'year'):
             year_first_date = yp[0]['date']
 
             yp_amount = sum(p['amount'] for p in yp)
@@ -638,7 +624,7 @@ def aggregate_by_shop(customer_purchases, get_customer_info_fn, all_session_keys
         
         # By grade list
         by_grade_list = []
-        for grade in sorted(shop_grade[sh], key=lambda x: GRADE_ORDER.get(x, 99)):
+        for grade in ordered_grades(shop_grade[sh]):
             gd = shop_grade[sh][grade]
             a = len(gd['active'])
             r = len(gd['returning'])
@@ -785,7 +771,7 @@ def aggregate_by_shop(customer_purchases, get_customer_info_fn, all_session_keys
         })
     
     # Sort by customer count
-    shop_stats.sort(key=lambda x: x['total_customers'], reverse=True)
+    shop_stats.sort(key=itemgetter('total_customers'), reverse=True)
     return shop_stats
 
 
@@ -12,6 +12,7 @@ Version: 3.4 - Added shop_group filter
 import logging
 from collections import defaultdict
 from decimal import Decimal
+from operator import itemgetter
 
 from django.db.models import Count, Case, When, IntegerField, Q
 
@@ -156,7 +157,7 @@ def calculate_return_rate_analytics(date_from=None, date_to=None, shop_group=Non
         if vip_id == '0':
             continue
         
-        purchases_sorted = sorted(purchases, key=lambda x: x['date'])
+        purchases_sorted = sorted(purchases, key=itemgetter('date'))
         n = len(purchases_sorted)
         
         # NEW: Count invoices WITHOUT VIP 0
@@ -232,7 +233,7 @@ def calculate_return_rate_analytics(date_from=None, date_to=None, shop_group=Non
     )
     
     # Sort customer details by return visits
-    customer_details.sort(key=lambda x: x['return_visits'], reverse=True)
+    customer_details.sort(key=itemgetter('return_visits'), reverse=True)
     
     logger.info("DONE  total_amount=%.2f  shops=%d  sessions=%d",
                 float(total_amount_period), len(shop_stats), len(session_stats))
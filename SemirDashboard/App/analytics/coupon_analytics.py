@@ -10,14 +10,15 @@ All field names verified against Coupon model
 
 from collections import defaultdict
 from decimal import Decimal
+from operator import itemgetter
 
 from django.db.models import Q
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils import get_column_letter
 
 from App.models import Coupon, Customer, SalesTransaction
 from App.models_cnv import CNVCustomer
+from App.analytics.excel_export import _set_widths
 
 
 def calc_coupon_amount(face_value, invoice_amount):
@@ -395,7 +396,7 @@ def calculate_coupon_analytics(
             }
         )
 
-    shop_stats.sort(key=lambda x: x["used"], reverse=True)
+    shop_stats.sort(key=itemgetter("used"), reverse=True)
 
     # Calculate percentages for template
     all_time_used_pct = (
@@ -743,82 +744,86 @@ def _build_coupon_summary_ws(wb, data, date_from, date_to, coupon_id_prefix, sho
     ws.column_dimensions["B"].width = 20
 
 
+def _append_coupon_header(ws, headers, header_fill, header_font, header_align):
+    """Append the header row in one call, then style the cells it created."""
+    ws.append(headers)
+    for cell in ws[ws.max_row]:
+        cell.fill = header_fill; cell.font = header_font; cell.alignment = header_align
+
+
 def _build_coupon_shop_ws(wb, data, header_fill, header_font, header_align):
     ws = wb.create_sheet("By Using Shop")
-    for col_num, header in enumerate([
+    _append_coupon_header(ws, [
         "Using Shop", "Total", "Used", "Unused", "Usage Rate",
         "% of Used (All Shops)", "Coupon Amount", "Total Amount (Unique Invoice)",
-    ], 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill; cell.font = header_font; cell.alignment = header_align
-
-    for row_num, shop in enumerate(data["by_shop"], 2):
-        ws.cell(row=row_num, column=1, value=shop["shop_name"])
-        ws.cell(row=row_num, column=2, value=shop["total"])
-        ws.cell(row=row_num, column=3, value=shop["used"])
-        ws.cell(row=row_num, column=4, value=shop["unused"])
-        ws.cell(row=row_num, column=5, value=f"{shop['usage_rate']}%")
-        ws.cell(row=row_num, column=6, value=f"{shop['used_pct_of_used']}%")
-        ws.cell(row=row_num, column=7, value=f"{shop['coupon_amount']:,.0f}")
-        ws.cell(row=row_num, column=8, value=f"{shop['total_amount']:,.0f}")
-    for col in range(1, 9):
-        ws.column_dimensions[get_column_letter(col)].width = 22
+    ], header_fill, header_font, header_align)
+
+    for shop in data["by_shop"]:
+        ws.append([
+            shop["shop_name"],
+            shop["total"],
+            shop["used"],
+            shop["unused"],
+            f"{shop['usage_rate']}%",
+            f"{shop['used_pct_of_used']}%",
+            f"{shop['coupon_amount']:,.0f}",
+            f"{shop['total_amount']:,.0f}",
+        ])
+    _set_widths(ws, [22] * 8)
 
 
 def _build_coupon_detail_ws(wb, data, header_fill, header_font, header_align):
     ws = wb.create_sheet("Coupon Details")
-    for col_num, header in enumerate([
+    _append_coupon_header(ws, [
         "Coupon ID", "Creator", "Face Value", "Using Shop", "Using Date",
         "Docket Number", "VIP ID", "Name", "Phone", "Sales Date",
         "Invoice Shop", "Amount (Invoice)", "Coupon Amount", "Note",
         "CNV ID", "CNV Points", "CNV Total Points",
-    ], 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill; cell.font = header_font; cell.alignment = header_align
-
-    for row_num, d in enumerate(data["details"], 2):
-        ws.cell(row=row_num, column=1, value=d["coupon_id"])
-        ws.cell(row=row_num, column=2, value=d["creator"])
-        ws.cell(row=row_num, column=3, value=d["face_value_display"])
-        ws.cell(row=row_num, column=4, value=d["using_shop"])
-        ws.cell(row=row_num, column=5, value=str(d["using_date"]) if d["using_date"] else "")
-        ws.cell(row=row_num, column=6, value=d["docket_number"])
-        ws.cell(row=row_num, column=7, value=d["vip_id"])
-        ws.cell(row=row_num, column=8, value=d["customer_name"])
-        ws.cell(row=row_num, column=9, value=d["customer_phone"])
-        ws.cell(row=row_num, column=10, value=str(d["sales_day"]) if d["sales_day"] else "")
-        ws.cell(row=row_num, column=11, value=d["inv_shop"])
-        ws.cell(row=row_num, column=12, value=f"{d['amount']:,.0f}")
-        ws.cell(row=row_num, column=13, value=f"{d['coupon_amount']:,.0f}")
-        ws.cell(row=row_num, column=14, value=d["note"])
-        ws.cell(row=row_num, column=15, value=d.get("cnv_id") or "")
-        ws.cell(row=row_num, column=16, value=float(d["cnv_points"]) if d.get("cnv_points") != "" else "")
-        ws.cell(row=row_num, column=17, value=float(d["cnv_total_points"]) if d.get("cnv_total_points") != "" else "")
-    for col in range(1, 18):
-        ws.column_dimensions[get_column_letter(col)].width = 18
+    ], header_fill, header_font, header_align)
+
+    for d in data["details"]:
+        ws.append([
+            d["coupon_id"],
+            d["creator"],
+            d["face_value_display"],
+            d["using_shop"],
+            str(d["using_date"]) if d["using_date"] else "",
+            d["docket_number"],
+            d["vip_id"],
+            d["customer_name"],
+            d["customer_phone"],
+            str(d["sales_day"]) if d["sales_day"] else "",
+            d["inv_shop"],
+            f"{d['amount']:,.0f}",
+            f"{d['coupon_amount']:,.0f}",
+            d["note"],
+            d.get("cnv_id") or "",
+            float(d["cnv_points"]) if d.get("cnv_points") != "" else "",
+            float(d["cnv_total_points"]) if d.get("cnv_total_points") != "" else "",
+        ])
+    _set_widths(ws, [18] * 17)
 
 
 def _build_coupon_dup_ws(wb, data, header_fill, header_font, header_align):
     ws = wb.create_sheet("Duplicate Invoices")
-    for col_num, header in enumerate([
+    _append_coupon_header(ws, [
         "Invoice No", "Sales Date", "Shop (Invoice)", "Invoice Amt",
         "Coupon ID", "Using Shop", "Using Date", "Face Value", "Coupon Amt",
-    ], 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill; cell.font = header_font; cell.alignment = header_align
-
-    for row_num, d in enumerate(data.get("duplicate_invoices", []), 2):
-        ws.cell(row=row_num, column=1, value=d["docket_number"])
-        ws.cell(row=row_num, column=2, value=str(d["sales_date"]) if d["sales_date"] else "")
-        ws.cell(row=row_num, column=3, value=d["shop_name"])
-        ws.cell(row=row_num, column=4, value=f"{d['inv_amount']:,.0f}")
-        ws.cell(row=row_num, column=5, value=d["coupon_id"])
-        ws.cell(row=row_num, column=6, value=d["using_shop"])
-        ws.cell(row=row_num, column=7, value=str(d["using_date"]) if d["using_date"] else "")
-        ws.cell(row=row_num, column=8, value=d["face_value_display"])
-        ws.cell(row=row_num, column=9, value=f"{d['coupon_amount']:,.0f}")
-    for col in range(1, 10):
-        ws.column_dimensions[get_column_letter(col)].width = 22
+    ], header_fill, header_font, header_align)
+
+    for d in data.get("duplicate_invoices", []):
+        ws.append([
+            d["docket_number"],
+            str(d["sales_date"]) if d["sales_date"] else "",
+            d["shop_name"],
+            f"{d['inv_amount']:,.0f}",
+            d["coupon_id"],
+            d["using_shop"],
+            str(d["using_date"]) if d["using_date"] else "",
+            d["face_value_display"],
+            f"{d['coupon_amount']:,.0f}",
+        ])
+    _set_widths(ws, [22] * 9)
 
 
 # Tab name → (sheet builder fn, display title)
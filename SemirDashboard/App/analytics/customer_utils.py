@@ -7,7 +7,9 @@ Handles all customer-related operations.
 Version: 3.3
 """
 import logging
+import sys
 from collections import defaultdict
+from operator import itemgetter
 
 logger = logging.getLogger('customer_analytics')
 
@@ -18,6 +20,16 @@ _customer_cache = {}
 GRADE_ORDER = {'No Grade': 0, 'Member': 1, 'Silver': 2, 'Gold': 3, 'Diamond': 4}
 
 
+def ordered_grades(grades):
+    """
+    Grades in GRADE_ORDER order, then any unknown grades as they come.
+
+    Same order as sorting by GRADE_ORDER.get(grade, 99), without calling a
+    key function per grade.
+    """
+    return [g for g in GRADE_ORDER if g in grades] + [g for g in grades if g not in GRADE_ORDER]
+
+
 def normalize_grade(raw):
     """
     Normalize grade names to standard values.
@@ -102,6 +114,36 @@ def get_customer_info(vip_id, customer_obj=None):
     return (grade, reg_date, name)
 
 
+def prime_customer_cache(vip_ids, batch_size=2000):
+    """
+    Bulk-load customers missing from the lookup cache.
+
+    Cached analytics data has its customer objects stripped, so without
+    this every get_customer_info() call on it would fall back to its own
+    Customer query. Duplicate VIP IDs keep the oldest row.
+
+    Args:
+        vip_ids: Iterable of VIP ID strings ('0' is ignored)
+        batch_size: Number of VIP IDs per IN query
+    """
+    global _customer_cache
+
+    missing = [v for v in vip_ids if v != '0' and v not in _customer_cache]
+    if not missing:
+        return
+
+    from App.models import Customer
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        found = {}
+        for cust in Customer.objects.only(
+            'id', 'vip_id', 'vip_grade', 'registration_date', 'name'
+        ).filter(vip_id__in=batch).order_by('id'):
+            found.setdefault(cust.vip_id, cust)
+        for v in batch:
+            _customer_cache[v] = found.get(v)
+
+
 def clear_customer_cache():
     """
     Clear the customer lookup cache.
@@ -143,7 +185,8 @@ def build_customer_purchase_map(sales_list):
             'date':       s.sales_date,
             'invoice':    s.invoice_number,
             'amount':     s.sales_amount or 0,
-            'shop':       s.shop_name or 'Unknown Shop',
+            # Interned: every aggregator keys dicts/sets on the shop name
+            'shop':       sys.intern(s.shop_name) if s.shop_name else 'Unknown Shop',
             'customer':   s.customer if key != '0' else None,
             'session':    get_session_key(s.sales_date),
             'month':      get_month_key(s.sales_date),
@@ -154,7 +197,7 @@ def build_customer_purchase_map(sales_list):
     
     # Sort each customer's purchases by date once — all aggregators rely on this
     for lst in customer_purchases.values():
-        lst.sort(key=lambda x: x['date'])
+        lst.sort(key=itemgetter('date'))
     return customer_purchases
 
 
@@ -12,16 +12,166 @@ Header Abbreviations:
 
 Version: 3.4 - Added shop details and comparison sheets
 Version: 3.5 - Standardized headers to use abbreviations consistently
+
+Workbooks are streamed in openpyxl write-only mode. openpyxl serialises
+through lxml when it is importable (it is listed in requirements.txt) and
+falls back to the much slower stdlib writer otherwise.
 """
+import io
+from itertools import chain, islice
+from operator import attrgetter, itemgetter
+from typing import NamedTuple
+
+from django.db.models import Count, FloatField, Q, Value
+from django.db.models.functions import Cast, Coalesce
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.utils import get_column_letter
 
+from App.analytics.customer_utils import ordered_grades
+
+
+# Shared style objects. Styles are immutable in openpyxl, so one instance is
+# reused for every cell instead of building a new Font/PatternFill per row.
+_HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+_HEADER_FONT = Font(bold=True, color="FFFFFF")
+_HEADER_ALIGN = Alignment(horizontal="center", vertical="center")
+_FILTER_FONT = Font(italic=True, color="888888", size=9)
+
+_TITLE_FONT = Font(bold=True, size=14)
+_BLOCK_TITLE_FONT = Font(bold=True, size=12)
+_BOLD_FONT = Font(bold=True)
+_HIGHLIGHT_FONT = Font(bold=True, color="0066CC")
+_ZALO_FONT = Font(bold=True, color="0068FF")
+
+_RED_BOLD_FONT = Font(bold=True, color="FF0000")
+_DIFF_UP_FONT = Font(bold=True, color="16A34A")
+_DIFF_DOWN_FONT = Font(bold=True, color="DC2626")
+_USED_POINTS_FONT = Font(bold=True, color="166534")
+
+# Reconciliation sheets (both the shop and the season variant)
+_RECON_TITLE_FONT = Font(bold=True, size=14, color="FF0000")
+_RECON_DIFF_FONT = Font(bold=True, size=12, color="FF0000")
+_RECON_TABLE_TITLE_FONT = Font(bold=True, size=11)
+_RECON_HEADER_ALIGN = Alignment(horizontal="center")
+
+_PATTERN_MULTI_SHOP_FILL = PatternFill(start_color="FFE0E0", end_color="FFE0E0", fill_type="solid")
+_PATTERN_OTHER_FILL = PatternFill(start_color="E0FFE0", end_color="E0FFE0", fill_type="solid")
+
+_MISMATCH_FILL = PatternFill(start_color="C65911", end_color="C65911", fill_type="solid")
+_USED_POINTS_FILL = PatternFill(start_color="166534", end_color="166534", fill_type="solid")
+_TOTAL_MISMATCH_FILL = PatternFill(start_color="7C3AED", end_color="7C3AED", fill_type="solid")
+_ZALO_APP_FILL = PatternFill(start_color="0068FF", end_color="0068FF", fill_type="solid")
+_ZALO_OA_FILL = PatternFill(start_color="00AAFF", end_color="00AAFF", fill_type="solid")
+_CNV_ALL_FILL = PatternFill(start_color="1D3557", end_color="1D3557", fill_type="solid")
+_CNV_TAB_FILL = PatternFill(start_color="2c3e50", end_color="2c3e50", fill_type="solid")
+
+# Column widths (column A onwards) for the POS vs CNV comparison sheets
+_OVERVIEW_WIDTHS = [35, 20]
+_POS_ONLY_WIDTHS = [12, 15, 25, 12, 30, 18, 10]
+_CNV_ONLY_WIDTHS = [15, 15, 25, 12, 30, 18, 12, 12]
+# Mismatch rows come from cnv.views._get_cnv_comparison_data, which always
+# sets every key, so one itemgetter call replaces twelve dict.get lookups.
+_MISMATCH_FIELDS = itemgetter(
+    'phone', 'pos_vip_id', 'pos_name', 'pos_grade', 'pos_points', 'pos_used_points',
+    'cnv_id', 'cnv_name', 'cnv_level', 'cnv_points', 'cnv_total_points', 'cnv_used_points',
+)
+_MISMATCH_WIDTHS = [15, 12, 25, 12, 10, 12, 12, 25, 12, 10, 14, 12, 10, 35]
+_USED_POINTS_WIDTHS = [15, 15, 25, 12, 30, 18, 12, 14, 14]
+_ZALO_WIDTHS = [15, 15, 25, 12, 30, 12, 10, 10, 10, 8]
+_CNV_ALL_WIDTHS = [15, 15, 25, 12, 30, 12, 10, 12, 12, 15, 15, 16]
+# Reconciliation tables differ only in the Pattern / Num Seasons column
+_RECON_SHOP_WIDTHS = [12, 25, 12, 12, 10, 10, 8, 22, 50]
+_RECON_SEASON_WIDTHS = [12, 25, 12, 12, 10, 10, 8, 12, 50]
+
+# Column letters A..BL; every sheet is narrower than this
+_COL_LETTERS = tuple(get_column_letter(col) for col in range(1, 65))
+
+
+def _float_or_zero(field):
+    """COALESCE(CAST(field AS float), 0): the DB returns a ready-to-write float."""
+    return Coalesce(Cast(field, FloatField()), Value(0.0))
+
+
+def _header_cells(ws, headers, fill, font, align):
+    """
+    Styled header row for ws.append(); works on normal and write-only sheets.
+
+    A write-only sheet serialises a row as soon as it is appended, so a
+    sheet that repeats its header per block can build it once and append
+    the same cells again.
+    """
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = fill
+        cell.font = font
+        if align is not None:
+            cell.alignment = align
+        cells.append(cell)
+    return cells
+
+
+def _set_widths(ws, widths):
+    """Apply a list of column widths, starting at column A."""
+    dims = ws.column_dimensions
+    for letter, width in zip(_COL_LETTERS, widths):
+        dims[letter].width = width
+
+
+def _data_sheet(wb, title, headers, widths, fill):
+    """
+    Create a table sheet with its widths and styled header row in place.
+
+    Widths go first because a write-only sheet writes its column info with
+    the first row; the caller then appends the data rows.
+    """
+    ws = wb.create_sheet(title)
+    _set_widths(ws, widths)
+    ws.append(_header_cells(ws, headers, fill, _HEADER_FONT, _HEADER_ALIGN))
+    return ws
+
+
+def _styled_cell(ws, value, font=None, fill=None, number_format=None):
+    """Single WriteOnlyCell carrying its own style, for ws.append() rows."""
+    cell = WriteOnlyCell(ws, value=value)
+    if font is not None:
+        cell.font = font
+    if fill is not None:
+        cell.fill = fill
+    if number_format is not None:
+        cell.number_format = number_format
+    return cell
+
+
+def _money_cell(ws, value):
+    """Amount cell with a thousands separator (#,##0)."""
+    return _styled_cell(ws, value, number_format='#,##0')
+
+
+def _percent_cell(ws, value):
+    """
+    Rate cell: the number as stored (e.g. 12.5) shown with a literal '%'.
+
+    Keeps rates numeric so they sort and aggregate in Excel; the rates are
+    already percentages, so the built-in 0% format (which multiplies by
+    100) is not used.
+    """
+    return _styled_cell(ws, value, number_format='0.00"%"')
+
+
+def _date_cell(ws, value, default='-'):
+    """Native Excel date cell (yyyy-mm-dd), or ``default`` when there is no date."""
+    if not value:
+        return default
+    return _styled_cell(ws, value, number_format='yyyy-mm-dd')
+
 
 def export_analytics_to_excel(data, date_from=None, date_to=None, shop_group=None):
     """
     Export analytics data to Excel workbook.
-    
+
     Creates 8 sheets:
     1. Overview (includes filter info)
     2. By VIP Grade
@@ -31,770 +181,475 @@ def export_analytics_to_excel(data, date_from=None, date_to=None, shop_group=Non
     6. By Grade - All Shops
     7. By Season - All Shops
     8. Customer Details
-    
+
+    The workbook is write-only: every sheet is streamed top to bottom with
+    ws.append(), so it can be saved exactly once.
+
     Args:
         data: Analytics data dict
         date_from: Start date filter (for display)
         date_to: End date filter (for display)
         shop_group: Shop group filter (for display)
     """
-    wb = Workbook()
-    
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    header_align = Alignment(horizontal="center", vertical="center")
-    
-    _create_overview_sheet(wb, data, header_fill, header_font, header_align, date_from, date_to, shop_group)
-    _create_grade_sheet(wb, data, header_fill, header_font, header_align)
-    _create_season_sheet(wb, data, header_fill, header_font, header_align)
-    _create_month_sheet(wb, data, header_fill, header_font, header_align)
-    _create_week_sheet(wb, data, header_fill, header_font, header_align)
-    _create_shop_sheet(wb, data, header_fill, header_font, header_align)
-    _create_shop_detail_sheet(wb, data, header_fill, header_font, header_align)
-    _create_grade_comparison_sheet(wb, data, header_fill, header_font, header_align)
-    _create_season_comparison_sheet(wb, data, header_fill, header_font, header_align)
-    _create_month_comparison_sheet(wb, data, header_fill, header_font, header_align)
-    _create_week_comparison_sheet(wb, data, header_fill, header_font, header_align)
-    _create_details_sheet(wb, data, header_fill, header_font, header_align)
-    _create_buyer_without_info_sheet(wb, data, header_fill, header_font, header_align)
-    _create_reconciliation_sheet(wb, data, header_fill, header_font, header_align)
+    wb = Workbook(write_only=True)
+
+    _create_overview_sheet(wb, data, date_from, date_to, shop_group)
+    _create_grade_sheet(wb, data)
+    _create_season_sheet(wb, data)
+    _create_month_sheet(wb, data)
+    _create_week_sheet(wb, data)
+    # The shop and all-shops sheets list shops by name; sort once for all of them
+    sorted_shops = _sorted_shops(data)
+    _create_shop_sheet(wb, data, sorted_shops=sorted_shops)
+    _create_shop_detail_sheet(wb, data, sorted_shops=sorted_shops)
+    _create_grade_comparison_sheet(wb, data, sorted_shops=sorted_shops)
+    _create_season_comparison_sheet(wb, data, sorted_shops=sorted_shops)
+    _create_month_comparison_sheet(wb, data, sorted_shops=sorted_shops)
+    _create_week_comparison_sheet(wb, data, sorted_shops=sorted_shops)
+    _create_details_sheet(wb, data)
+    _create_buyer_without_info_sheet(wb, data)
+    _create_reconciliation_sheet(wb, data)
 
     return wb
 
 
-def _create_overview_sheet(wb, data, header_fill, header_font, header_align, date_from=None, date_to=None, shop_group=None):
-    """Overview sheet with filter information."""
-    ws = wb.active
-    ws.title = "Overview"
-    
-    ws['A1'] = "Customer Analytics Overview"
-    ws['A1'].font = Font(bold=True, size=14)
-    
+# Legend rows at the bottom of the Overview sheet
+_ABBREVIATIONS = (
+    ("INV(RET)", "= Returning Invoices"),
+    ("AMT(RET)", "= Returning Amount"),
+    ("INV(CUS)", "= Customer Invoices"),
+    ("AMT(CUS)", "= Customer Amount"),
+)
+
+
+def _analytics_sheet(wb, title, widths, filter_line=None):
+    """
+    Create an analytics sheet with its column widths already applied.
+
+    Per-tab exports pass ``filter_line`` so it lands in row 1; write-only
+    sheets cannot insert rows once data has been appended.
+    """
+    ws = wb.create_sheet(title)
+    _set_widths(ws, widths)
+    if filter_line:
+        ws.append([_styled_cell(ws, filter_line, font=_FILTER_FONT)])
+    return ws
+
+
+def _sorted_shops(data):
+    """data['by_shop'] in shop-name order, as every per-shop sheet lists it."""
+    return sorted(data['by_shop'], key=itemgetter('shop_name'))
+
+
+def _stats_row(ws, label, s):
+    """Active/New/Returning row shared by the season, month, week and shop tables."""
+    return [
+        label,
+        s['total_customers'],
+        s.get('new_customers', 0),
+        _percent_cell(ws, s.get('new_rate', 0)),
+        s['returning_customers'],
+        _percent_cell(ws, s['return_rate']),
+        s.get('returning_invoices', 0),
+        _money_cell(ws, s.get('returning_amount', 0)),
+        s['total_invoices'],
+        _money_cell(ws, s['total_amount']),
+        s.get('total_invoices_with_vip0', 0),
+        _money_cell(ws, s.get('total_amount_with_vip0', 0)),
+    ]
+
+
+def _grade_row(ws, label, g):
+    """Grade row used by the per-shop and all-shops grade tables."""
+    return [
+        label,
+        g['total_customers'],
+        g['returning_customers'],
+        _percent_cell(ws, g['return_rate']),
+        g.get('returning_invoices', 0),
+        _money_cell(ws, g.get('returning_amount', 0)),
+        g['total_invoices'],
+        _money_cell(ws, g['total_amount']),
+    ]
+
+
+def _create_overview_sheet(wb, data, date_from=None, date_to=None, shop_group=None):
+    """Overview sheet with filter information; label/value rows, no header row."""
+    ws = _analytics_sheet(wb, "Overview", [35, 25])
+
+    ws.append([_styled_cell(ws, "Customer Analytics Overview", font=_TITLE_FONT)])
+
     # Show active filters
-    row = 2
     if date_from and date_to:
-        ws[f'A{row}'] = "Period Filter:"
-        ws[f'B{row}'] = f"{date_from} to {date_to}"
-        ws[f'B{row}'].font = Font(bold=True, color="0066CC")
-        row += 1
-    
+        ws.append(["Period Filter:", _styled_cell(ws, f"{date_from} to {date_to}", font=_HIGHLIGHT_FONT)])
+
     if shop_group:
-        ws[f'A{row}'] = "Shop Group Filter:"
-        ws[f'B{row}'] = shop_group
-        ws[f'B{row}'].font = Font(bold=True, color="0066CC")
-        row += 1
-    
-    row += 1  # Empty row
-    
+        ws.append(["Shop Group Filter:", _styled_cell(ws, shop_group, font=_HIGHLIGHT_FONT)])
+
+    ws.append([])  # Empty row
+
     ov = data['overview']
-    for label, value in [
-        ("New Members (Period)", ov['new_members_in_period']),
-        ("Returning (Period)", ov['returning_customers']),
-        ("Active (Period)", ov['active_customers']),
-        ("Return Rate (Period)", f"{ov['return_rate']}%"),
-        ("INV(RET)", ov.get('returning_invoices', 0)),
-        ("AMT(RET)", ov.get('returning_amount', 0)),
-        ("INV(CUS)", ov['total_invoices_without_vip0']),
-        ("AMT(CUS)", ov['total_amount_without_vip0']),
-        ("Total Invoices", ov['total_invoices_with_vip0']),
-        ("Total Amount", ov['total_amount_with_vip0']),
-        (None, None),  # separator
-        ("Total Customers (All Time)", ov['total_customers_in_db']),
-        ("Member Active (All Time)", ov['member_active_all_time']),
-        ("Member Inactive (All Time)", ov['member_inactive_all_time']),
-        ("Return Rate (All Time)", f"{ov['return_rate_all_time']}%"),
+    # (label, value, cell builder) — amounts and rates stay numeric, formatted by Excel
+    for label, value, as_cell in [
+        ("New Members (Period)", ov['new_members_in_period'], None),
+        ("Returning (Period)", ov['returning_customers'], None),
+        ("Active (Period)", ov['active_customers'], None),
+        ("Return Rate (Period)", ov['return_rate'], _percent_cell),
+        ("INV(RET)", ov.get('returning_invoices', 0), None),
+        ("AMT(RET)", ov.get('returning_amount', 0), _money_cell),
+        ("INV(CUS)", ov['total_invoices_without_vip0'], None),
+        ("AMT(CUS)", ov['total_amount_without_vip0'], _money_cell),
+        ("Total Invoices", ov['total_invoices_with_vip0'], None),
+        ("Total Amount", ov['total_amount_with_vip0'], _money_cell),
+        (None, None, None),  # separator
+        ("Total Customers (All Time)", ov['total_customers_in_db'], None),
+        ("Member Active (All Time)", ov['member_active_all_time'], None),
+        ("Member Inactive (All Time)", ov['member_inactive_all_time'], None),
+        ("Return Rate (All Time)", ov['return_rate_all_time'], _percent_cell),
     ]:
         if label is None:
-            row += 1
+            ws.append([])
             continue
-        ws[f'A{row}'] = label
-        # Format amounts with number format instead of string
-        if 'AMT' in label or 'Amount' in label:
-            ws[f'B{row}'] = value
-            ws[f'B{row}'].number_format = '#,##0'
-        else:
-            ws[f'B{row}'] = value
-        row += 1
-    
+        ws.append([label, as_cell(ws, value) if as_cell else value])
+
     # Add abbreviations explanation
-    row += 1
-    ws[f'A{row}'] = "Column Abbreviations:"
-    ws[f'A{row}'].font = Font(bold=True, color="0066CC")
-    row += 1
-    
-    abbrev_info = [
-        ("INV(RET)", "= Returning Invoices"),
-        ("AMT(RET)", "= Returning Amount"),
-        ("INV(CUS)", "= Customer Invoices"),
-        ("AMT(CUS)", "= Customer Amount"),
-    ]
-    
-    for abbrev, meaning in abbrev_info:
-        ws[f'A{row}'] = abbrev
-        ws[f'A{row}'].font = Font(bold=True)
-        ws[f'B{row}'] = meaning
-        row += 1
-    
-    ws.column_dimensions['A'].width = 35
-    ws.column_dimensions['B'].width = 25
+    ws.append([])
+    ws.append([_styled_cell(ws, "Column Abbreviations:", font=_HIGHLIGHT_FONT)])
+
+    for abbrev, meaning in _ABBREVIATIONS:
+        ws.append([_styled_cell(ws, abbrev, font=_BOLD_FONT), meaning])
 
 
-def _create_grade_sheet(wb, data, header_fill, header_font, header_align):
+def _create_grade_sheet(wb, data, filter_line=None):
     """By VIP Grade sheet."""
-    ws = wb.create_sheet("By VIP Grade")
+    # Grade | numeric columns | amount columns
+    ws = _analytics_sheet(wb, "By VIP Grade", [12] + [14] * 5 + [16] * 4, filter_line)
 
     headers = ["Grade", "Active", "Returning", "Return Rate", "Total in DB", "Return Rate (AT)", "INV(RET)", "AMT(RET)", "Total Invoices", "Total Amount"]
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-
-    for row_num, g in enumerate(data['by_grade'], 2):
-        ws.cell(row=row_num, column=1, value=g['grade'])
-        ws.cell(row=row_num, column=2, value=g['total_customers'])
-        ws.cell(row=row_num, column=3, value=g['returning_customers'])
-        ws.cell(row=row_num, column=4, value=f"{g['return_rate']}%")
-        ws.cell(row=row_num, column=5, value=g.get('total_in_db', 0))
-        ws.cell(row=row_num, column=6, value=f"{g.get('return_rate_all_time', 0)}%")
-        ws.cell(row=row_num, column=7, value=g.get('returning_invoices', 0))
-        ws.cell(row=row_num, column=8, value=g.get('returning_amount', 0))
-        ws.cell(row=row_num, column=8).number_format = '#,##0'
-        ws.cell(row=row_num, column=9, value=g['total_invoices'])
-        ws.cell(row=row_num, column=10, value=g['total_amount'])
-        ws.cell(row=row_num, column=10).number_format = '#,##0'
-
-    ws.column_dimensions['A'].width = 12  # Grade
-    for col in range(2, 7):
-        ws.column_dimensions[get_column_letter(col)].width = 14  # Numeric
-    for col in range(7, 11):
-        ws.column_dimensions[get_column_letter(col)].width = 16  # Amount
-
-
-def _create_season_sheet(wb, data, header_fill, header_font, header_align):
+    ws.append(_header_cells(ws, headers, _HEADER_FILL, _HEADER_FONT, _HEADER_ALIGN))
+
+    for g in data['by_grade']:
+        ws.append([
+            g['grade'],
+            g['total_customers'],
+            g['returning_customers'],
+            _percent_cell(ws, g['return_rate']),
+            g.get('total_in_db', 0),
+            _percent_cell(ws, g.get('return_rate_all_time', 0)),
+            g.get('returning_invoices', 0),
+            _money_cell(ws, g.get('returning_amount', 0)),
+            g['total_invoices'],
+            _money_cell(ws, g['total_amount']),
+        ])
+
+
+def _create_season_sheet(wb, data, filter_line=None):
     """By Season sheet."""
-    ws = wb.create_sheet("By Season")
+    ws = _analytics_sheet(wb, "By Season", [15] + [14] * 5 + [16] * 6, filter_line)
 
     headers = ["Season", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-
-    for row_num, s in enumerate(data['by_session'], 2):
-        ws.cell(row=row_num, column=1, value=s['session'])
-        ws.cell(row=row_num, column=2, value=s['total_customers'])
-        ws.cell(row=row_num, column=3, value=s.get('new_customers', 0))
-        ws.cell(row=row_num, column=4, value=f"{s.get('new_rate', 0)}%")
-        ws.cell(row=row_num, column=5, value=s['returning_customers'])
-        ws.cell(row=row_num, column=6, value=f"{s['return_rate']}%")
-        ws.cell(row=row_num, column=7, value=s.get('returning_invoices', 0))
-        ws.cell(row=row_num, column=8, value=s.get('returning_amount', 0))
-        ws.cell(row=row_num, column=8).number_format = '#,##0'
-        ws.cell(row=row_num, column=9, value=s['total_invoices'])
-        ws.cell(row=row_num, column=10, value=s['total_amount'])
-        ws.cell(row=row_num, column=10).number_format = '#,##0'
-        ws.cell(row=row_num, column=11, value=s.get('total_invoices_with_vip0', 0))
-        ws.cell(row=row_num, column=12, value=s.get('total_amount_with_vip0', 0))
-        ws.cell(row=row_num, column=12).number_format = '#,##0'
-
-    ws.column_dimensions['A'].width = 15  # Season
-    for col in range(2, 7):
-        ws.column_dimensions[get_column_letter(col)].width = 14  # Numeric
-    for col in range(7, 13):
-        ws.column_dimensions[get_column_letter(col)].width = 16  # Amount
-
-
-def _create_month_sheet(wb, data, header_fill, header_font, header_align):
+    ws.append(_header_cells(ws, headers, _HEADER_FILL, _HEADER_FONT, _HEADER_ALIGN))
+
+    for s in data['by_session']:
+        ws.append(_stats_row(ws, s['session'], s))
+
+
+def _create_month_sheet(wb, data, filter_line=None):
     """By Month sheet."""
-    ws = wb.create_sheet("By Month")
+    # Month YYYY-MM
+    ws = _analytics_sheet(wb, "By Month", [12] + [14] * 5 + [16] * 6, filter_line)
 
     headers = ["Month", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-
-    for row_num, m in enumerate(data.get('by_month', []), 2):
-        ws.cell(row=row_num, column=1, value=m['month'])
-        ws.cell(row=row_num, column=2, value=m['total_customers'])
-        ws.cell(row=row_num, column=3, value=m.get('new_customers', 0))
-        ws.cell(row=row_num, column=4, value=f"{m.get('new_rate', 0)}%")
-        ws.cell(row=row_num, column=5, value=m['returning_customers'])
-        ws.cell(row=row_num, column=6, value=f"{m['return_rate']}%")
-        ws.cell(row=row_num, column=7, value=m.get('returning_invoices', 0))
-        ws.cell(row=row_num, column=8, value=m.get('returning_amount', 0))
-        ws.cell(row=row_num, column=8).number_format = '#,##0'
-        ws.cell(row=row_num, column=9, value=m['total_invoices'])
-        ws.cell(row=row_num, column=10, value=m['total_amount'])
-        ws.cell(row=row_num, column=10).number_format = '#,##0'
-        ws.cell(row=row_num, column=11, value=m.get('total_invoices_with_vip0', 0))
-        ws.cell(row=row_num, column=12, value=m.get('total_amount_with_vip0', 0))
-        ws.cell(row=row_num, column=12).number_format = '#,##0'
-
-    ws.column_dimensions['A'].width = 12  # Month YYYY-MM
-    for col in range(2, 7):
-        ws.column_dimensions[get_column_letter(col)].width = 14
-    for col in range(7, 13):
-        ws.column_dimensions[get_column_letter(col)].width = 16
-
-
-def _create_shop_sheet(wb, data, header_fill, header_font, header_align):
+    ws.append(_header_cells(ws, headers, _HEADER_FILL, _HEADER_FONT, _HEADER_ALIGN))
+
+    for m in data.get('by_month', []):
+        ws.append(_stats_row(ws, m['month'], m))
+
+
+def _create_shop_sheet(wb, data, filter_line=None, sorted_shops=None):
     """By Shop summary."""
-    ws = wb.create_sheet("By Shop")
+    ws = _analytics_sheet(wb, "By Shop", [30] + [14] * 5 + [16] * 6, filter_line)
 
     headers = ["Shop", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-
-    sorted_shops = sorted(data['by_shop'], key=lambda x: x['shop_name'])
-
-    for row_num, shop in enumerate(sorted_shops, 2):
-        ws.cell(row=row_num, column=1, value=shop['shop_name'])
-        ws.cell(row=row_num, column=2, value=shop['total_customers'])
-        ws.cell(row=row_num, column=3, value=shop.get('new_customers', 0))
-        ws.cell(row=row_num, column=4, value=f"{shop.get('new_rate', 0)}%")
-        ws.cell(row=row_num, column=5, value=shop['returning_customers'])
-        ws.cell(row=row_num, column=6, value=f"{shop['return_rate']}%")
-        ws.cell(row=row_num, column=7, value=shop.get('returning_invoices', 0))
-        ws.cell(row=row_num, column=8, value=shop.get('returning_amount', 0))
-        ws.cell(row=row_num, column=8).number_format = '#,##0'
-        ws.cell(row=row_num, column=9, value=shop['total_invoices'])
-        ws.cell(row=row_num, column=10, value=shop['total_amount'])
-        ws.cell(row=row_num, column=10).number_format = '#,##0'
-        ws.cell(row=row_num, column=11, value=shop.get('total_invoices_with_vip0', 0))
-        ws.cell(row=row_num, column=12, value=shop.get('total_amount_with_vip0', 0))
-        ws.cell(row=row_num, column=12).number_format = '#,##0'
-
-    ws.column_dimensions['A'].width = 30  # Shop name
-    for col in range(2, 7):
-        ws.column_dimensions[get_column_letter(col)].width = 14  # Numeric
-    for col in range(7, 13):
-        ws.column_dimensions[get_column_letter(col)].width = 16  # Amount
-
-
-def _create_shop_detail_sheet(wb, data, header_fill, header_font, header_align):
+    ws.append(_header_cells(ws, headers, _HEADER_FILL, _HEADER_FONT, _HEADER_ALIGN))
+
+    if sorted_shops is None:
+        sorted_shops = _sorted_shops(data)
+
+    for shop in sorted_shops:
+        ws.append(_stats_row(ws, shop['shop_name'], shop))
+
+
+def _create_shop_detail_sheet(wb, data, filter_line=None, sorted_shops=None):
     """By Shop - Detail with grade and season breakdowns."""
-    ws = wb.create_sheet("By Shop - Detail")
-    
-    current_row = 1
-    sorted_shops = sorted(data['by_shop'], key=lambda x: x['shop_name'])
-    
+    # Week label is the longest first-column value
+    ws = _analytics_sheet(wb, "By Shop - Detail", [22] + [14] * 5 + [16] * 6, filter_line)
+
+    grade_headers = ["Grade", "Active", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)"]
+    period_columns = ["Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
+    # Header rows repeat for every shop; style them once per sheet
+    grade_header = _header_cells(ws, grade_headers, _HEADER_FILL, _HEADER_FONT, None)
+    sections = (
+        ("By Season", _header_cells(ws, ["Season"] + period_columns, _HEADER_FILL, _HEADER_FONT, None), 'by_session', 'session'),
+        ("By Month", _header_cells(ws, ["Month"] + period_columns, _HEADER_FILL, _HEADER_FONT, None), 'by_month', 'month'),
+        ("By Week", _header_cells(ws, ["Week"] + period_columns, _HEADER_FILL, _HEADER_FONT, None), 'by_week', 'week_label'),
+    )
+
+    # Row the next append lands on, needed for the merged shop titles
+    row = 2 if filter_line else 1
+    if sorted_shops is None:
+        sorted_shops = _sorted_shops(data)
+
     for shop in sorted_shops:
-        ws.cell(row=current_row, column=1, value=f"SHOP: {shop['shop_name']}")
-        ws.cell(row=current_row, column=1).font = Font(bold=True, size=12)
-        ws.merge_cells(f'A{current_row}:L{current_row}')
-        current_row += 1
+        ws.append([_styled_cell(ws, f"SHOP: {shop['shop_name']}", font=_BLOCK_TITLE_FONT)])
+        ws.merged_cells.add(f'A{row}:L{row}')
 
         # By Grade
-        ws.cell(row=current_row, column=1, value="By VIP Grade").font = Font(bold=True)
-        current_row += 1
-
-        grade_headers = ["Grade", "Active", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)"]
-        for col_num, header in enumerate(grade_headers, 1):
-            cell = ws.cell(row=current_row, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-        current_row += 1
-
-        for g in shop.get('by_grade', []):
-            ws.cell(row=current_row, column=1, value=g['grade'])
-            ws.cell(row=current_row, column=2, value=g['total_customers'])
-            ws.cell(row=current_row, column=3, value=g['returning_customers'])
-            ws.cell(row=current_row, column=4, value=f"{g['return_rate']}%")
-            ws.cell(row=current_row, column=5, value=g.get('returning_invoices', 0))
-            ws.cell(row=current_row, column=6, value=g.get('returning_amount', 0))
-            ws.cell(row=current_row, column=6).number_format = '#,##0'
-            ws.cell(row=current_row, column=7, value=g['total_invoices'])
-            ws.cell(row=current_row, column=8, value=g['total_amount'])
-            ws.cell(row=current_row, column=8).number_format = '#,##0'
-            current_row += 1
-
-        current_row += 1
-
-        # By Season
-        ws.cell(row=current_row, column=1, value="By Season").font = Font(bold=True)
-        current_row += 1
-
-        season_headers = ["Season", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-        for col_num, header in enumerate(season_headers, 1):
-            cell = ws.cell(row=current_row, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-        current_row += 1
-
-        for s in shop.get('by_session', []):
-            if not s.get('total_invoices_with_vip0', 0):
-                continue
-            ws.cell(row=current_row, column=1, value=s['session'])
-            ws.cell(row=current_row, column=2, value=s['total_customers'])
-            ws.cell(row=current_row, column=3, value=s.get('new_customers', 0))
-            ws.cell(row=current_row, column=4, value=f"{s.get('new_rate', 0)}%")
-            ws.cell(row=current_row, column=5, value=s['returning_customers'])
-            ws.cell(row=current_row, column=6, value=f"{s['return_rate']}%")
-            ws.cell(row=current_row, column=7, value=s.get('returning_invoices', 0))
-            ws.cell(row=current_row, column=8, value=s.get('returning_amount', 0))
-            ws.cell(row=current_row, column=8).number_format = '#,##0'
-            ws.cell(row=current_row, column=9, value=s['total_invoices'])
-            ws.cell(row=current_row, column=10, value=s['total_amount'])
-            ws.cell(row=current_row, column=10).number_format = '#,##0'
-            ws.cell(row=current_row, column=11, value=s.get('total_invoices_with_vip0', 0))
-            ws.cell(row=current_row, column=12, value=s.get('total_amount_with_vip0', 0))
-            ws.cell(row=current_row, column=12).number_format = '#,##0'
-            current_row += 1
-
-        current_row += 1
-
-        # By Month
-        ws.cell(row=current_row, column=1, value="By Month").font = Font(bold=True)
-        current_row += 1
-
-        month_headers = ["Month", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-        for col_num, header in enumerate(month_headers, 1):
-            cell = ws.cell(row=current_row, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-        current_row += 1
-
-        for m in shop.get('by_month', []):
-            if not m.get('total_invoices_with_vip0', 0):
-                continue
-            ws.cell(row=current_row, column=1, value=m['month'])
-            ws.cell(row=current_row, column=2, value=m['total_customers'])
-            ws.cell(row=current_row, column=3, value=m.get('new_customers', 0))
-            ws.cell(row=current_row, column=4, value=f"{m.get('new_rate', 0)}%")
-            ws.cell(row=current_row, column=5, value=m['returning_customers'])
-            ws.cell(row=current_row, column=6, value=f"{m['return_rate']}%")
-            ws.cell(row=current_row, column=7, value=m.get('returning_invoices', 0))
-            ws.cell(row=current_row, column=8, value=m.get('returning_amount', 0))
-            ws.cell(row=current_row, column=8).number_format = '#,##0'
-            ws.cell(row=current_row, column=9, value=m['total_invoices'])
-            ws.cell(row=current_row, column=10, value=m['total_amount'])
-            ws.cell(row=current_row, column=10).number_format = '#,##0'
-            ws.cell(row=current_row, column=11, value=m.get('total_invoices_with_vip0', 0))
-            ws.cell(row=current_row, column=12, value=m.get('total_amount_with_vip0', 0))
-            ws.cell(row=current_row, column=12).number_format = '#,##0'
-            current_row += 1
-
-        current_row += 1
-
-        # By Week
-        ws.cell(row=current_row, column=1, value="By Week").font = Font(bold=True)
-        current_row += 1
-
-        week_headers = ["Week", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-        for col_num, header in enumerate(week_headers, 1):
-            cell = ws.cell(row=current_row, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-        current_row += 1
-
-        for w in shop.get('by_week', []):
-            if not w.get('total_invoices_with_vip0', 0):
-                continue
-            ws.cell(row=current_row, column=1, value=w['week_label'])
-            ws.cell(row=current_row, column=2, value=w['total_customers'])
-            ws.cell(row=current_row, column=3, value=w.get('new_customers', 0))
-            ws.cell(row=current_row, column=4, value=f"{w.get('new_rate', 0)}%")
-            ws.cell(row=current_row, column=5, value=w['returning_customers'])
-            ws.cell(row=current_row, column=6, value=f"{w['return_rate']}%")
-            ws.cell(row=current_row, column=7, value=w.get('returning_invoices', 0))
-            ws.cell(row=current_row, column=8, value=w.get('returning_amount', 0))
-            ws.cell(row=current_row, column=8).number_format = '#,##0'
-            ws.cell(row=current_row, column=9, value=w['total_invoices'])
-            ws.cell(row=current_row, column=10, value=w['total_amount'])
-            ws.cell(row=current_row, column=10).number_format = '#,##0'
-            ws.cell(row=current_row, column=11, value=w.get('total_invoices_with_vip0', 0))
-            ws.cell(row=current_row, column=12, value=w.get('total_amount_with_vip0', 0))
-            ws.cell(row=current_row, column=12).number_format = '#,##0'
-            current_row += 1
-
-        current_row += 2
-
-    # Column widths
-    ws.column_dimensions['A'].width = 22  # Week label is longer
-    for col in range(2, 7):
-        ws.column_dimensions[get_column_letter(col)].width = 14  # Numeric
-    for col in range(7, 13):
-        ws.column_dimensions[get_column_letter(col)].width = 16  # Amount
-
-
-def _create_grade_comparison_sheet(wb, data, header_fill, header_font, header_align):
-    """By Grade - All Shops comparison."""
-    ws = wb.create_sheet("By Grade - All Shops")
+        ws.append([_styled_cell(ws, "By VIP Grade", font=_BOLD_FONT)])
+        ws.append(grade_header)
+        grades = shop.get('by_grade', [])
+        for g in grades:
+            ws.append(_grade_row(ws, g['grade'], g))
+        ws.append([])
+        row += 4 + len(grades)
+
+        # By Season / Month / Week — periods without invoices are skipped
+        for title, header, key, label_key in sections:
+            ws.append([_styled_cell(ws, title, font=_BOLD_FONT)])
+            ws.append(header)
+            written = 0
+            for s in shop.get(key, []):
+                if not s.get('total_invoices_with_vip0', 0):
+                    continue
+                ws.append(_stats_row(ws, s[label_key], s))
+                written += 1
+            ws.append([])
+            row += 3 + written
+
+        ws.append([])
+        row += 1
 
-    all_grades = set()
-    for shop in data['by_shop']:
-        for g in shop.get('by_grade', []):
-            all_grades.add(g['grade'])
 
-    GRADE_ORDER = {'No Grade': 0, 'Member': 1, 'Silver': 2, 'Gold': 3, 'Diamond': 4}
-    sorted_grades = sorted(all_grades, key=lambda x: GRADE_ORDER.get(x, 99))
-    sorted_shops = sorted(data['by_shop'], key=lambda x: x['shop_name'])
+def _create_grade_comparison_sheet(wb, data, filter_line=None, sorted_shops=None):
+    """By Grade - All Shops comparison."""
+    ws = _analytics_sheet(wb, "By Grade - All Shops", [30] + [16] * 7, filter_line)
+
+    if sorted_shops is None:
+        sorted_shops = _sorted_shops(data)
 
     # Pre-build lookup: {shop_name: {grade: g_data}} — O(1) per lookup vs O(n) next()
     shop_grade_map = {
         shop['shop_name']: {g['grade']: g for g in shop.get('by_grade', [])}
         for shop in sorted_shops
     }
+    # Every grade seen in any shop, read off the lookup instead of a second scan
+    all_grades = {grade for grades in shop_grade_map.values() for grade in grades}
+    sorted_grades = ordered_grades(all_grades)
 
-    current_row = 1
+    headers = ["Shop", "Active", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)"]
+    header = _header_cells(ws, headers, _HEADER_FILL, _HEADER_FONT, None)  # reused for every grade
+    row = 2 if filter_line else 1
 
     for grade in sorted_grades:
-        ws.cell(row=current_row, column=1, value=f"GRADE: {grade}")
-        ws.cell(row=current_row, column=1).font = Font(bold=True, size=12)
-        ws.merge_cells(f'A{current_row}:H{current_row}')
-        current_row += 1
-
-        headers = ["Shop", "Active", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)"]
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=current_row, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-        current_row += 1
+        ws.append([_styled_cell(ws, f"GRADE: {grade}", font=_BLOCK_TITLE_FONT)])
+        ws.merged_cells.add(f'A{row}:H{row}')
+        ws.append(header)
+        row += 2
 
         for shop in sorted_shops:
             g = shop_grade_map[shop['shop_name']].get(grade)
             if g and g.get('total_invoices', 0) > 0:
-                ws.cell(row=current_row, column=1, value=shop['shop_name'])
-                ws.cell(row=current_row, column=2, value=g['total_customers'])
-                ws.cell(row=current_row, column=3, value=g['returning_customers'])
-                ws.cell(row=current_row, column=4, value=f"{g['return_rate']}%")
-                ws.cell(row=current_row, column=5, value=g.get('returning_invoices', 0))
-                ws.cell(row=current_row, column=6, value=g.get('returning_amount', 0))
-                ws.cell(row=current_row, column=6).number_format = '#,##0'
-                ws.cell(row=current_row, column=7, value=g['total_invoices'])
-                ws.cell(row=current_row, column=8, value=g['total_amount'])
-                ws.cell(row=current_row, column=8).number_format = '#,##0'
-                current_row += 1
-
-        current_row += 1
-
-    ws.column_dimensions['A'].width = 30
-    for col in range(2, 9):
-        ws.column_dimensions[get_column_letter(col)].width = 16
-
-
-def _create_season_comparison_sheet(wb, data, header_fill, header_font, header_align):
-    """By Season - All Shops comparison."""
-    ws = wb.create_sheet("By Season - All Shops")
+                ws.append(_grade_row(ws, shop['shop_name'], g))
+                row += 1
+
+        ws.append([])
+        row += 1
 
-    all_seasons = [s['session'] for s in data['by_session']]
-    sorted_shops = sorted(data['by_shop'], key=lambda x: x['shop_name'])
 
-    # Pre-build lookup: {shop_name: {season: s_data}}
-    shop_session_map = {
-        shop['shop_name']: {s['session']: s for s in shop.get('by_session', [])}
+def _create_period_comparison_sheet(wb, title, prefix, periods, key, label_key, widths,
+                                    data, filter_line=None, sorted_shops=None):
+    """One block per period (season/month/week), one row per shop with invoices."""
+    ws = _analytics_sheet(wb, title, widths, filter_line)
+
+    if sorted_shops is None:
+        sorted_shops = _sorted_shops(data)
+    if not sorted_shops:
+        # No shop can fill a block; skip the empty title/header per period
+        return
+
+    # Pre-build lookup: {shop_name: {period: stats}}
+    shop_period_map = {
+        shop['shop_name']: {p[label_key]: p for p in shop.get(key, [])}
         for shop in sorted_shops
     }
 
-    current_row = 1
-
-    for season in all_seasons:
-        ws.cell(row=current_row, column=1, value=f"SEASON: {season}")
-        ws.cell(row=current_row, column=1).font = Font(bold=True, size=12)
-        ws.merge_cells(f'A{current_row}:L{current_row}')
-        current_row += 1
+    headers = ["Shop", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
+    header = _header_cells(ws, headers, _HEADER_FILL, _HEADER_FONT, None)  # reused for every period
+    row = 2 if filter_line else 1
 
-        headers = ["Shop", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=current_row, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-        current_row += 1
+    for period in periods:
+        ws.append([_styled_cell(ws, f"{prefix}: {period}", font=_BLOCK_TITLE_FONT)])
+        ws.merged_cells.add(f'A{row}:L{row}')
+        ws.append(header)
+        row += 2
 
         for shop in sorted_shops:
-            s = shop_session_map[shop['shop_name']].get(season)
+            s = shop_period_map[shop['shop_name']].get(period)
             if s and s.get('total_invoices_with_vip0', 0) > 0:
-                ws.cell(row=current_row, column=1, value=shop['shop_name'])
-                ws.cell(row=current_row, column=2, value=s['total_customers'])
-                ws.cell(row=current_row, column=3, value=s.get('new_customers', 0))
-                ws.cell(row=current_row, column=4, value=f"{s.get('new_rate', 0)}%")
-                ws.cell(row=current_row, column=5, value=s['returning_customers'])
-                ws.cell(row=current_row, column=6, value=f"{s['return_rate']}%")
-                ws.cell(row=current_row, column=7, value=s.get('returning_invoices', 0))
-                ws.cell(row=current_row, column=8, value=s.get('returning_amount', 0))
-                ws.cell(row=current_row, column=8).number_format = '#,##0'
-                ws.cell(row=current_row, column=9, value=s['total_invoices'])
-                ws.cell(row=current_row, column=10, value=s['total_amount'])
-                ws.cell(row=current_row, column=10).number_format = '#,##0'
-                ws.cell(row=current_row, column=11, value=s.get('total_invoices_with_vip0', 0))
-                ws.cell(row=current_row, column=12, value=s.get('total_amount_with_vip0', 0))
-                ws.cell(row=current_row, column=12).number_format = '#,##0'
-                current_row += 1
-
-        current_row += 1
-
-    ws.column_dimensions['A'].width = 30
-    for col in range(2, 13):
-        ws.column_dimensions[get_column_letter(col)].width = 16
-
-
-def _create_month_comparison_sheet(wb, data, header_fill, header_font, header_align):
-    """By Month - All Shops comparison."""
-    ws = wb.create_sheet("By Month - All Shops")
+                ws.append(_stats_row(ws, shop['shop_name'], s))
+                row += 1
 
-    all_months = [m['month'] for m in data.get('by_month', [])]
-    sorted_shops = sorted(data['by_shop'], key=lambda x: x['shop_name'])
+        ws.append([])
+        row += 1
 
-    # Pre-build lookup: {shop_name: {month: m_data}}
-    shop_month_map = {
-        shop['shop_name']: {m['month']: m for m in shop.get('by_month', [])}
-        for shop in sorted_shops
-    }
 
-    current_row = 1
+def _create_season_comparison_sheet(wb, data, filter_line=None, sorted_shops=None):
+    """By Season - All Shops comparison."""
+    _create_period_comparison_sheet(
+        wb, "By Season - All Shops", "SEASON",
+        [s['session'] for s in data['by_session']], 'by_session', 'session',
+        [30] + [16] * 11, data, filter_line, sorted_shops,
+    )
 
-    for month in all_months:
-        ws.cell(row=current_row, column=1, value=f"MONTH: {month}").font = Font(bold=True, size=12)
-        ws.merge_cells(f'A{current_row}:L{current_row}')
-        current_row += 1
 
-        headers = ["Shop", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=current_row, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-        current_row += 1
+def _create_month_comparison_sheet(wb, data, filter_line=None, sorted_shops=None):
+    """By Month - All Shops comparison."""
+    _create_period_comparison_sheet(
+        wb, "By Month - All Shops", "MONTH",
+        [m['month'] for m in data.get('by_month', [])], 'by_month', 'month',
+        [30] + [14] * 5 + [16] * 6, data, filter_line, sorted_shops,
+    )
 
-        for shop in sorted_shops:
-            m = shop_month_map[shop['shop_name']].get(month)
-            if m and m.get('total_invoices_with_vip0', 0) > 0:
-                ws.cell(row=current_row, column=1, value=shop['shop_name'])
-                ws.cell(row=current_row, column=2, value=m['total_customers'])
-                ws.cell(row=current_row, column=3, value=m.get('new_customers', 0))
-                ws.cell(row=current_row, column=4, value=f"{m.get('new_rate', 0)}%")
-                ws.cell(row=current_row, column=5, value=m['returning_customers'])
-                ws.cell(row=current_row, column=6, value=f"{m['return_rate']}%")
-                ws.cell(row=current_row, column=7, value=m.get('returning_invoices', 0))
-                ws.cell(row=current_row, column=8, value=m.get('returning_amount', 0))
-                ws.cell(row=current_row, column=8).number_format = '#,##0'
-                ws.cell(row=current_row, column=9, value=m['total_invoices'])
-                ws.cell(row=current_row, column=10, value=m['total_amount'])
-                ws.cell(row=current_row, column=10).number_format = '#,##0'
-                ws.cell(row=current_row, column=11, value=m.get('total_invoices_with_vip0', 0))
-                ws.cell(row=current_row, column=12, value=m.get('total_amount_with_vip0', 0))
-                ws.cell(row=current_row, column=12).number_format = '#,##0'
-                current_row += 1
-
-        current_row += 1
-
-    ws.column_dimensions['A'].width = 30
-    for col in range(2, 7):
-        ws.column_dimensions[get_column_letter(col)].width = 14
-    for col in range(7, 13):
-        ws.column_dimensions[get_column_letter(col)].width = 16
-
-
-def _create_week_sheet(wb, data, header_fill, header_font, header_align):
+
+def _create_week_sheet(wb, data, filter_line=None):
     """By Week sheet."""
-    ws = wb.create_sheet("By Week")
+    # Week label e.g. "Week 1 (1/1-7/1)"
+    ws = _analytics_sheet(wb, "By Week", [22] + [14] * 5 + [16] * 6, filter_line)
 
     headers = ["Week", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-
-    for row_num, w in enumerate(data.get('by_week', []), 2):
-        ws.cell(row=row_num, column=1, value=w['week_label'])
-        ws.cell(row=row_num, column=2, value=w['total_customers'])
-        ws.cell(row=row_num, column=3, value=w.get('new_customers', 0))
-        ws.cell(row=row_num, column=4, value=f"{w.get('new_rate', 0)}%")
-        ws.cell(row=row_num, column=5, value=w['returning_customers'])
-        ws.cell(row=row_num, column=6, value=f"{w['return_rate']}%")
-        ws.cell(row=row_num, column=7, value=w.get('returning_invoices', 0))
-        ws.cell(row=row_num, column=8, value=w.get('returning_amount', 0))
-        ws.cell(row=row_num, column=8).number_format = '#,##0'
-        ws.cell(row=row_num, column=9, value=w['total_invoices'])
-        ws.cell(row=row_num, column=10, value=w['total_amount'])
-        ws.cell(row=row_num, column=10).number_format = '#,##0'
-        ws.cell(row=row_num, column=11, value=w.get('total_invoices_with_vip0', 0))
-        ws.cell(row=row_num, column=12, value=w.get('total_amount_with_vip0', 0))
-        ws.cell(row=row_num, column=12).number_format = '#,##0'
-
-    ws.column_dimensions['A'].width = 22  # Week label e.g. "Week 1 (1/1-7/1)"
-    for col in range(2, 7):
-        ws.column_dimensions[get_column_letter(col)].width = 14
-    for col in range(7, 13):
-        ws.column_dimensions[get_column_letter(col)].width = 16
-
-
-def _create_week_comparison_sheet(wb, data, header_fill, header_font, header_align):
-    """By Week - All Shops comparison."""
-    ws = wb.create_sheet("By Week - All Shops")
-
-    all_weeks = [w['week_label'] for w in data.get('by_week', [])]
-    sorted_shops = sorted(data['by_shop'], key=lambda x: x['shop_name'])
+    ws.append(_header_cells(ws, headers, _HEADER_FILL, _HEADER_FONT, _HEADER_ALIGN))
 
-    # Pre-build lookup: {shop_name: {week_label: w_data}}
-    shop_week_map = {
-        shop['shop_name']: {w['week_label']: w for w in shop.get('by_week', [])}
-        for shop in sorted_shops
-    }
+    for w in data.get('by_week', []):
+        ws.append(_stats_row(ws, w['week_label'], w))
 
-    current_row = 1
 
-    for week_label in all_weeks:
-        ws.cell(row=current_row, column=1, value=f"WEEK: {week_label}").font = Font(bold=True, size=12)
-        ws.merge_cells(f'A{current_row}:L{current_row}')
-        current_row += 1
+def _create_week_comparison_sheet(wb, data, filter_line=None, sorted_shops=None):
+    """By Week - All Shops comparison."""
+    _create_period_comparison_sheet(
+        wb, "By Week - All Shops", "WEEK",
+        [w['week_label'] for w in data.get('by_week', [])], 'by_week', 'week_label',
+        [30] + [14] * 5 + [16] * 6, data, filter_line, sorted_shops,
+    )
 
-        headers = ["Shop", "Active", "New", "New Rate", "Returning", "Return Rate", "INV(RET)", "AMT(RET)", "INV(CUS)", "AMT(CUS)", "Total Invoices", "Total Amount"]
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=current_row, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-        current_row += 1
 
-        for shop in sorted_shops:
-            w = shop_week_map[shop['shop_name']].get(week_label)
-            if w and w.get('total_invoices_with_vip0', 0) > 0:
-                ws.cell(row=current_row, column=1, value=shop['shop_name'])
-                ws.cell(row=current_row, column=2, value=w['total_customers'])
-                ws.cell(row=current_row, column=3, value=w.get('new_customers', 0))
-                ws.cell(row=current_row, column=4, value=f"{w.get('new_rate', 0)}%")
-                ws.cell(row=current_row, column=5, value=w['returning_customers'])
-                ws.cell(row=current_row, column=6, value=f"{w['return_rate']}%")
-                ws.cell(row=current_row, column=7, value=w.get('returning_invoices', 0))
-                ws.cell(row=current_row, column=8, value=w.get('returning_amount', 0))
-                ws.cell(row=current_row, column=8).number_format = '#,##0'
-                ws.cell(row=current_row, column=9, value=w['total_invoices'])
-                ws.cell(row=current_row, column=10, value=w['total_amount'])
-                ws.cell(row=current_row, column=10).number_format = '#,##0'
-                ws.cell(row=current_row, column=11, value=w.get('total_invoices_with_vip0', 0))
-                ws.cell(row=current_row, column=12, value=w.get('total_amount_with_vip0', 0))
-                ws.cell(row=current_row, column=12).number_format = '#,##0'
-                current_row += 1
-
-        current_row += 1
-
-    ws.column_dimensions['A'].width = 30
-    for col in range(2, 7):
-        ws.column_dimensions[get_column_letter(col)].width = 14
-    for col in range(7, 13):
-        ws.column_dimensions[get_column_letter(col)].width = 16
-
-
-def _create_details_sheet(wb, data, header_fill, header_font, header_align):
+def _create_details_sheet(wb, data):
     """Customer Details sheet."""
-    ws = wb.create_sheet("Customer Details")
-    
-    headers = ["VIP ID", "Name", "Grade", "Reg Date", "First Purchase", "Purchases", "Return Visits", "Total Spent"]
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-    
-    for row_num, c in enumerate(data['customer_details'], 2):
-        ws.cell(row=row_num, column=1, value=c['vip_id'])
-        ws.cell(row=row_num, column=2, value=c['name'])
-        ws.cell(row=row_num, column=3, value=c.get('vip_grade', ''))
-        ws.cell(row=row_num, column=4, value=str(c.get('registration_date', '')) if c.get('registration_date') else '')
-        ws.cell(row=row_num, column=5, value=str(c['first_purchase_date']))
-        ws.cell(row=row_num, column=6, value=c['total_purchases'])
-        ws.cell(row=row_num, column=7, value=c['return_visits'])
-        ws.cell(row=row_num, column=8, value=c['total_spent'])
-        ws.cell(row=row_num, column=8).number_format = '#,##0'
-    
-    for col in range(1, 9):
-        ws.column_dimensions[get_column_letter(col)].width = 18
+    ws = _analytics_sheet(wb, "Customer Details", [18] * 8)
 
-def _create_buyer_without_info_sheet(wb, data, header_fill, header_font, header_align):
+    headers = ["VIP ID", "Name", "Grade", "Reg Date", "First Purchase", "Purchases", "Return Visits", "Total Spent"]
+    ws.append(_header_cells(ws, headers, _HEADER_FILL, _HEADER_FONT, _HEADER_ALIGN))
+
+    # Stream one row per customer; no per-cell lookups on the sheet
+    for c in data['customer_details']:
+        ws.append((
+            c['vip_id'],
+            c['name'],
+            c.get('vip_grade', ''),
+            _date_cell(ws, c.get('registration_date'), default=''),
+            _date_cell(ws, c['first_purchase_date'], default=''),
+            c['total_purchases'],
+            c['return_visits'],
+            _money_cell(ws, c['total_spent']),
+        ))
+
+def _create_buyer_without_info_sheet(wb, data):
     """Buyer Without Info (VIP ID = 0) sheet."""
     bwi = data.get('buyer_without_info_stats')
     if not bwi:
         return
 
-    ws = wb.create_sheet("Buyer Without Info")
-    row = 1
+    ws = _analytics_sheet(wb, "Buyer Without Info", [30, 14, 18, 18, 18])
 
     # Period summary
-    ws.cell(row=row, column=1, value="Period Summary").font = Font(bold=True)
-    row += 1
+    ws.append([_styled_cell(ws, "Period Summary", font=_BOLD_FONT)])
     period = bwi.get('period', {})
-    for label, value in [
-        ("Total Invoices (Period)", period.get('total_invoices', 0)),
-        ("Total Amount (Period)", period.get('total_amount', 0)),
-        ("% of All Invoices", f"{period.get('pct_of_all_invoices', 0)}%"),
-        ("% of All Amount", f"{period.get('pct_of_all_amount', 0)}%"),
-    ]:
-        ws.cell(row=row, column=1, value=label)
-        ws.cell(row=row, column=2, value=value)
-        if 'Amount' in label:
-            ws.cell(row=row, column=2).number_format = '#,##0'
-        row += 1
+    ws.append(["Total Invoices (Period)", period.get('total_invoices', 0)])
+    ws.append(["Total Amount (Period)", _money_cell(ws, period.get('total_amount', 0))])
+    ws.append(["% of All Invoices", _percent_cell(ws, period.get('pct_of_all_invoices', 0))])
+    ws.append(["% of All Amount", _percent_cell(ws, period.get('pct_of_all_amount', 0))])
 
-    row += 1  # spacer
+    ws.append([])  # spacer
 
     # All-time summary
-    ws.cell(row=row, column=1, value="All-Time Summary").font = Font(bold=True)
-    row += 1
+    ws.append([_styled_cell(ws, "All-Time Summary", font=_BOLD_FONT)])
     alltime = bwi.get('all_time', {})
-    for label, value in [
-        ("Total Invoices (All Time)", alltime.get('total_invoices', 0)),
-        ("Total Amount (All Time)", alltime.get('total_amount', 0)),
-    ]:
-        ws.cell(row=row, column=1, value=label)
-        ws.cell(row=row, column=2, value=value)
-        if 'Amount' in label:
-            ws.cell(row=row, column=2).number_format = '#,##0'
-        row += 1
+    ws.append(["Total Invoices (All Time)", alltime.get('total_invoices', 0)])
+    ws.append(["Total Amount (All Time)", _money_cell(ws, alltime.get('total_amount', 0))])
 
-    row += 1  # spacer
+    ws.append([])  # spacer
 
     # By shop breakdown
-    ws.cell(row=row, column=1, value="By Shop (Period)").font = Font(bold=True)
-    row += 1
+    ws.append([_styled_cell(ws, "By Shop (Period)", font=_BOLD_FONT)])
     shop_headers = ["Shop", "Invoices", "Amount", "% Inv (All Period)", "% Amt (All Period)"]
-    for col_num, header in enumerate(shop_headers, 1):
-        cell = ws.cell(row=row, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-    row += 1
+    ws.append(_header_cells(ws, shop_headers, _HEADER_FILL, _HEADER_FONT, _HEADER_ALIGN))
     for s in bwi.get('by_shop', []):
-        ws.cell(row=row, column=1, value=s['shop_name'])
-        ws.cell(row=row, column=2, value=s['invoices'])
-        ws.cell(row=row, column=3, value=s['amount'])
-        ws.cell(row=row, column=3).number_format = '#,##0'
-        ws.cell(row=row, column=4, value=f"{s['pct_of_period_invoices']}%")
-        ws.cell(row=row, column=5, value=f"{s['pct_of_period_amount']}%")
-        row += 1
-
-    ws.column_dimensions['A'].width = 30
-    ws.column_dimensions['B'].width = 14
-    ws.column_dimensions['C'].width = 18
-    ws.column_dimensions['D'].width = 18
-    ws.column_dimensions['E'].width = 18
+        ws.append([
+            s['shop_name'],
+            s['invoices'],
+            _money_cell(ws, s['amount']),
+            _percent_cell(ws, s['pct_of_period_invoices']),
+            _percent_cell(ws, s['pct_of_period_amount']),
+        ])
 
 
 """
 ULTIMATE FIX - Uses customer_utils.get_customer_info() for proper lookup
 """
 
-def _create_reconciliation_sheet(wb, data, header_fill, header_font, header_align):
+
+class _ShopProblem(NamedTuple):
+    """One row of the shop reconciliation table."""
+    vip_id: str
+    name: str
+    reg_date: object
+    total_purchases: int
+    shop_total: int
+    difference: int
+    pattern: str
+    details: str
+
+
+class _SeasonProblem(NamedTuple):
+    """One row of the season reconciliation table."""
+    vip_id: str
+    name: str
+    reg_date: object
+    total_purchases: int
+    season_total: int
+    difference: int
+    num_seasons: int
+    details: str
+
+
+def _create_reconciliation_sheet(wb, data):
     """
     ULTIMATE FIX: Use customer_utils.get_customer_info() instead of manual lookup
     """
-    from openpyxl.styles import Font, PatternFill, Alignment
-    from collections import defaultdict
-    from App.analytics.customer_utils import get_customer_info
+    from App.analytics.customer_utils import get_customer_info, prime_customer_cache
     
     customer_purchases = data.get('customer_purchases', {})
     
     if not customer_purchases:
         ws = wb.create_sheet("⚠️ Reconciliation")
-        ws['A1'] = "⚠️ Customer purchase data not available"
-        ws['A1'].font = Font(bold=True, size=14, color="FF0000")
+        ws.append([_styled_cell(ws, "⚠️ Customer purchase data not available", font=_RECON_TITLE_FONT)])
         return
+
+    # Purchases from the analytics cache carry customer=None; load those
+    # customers in bulk rather than one get_customer_info() query each
+    prime_customer_cache(
+        vip_id for vip_id, purchases in customer_purchases.items()
+        if purchases and purchases[0].get('customer') is None
+    )
     
     # ============================================================================
     # Helper Functions
@@ -806,15 +661,14 @@ def _create_reconciliation_sheet(wb, data, header_fill, header_font, header_alig
             return None
         return d.date() if hasattr(d, 'date') else d
     
-    def calculate_return_visits_local(purchases_sorted, reg_date):
-        """Calculate return visits with proper date comparison"""
+    def calculate_return_visits_local(purchases_sorted, reg_date_cmp):
+        """Calculate return visits; reg_date_cmp is already converted with to_date()"""
         n = len(purchases_sorted)
         if n == 0:
             return (0, False)
         
         # Convert to dates for comparison
         first_date = to_date(purchases_sorted[0]['date'])
-        reg_date_cmp = to_date(reg_date)
         
         # Apply formula
         if reg_date_cmp and first_date == reg_date_cmp:
@@ -825,6 +679,18 @@ def _create_reconciliation_sheet(wb, data, header_fill, header_font, header_alig
         is_returning = (return_visits > 0)
         return (return_visits, is_returning)
     
+    def is_returning_group(count, first_on_reg_day):
+        """Same rule as calculate_return_visits_local, from (count, first purchase on reg day) only"""
+        return count > 1 or not first_on_reg_day
+
+    def count_group(stats_map, key, on_reg_day):
+        """Add one purchase to a [count, first purchase on reg day] group"""
+        stats = stats_map.get(key)
+        if stats is None:
+            stats_map[key] = [1, on_reg_day]
+        else:
+            stats[0] += 1
+    
     # ============================================================================
     # Get Summary Data
     # ============================================================================
@@ -842,28 +708,18 @@ def _create_reconciliation_sheet(wb, data, header_fill, header_font, header_alig
     # ============================================================================
     
     ws_shop = wb.create_sheet("Reconciliation - Shops")
+    _set_widths(ws_shop, _RECON_SHOP_WIDTHS)
     
     # Title
-    ws_shop['A1'] = "SHOP RECONCILIATION"
-    ws_shop['A1'].font = Font(bold=True, size=14, color="FF0000")
-    ws_shop.merge_cells('A1:I1')
-    
-    row = 3
+    ws_shop.append([_styled_cell(ws_shop, "SHOP RECONCILIATION", font=_RECON_TITLE_FONT)])
+    ws_shop.merged_cells.add('A1:I1')
+    ws_shop.append([])
     
     # Summary
-    ws_shop[f'A{row}'] = "Global Returning Invoices:"
-    ws_shop[f'B{row}'] = overview_total
-    ws_shop[f'B{row}'].font = Font(bold=True, color="0066CC")
-    row += 1
-    
-    ws_shop[f'A{row}'] = "Sum of Shop Returning Invoices:"
-    ws_shop[f'B{row}'] = shop_sum
-    row += 1
-    
-    ws_shop[f'A{row}'] = "Difference:"
-    ws_shop[f'B{row}'] = shop_diff
-    ws_shop[f'B{row}'].font = Font(bold=True, size=12, color="FF0000")
-    row += 2
+    ws_shop.append(["Global Returning Invoices:", _styled_cell(ws_shop, overview_total, font=_HIGHLIGHT_FONT)])
+    ws_shop.append(["Sum of Shop Returning Invoices:", shop_sum])
+    ws_shop.append(["Difference:", _styled_cell(ws_shop, shop_diff, font=_RECON_DIFF_FONT)])
+    ws_shop.append([])
     
     # Single pass: compute both shop_problems and season_problems simultaneously.
     # purchases lists are already sorted by build_customer_purchase_map — no re-sort needed.
@@ -877,229 +733,209 @@ def _create_reconciliation_sheet(wb, data, header_fill, header_font, header_alig
         # purchases already sorted; use directly
         customer_obj = purchases[0].get('customer')
         grade, reg_date, name = get_customer_info(vip_id, customer_obj)
+        # Converted once; every shop/season check below compares against it
+        reg_date_cmp = to_date(reg_date)
 
-        global_rv, global_is_ret = calculate_return_visits_local(purchases, reg_date)
+        global_rv, global_is_ret = calculate_return_visits_local(purchases, reg_date_cmp)
         if not global_is_ret:
             continue
 
+        # A shop/season group only stops counting as returning when it is a
+        # single purchase made on the registration day, so customers with no
+        # reg-day purchase cannot show a difference in either table
+        if not reg_date_cmp:
+            continue
+        # Each purchase date is converted exactly once, here
+        on_reg_day = [to_date(p['date']) == reg_date_cmp for p in purchases]
+        if not any(on_reg_day):
+            continue
+
         global_ret_inv = len(purchases)
 
-        # Build per-shop and per-season sub-lists in one scan (sub-lists inherit sort order)
-        by_shop = defaultdict(list)
-        by_season = defaultdict(list)
-        for p in purchases:
-            by_shop[p.get('shop', 'Unknown')].append(p)
-            by_season[p.get('session', 'Unknown')].append(p)
+        # Per-shop and per-season [count, first purchase on reg day] in one
+        # scan; date-sorted purchases mean groups are first seen in date order
+        shop_stats = {}
+        season_stats = {}
+        for p, reg_day in zip(purchases, on_reg_day):
+            count_group(shop_stats, p.get('shop', 'Unknown'), reg_day)
+            count_group(season_stats, p.get('session', 'Unknown'), reg_day)
 
         # ── Shop diff ──────────────────────────────────────────────────────────
-        shop_total = 0
-        for shop_purch in by_shop.values():
-            _, is_ret = calculate_return_visits_local(shop_purch, reg_date)
-            if is_ret:
-                shop_total += len(shop_purch)
+        shop_ret = {
+            sh: is_returning_group(count, first_on_reg_day)
+            for sh, (count, first_on_reg_day) in shop_stats.items()
+        }
+        shop_total = sum(
+            count for sh, (count, _) in shop_stats.items() if shop_ret[sh]
+        )
 
         cust_shop_diff = global_ret_inv - shop_total
         if cust_shop_diff > 0:
-            reg_date_cmp = to_date(reg_date)
-            if reg_date_cmp:
-                reg_day_purch = [p for p in purchases if to_date(p['date']) == reg_date_cmp]
-                reg_day_shops = {p.get('shop', 'Unknown') for p in reg_day_purch}
-            else:
-                reg_day_purch = []
-                reg_day_shops = set()
+            reg_day_shops = {
+                p.get('shop', 'Unknown') for p, reg_day in zip(purchases, on_reg_day) if reg_day
+            }
 
             if len(reg_day_shops) >= 2:
                 pattern = "Multi-shop reg day"
-            elif len(reg_day_purch) >= 1 and len(by_shop) >= 2:
+            elif len(shop_stats) >= 2:
                 pattern = "Reg day → other shops"
             else:
                 pattern = "Other"
 
-            # sub-lists already in date order; first element is earliest
-            shop_details = []
-            by_shop_sorted = sorted(by_shop.items(), key=lambda kv: kv[1][0]['date'])
-            for sh, sh_purch in by_shop_sorted[:3]:
-                _, sh_is_ret = calculate_return_visits_local(sh_purch, reg_date)
-                shop_details.append(f"{sh[:25]}({len(sh_purch)},ret={sh_is_ret})")
+            shop_details = [
+                f"{sh[:25]}({count},ret={shop_ret[sh]})"
+                for sh, (count, _) in islice(shop_stats.items(), 3)
+            ]
 
-            shop_problems.append({
-                'vip_id': vip_id, 'name': name, 'reg_date': reg_date,
-                'total_purchases': global_ret_inv, 'global_ret_inv': global_ret_inv,
-                'shop_total': shop_total, 'difference': cust_shop_diff,
-                'pattern': pattern, 'details': "; ".join(shop_details),
-            })
+            shop_problems.append(_ShopProblem(
+                vip_id, name, reg_date, global_ret_inv, shop_total,
+                cust_shop_diff, pattern, "; ".join(shop_details),
+            ))
 
         # ── Season diff ────────────────────────────────────────────────────────
-        season_total = 0
-        for season_purch in by_season.values():
-            _, is_ret = calculate_return_visits_local(season_purch, reg_date)
-            if is_ret:
-                season_total += len(season_purch)
+        season_ret = {
+            ssn: is_returning_group(count, first_on_reg_day)
+            for ssn, (count, first_on_reg_day) in season_stats.items()
+        }
+        season_total = sum(
+            count for ssn, (count, _) in season_stats.items() if season_ret[ssn]
+        )
 
         cust_season_diff = global_ret_inv - season_total
         if cust_season_diff > 0:
-            season_details = []
-            by_season_sorted = sorted(by_season.items(), key=lambda kv: kv[1][0]['date'])
-            for ssn, ssn_purch in by_season_sorted[:3]:
-                _, ssn_is_ret = calculate_return_visits_local(ssn_purch, reg_date)
-                season_details.append(f"{ssn}({len(ssn_purch)},ret={ssn_is_ret})")
-
-            season_problems.append({
-                'vip_id': vip_id, 'name': name, 'reg_date': reg_date,
-                'total_purchases': global_ret_inv, 'global_ret_inv': global_ret_inv,
-                'season_total': season_total, 'difference': cust_season_diff,
-                'num_seasons': len(by_season), 'details': "; ".join(season_details),
-            })
-
-    shop_problems.sort(key=lambda x: x['difference'], reverse=True)
+            season_details = [
+                f"{ssn}({count},ret={season_ret[ssn]})"
+                for ssn, (count, _) in islice(season_stats.items(), 3)
+            ]
+
+            season_problems.append(_SeasonProblem(
+                vip_id, name, reg_date, global_ret_inv, season_total,
+                cust_season_diff, len(season_stats), "; ".join(season_details),
+            ))
+
+    by_difference = attrgetter('difference')
+    shop_problems.sort(key=by_difference, reverse=True)
     
     # Pattern summary
-    pattern1 = [c for c in shop_problems if c['pattern'] == "Multi-shop reg day"]
-    pattern2 = [c for c in shop_problems if c['pattern'] == "Reg day → other shops"]
-    
-    ws_shop[f'A{row}'] = "PATTERNS:"
-    ws_shop[f'A{row}'].font = Font(bold=True)
-    row += 1
+    pattern1 = [c for c in shop_problems if c.pattern == "Multi-shop reg day"]
+    pattern2 = [c for c in shop_problems if c.pattern == "Reg day → other shops"]
     
-    ws_shop[f'A{row}'] = f"Pattern 1 (Multi-shop reg day): {len(pattern1)} customers, {sum(c['difference'] for c in pattern1)} invoices"
-    row += 1
+    ws_shop.append([_styled_cell(ws_shop, "PATTERNS:", font=_BOLD_FONT)])
+    ws_shop.append([f"Pattern 1 (Multi-shop reg day): {len(pattern1)} customers, {sum(c.difference for c in pattern1)} invoices"])
+    ws_shop.append([f"Pattern 2 (Reg day → other shops): {len(pattern2)} customers, {sum(c.difference for c in pattern2)} invoices"])
+    ws_shop.append([])
     
-    ws_shop[f'A{row}'] = f"Pattern 2 (Reg day → other shops): {len(pattern2)} customers, {sum(c['difference'] for c in pattern2)} invoices"
-    row += 2
-    
-    # Table
-    ws_shop[f'A{row}'] = f"ALL {len(shop_problems)} CUSTOMERS WITH SHOP DIFFERENCES:"
-    ws_shop[f'A{row}'].font = Font(bold=True, size=11)
-    ws_shop.merge_cells(f'A{row}:I{row}')
-    row += 1
+    # Table (title lands on row 11: title, blank, 3 summary rows, blank, 3 pattern rows, blank)
+    ws_shop.append([_styled_cell(ws_shop, f"ALL {len(shop_problems)} CUSTOMERS WITH SHOP DIFFERENCES:", font=_RECON_TABLE_TITLE_FONT)])
+    ws_shop.merged_cells.add('A11:I11')
     
     # Headers
     headers = ["VIP ID", "Name", "Reg Date", "Total Purch", "Global", "Shop Sum", "Diff", "Pattern", "Details"]
-    for col_idx, header in enumerate(headers, start=1):
-        cell = ws_shop.cell(row=row, column=col_idx, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal="center")
-    row += 1
+    ws_shop.append(_header_cells(ws_shop, headers, _HEADER_FILL, _HEADER_FONT, _RECON_HEADER_ALIGN))
     
     # Data rows
     for c in shop_problems:
-        ws_shop.cell(row=row, column=1, value=c['vip_id'])
-        ws_shop.cell(row=row, column=2, value=c['name'])
-        ws_shop.cell(row=row, column=3, value=c['reg_date'].strftime('%Y-%m-%d') if c['reg_date'] else 'NULL')
-        ws_shop.cell(row=row, column=4, value=c['total_purchases'])
-        ws_shop.cell(row=row, column=5, value=c['global_ret_inv'])
-        ws_shop.cell(row=row, column=6, value=c['shop_total'])
-        
-        diff_cell = ws_shop.cell(row=row, column=7, value=c['difference'])
-        diff_cell.font = Font(bold=True, color="FF0000")
-        
-        pattern_cell = ws_shop.cell(row=row, column=8, value=c['pattern'])
-        if c['pattern'] == "Multi-shop reg day":
-            pattern_cell.fill = PatternFill(start_color="FFE0E0", end_color="FFE0E0", fill_type="solid")
-        else:
-            pattern_cell.fill = PatternFill(start_color="E0FFE0", end_color="E0FFE0", fill_type="solid")
-        
-        ws_shop.cell(row=row, column=9, value=c['details'])
-        row += 1
-    
-    # Column widths
-    ws_shop.column_dimensions['A'].width = 12
-    ws_shop.column_dimensions['B'].width = 25
-    ws_shop.column_dimensions['C'].width = 12
-    ws_shop.column_dimensions['D'].width = 12
-    ws_shop.column_dimensions['E'].width = 10
-    ws_shop.column_dimensions['F'].width = 10
-    ws_shop.column_dimensions['G'].width = 8
-    ws_shop.column_dimensions['H'].width = 22
-    ws_shop.column_dimensions['I'].width = 50
+        ws_shop.append([
+            c.vip_id,
+            c.name,
+            _date_cell(ws_shop, c.reg_date, default='NULL'),
+            c.total_purchases,
+            c.total_purchases,
+            c.shop_total,
+            _styled_cell(ws_shop, c.difference, font=_RED_BOLD_FONT),
+            _styled_cell(ws_shop, c.pattern, fill=(
+                _PATTERN_MULTI_SHOP_FILL if c.pattern == "Multi-shop reg day" else _PATTERN_OTHER_FILL
+            )),
+            c.details,
+        ])
     
     # ============================================================================
     # SHEET 2: SEASON RECONCILIATION
     # ============================================================================
     
     ws_season = wb.create_sheet("Reconciliation - Seasons")
+    _set_widths(ws_season, _RECON_SEASON_WIDTHS)
     
     # Title
-    ws_season['A1'] = "SEASON RECONCILIATION"
-    ws_season['A1'].font = Font(bold=True, size=14, color="FF0000")
-    ws_season.merge_cells('A1:I1')
-    
-    row = 3
+    ws_season.append([_styled_cell(ws_season, "SEASON RECONCILIATION", font=_RECON_TITLE_FONT)])
+    ws_season.merged_cells.add('A1:I1')
+    ws_season.append([])
     
     # Summary
-    ws_season[f'A{row}'] = "Global Returning Invoices:"
-    ws_season[f'B{row}'] = overview_total
-    ws_season[f'B{row}'].font = Font(bold=True, color="0066CC")
-    row += 1
-    
-    ws_season[f'A{row}'] = "Sum of Season Returning Invoices:"
-    ws_season[f'B{row}'] = season_sum
-    row += 1
-    
-    ws_season[f'A{row}'] = "Difference:"
-    ws_season[f'B{row}'] = season_diff
-    ws_season[f'B{row}'].font = Font(bold=True, size=12, color="FF0000")
-    row += 2
+    ws_season.append(["Global Returning Invoices:", _styled_cell(ws_season, overview_total, font=_HIGHLIGHT_FONT)])
+    ws_season.append(["Sum of Season Returning Invoices:", season_sum])
+    ws_season.append(["Difference:", _styled_cell(ws_season, season_diff, font=_RECON_DIFF_FONT)])
+    ws_season.append([])
     
-    season_problems.sort(key=lambda x: x['difference'], reverse=True)
+    season_problems.sort(key=by_difference, reverse=True)
     
     # Pattern explanation
-    ws_season[f'A{row}'] = f"Pattern: {len(season_problems)} customers, {sum(c['difference'] for c in season_problems)} invoices"
-    ws_season[f'A{row}'].font = Font(bold=True)
-    row += 1
+    ws_season.append([_styled_cell(ws_season, f"Pattern: {len(season_problems)} customers, {sum(c.difference for c in season_problems)} invoices", font=_BOLD_FONT)])
+    ws_season.append(["First purchase on reg day in Season 1 → NOT returning in Season 1"])
+    ws_season.append(["Then purchases in other seasons → IS returning in those seasons"])
+    ws_season.append(["Each customer loses exactly 1 invoice from first season"])
+    ws_season.append([])
     
-    ws_season[f'A{row}'] = "First purchase on reg day in Season 1 → NOT returning in Season 1"
-    row += 1
-    ws_season[f'A{row}'] = "Then purchases in other seasons → IS returning in those seasons"
-    row += 1
-    ws_season[f'A{row}'] = "Each customer loses exactly 1 invoice from first season"
-    row += 2
-    
-    # Table
-    ws_season[f'A{row}'] = f"ALL {len(season_problems)} CUSTOMERS WITH SEASON DIFFERENCES:"
-    ws_season[f'A{row}'].font = Font(bold=True, size=11)
-    ws_season.merge_cells(f'A{row}:I{row}')
-    row += 1
+    # Table (title lands on row 12)
+    ws_season.append([_styled_cell(ws_season, f"ALL {len(season_problems)} CUSTOMERS WITH SEASON DIFFERENCES:", font=_RECON_TABLE_TITLE_FONT)])
+    ws_season.merged_cells.add('A12:I12')
     
     # Headers
     headers = ["VIP ID", "Name", "Reg Date", "Total Purch", "Global", "Season Sum", "Diff", "Num Seasons", "Details"]
-    for col_idx, header in enumerate(headers, start=1):
-        cell = ws_season.cell(row=row, column=col_idx, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal="center")
-    row += 1
+    ws_season.append(_header_cells(ws_season, headers, _HEADER_FILL, _HEADER_FONT, _RECON_HEADER_ALIGN))
     
     # Data rows (ALL season problems)
     for c in season_problems:
-        ws_season.cell(row=row, column=1, value=c['vip_id'])
-        ws_season.cell(row=row, column=2, value=c['name'])
-        ws_season.cell(row=row, column=3, value=c['reg_date'].strftime('%Y-%m-%d') if c['reg_date'] else 'NULL')
-        ws_season.cell(row=row, column=4, value=c['total_purchases'])
-        ws_season.cell(row=row, column=5, value=c['global_ret_inv'])
-        ws_season.cell(row=row, column=6, value=c['season_total'])
-        
-        diff_cell = ws_season.cell(row=row, column=7, value=c['difference'])
-        diff_cell.font = Font(bold=True, color="FF0000")
-        
-        ws_season.cell(row=row, column=8, value=c['num_seasons'])
-        ws_season.cell(row=row, column=9, value=c['details'])
-        row += 1
-    
-    # Column widths
-    ws_season.column_dimensions['A'].width = 12
-    ws_season.column_dimensions['B'].width = 25
-    ws_season.column_dimensions['C'].width = 12
-    ws_season.column_dimensions['D'].width = 12
-    ws_season.column_dimensions['E'].width = 10
-    ws_season.column_dimensions['F'].width = 10
-    ws_season.column_dimensions['G'].width = 8
-    ws_season.column_dimensions['H'].width = 12
-    ws_season.column_dimensions['I'].width = 50
+        ws_season.append([
+            c.vip_id,
+            c.name,
+            _date_cell(ws_season, c.reg_date, default='NULL'),
+            c.total_purchases,
+            c.total_purchases,
+            c.season_total,
+            _styled_cell(ws_season, c.difference, font=_RED_BOLD_FONT),
+            c.num_seasons,
+            c.details,
+        ])
     
 
 
+def _total_and_period_counts(queryset, period=None):
+    """
+    Return (total rows, rows matching ``period``) with a single aggregate.
+
+    ``period`` is a Q filter; without one the period count is 0.
+    """
+    if period is None:
+        return queryset.count(), 0
+    counts = queryset.aggregate(total=Count('pk'), in_period=Count('pk', filter=period))
+    return counts['total'], counts['in_period']
+
+
+def _stream_customer_sheet(wb, title, queryset, fields, headers, widths, row_fn, skip_empty=False):
+    """
+    Stream a customer queryset into its own data sheet; returns the row count.
+
+    Only ``fields`` are fetched, in chunks, and each row goes through
+    ``row_fn(ws, *values)``. With ``skip_empty`` the first row is peeked
+    instead of running a separate .exists() query, and no sheet is created
+    when there are no rows.
+    """
+    rows = queryset.values_list(*fields).iterator(chunk_size=2000)
+    first = next(rows, None)
+    if first is None and skip_empty:
+        return 0
+
+    ws = _data_sheet(wb, title, headers, widths, _HEADER_FILL)
+    if first is None:
+        return 0
+    count = 0
+    for values in chain((first,), rows):
+        ws.append(row_fn(ws, *values))
+        count += 1
+    return count
+
+
 # Add this function to the END of excel_export.py
 
 def export_customer_comparison_to_excel(
@@ -1113,6 +949,7 @@ def export_customer_comparison_to_excel(
     zalo_mini_app_list=None,
     zalo_oa_list=None,
     zalo_stats=None,
+    output=None,
 ):
     """
     Export Customer Analytics (POS vs CNV comparison) to Excel.
@@ -1129,461 +966,208 @@ def export_customer_comparison_to_excel(
         cnv_customers: QuerySet of CNVCustomer objects from CNV
         date_from: Start date for period filter (optional)
         date_to: End date for period filter (optional)
+        cnv_used_points: QuerySet of CNVCustomer rows for the Used Points
+            sheet, in display order; streamed, so pass it unevaluated
+        output: File path or writable stream (e.g. HttpResponse). When given,
+            the write-only workbook is saved straight into it.
     
     Returns:
-        openpyxl Workbook object
+        openpyxl Workbook object, or None when saved to ``output``
     """
-    wb = Workbook()
+    wb = Workbook(write_only=True)
     
-    # Styling
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    header_align = Alignment(horizontal="center", vertical="center")
-
-    from django.db.models import Subquery
-
     # Base querysets with phone
     pos_base = pos_customers.filter(phone__isnull=False).exclude(phone='')
     cnv_base = cnv_customers.filter(phone__isnull=False).exclude(phone='')
 
-    # Count sets (done via DB, no Python set needed for this)
-    pos_phones_sq = Subquery(cnv_base.values('phone'))
-    cnv_phones_sq = Subquery(pos_base.values('phone'))
-
-    pos_only_count = pos_base.exclude(phone__in=pos_phones_sq).count()
-    cnv_only_count = cnv_base.exclude(phone__in=cnv_phones_sq).count()
-    total_pos = pos_base.count()
-    total_cnv = cnv_base.count()
+    # "Only" sets are defined once and each anti-join runs once, while its
+    # sheet streams; the Overview counts are the number of rows written
+    pos_only_customers = pos_base.exclude(
+        phone__in=cnv_base.values('phone')
+    ).order_by('registration_date')
+    cnv_only_customers = cnv_base.exclude(
+        phone__in=pos_base.values('phone')
+    ).order_by('cnv_created_at')
 
     # Period comparisons (if filtered)
-    new_pos_count = 0
-    new_cnv_count = 0
+    pos_period = cnv_period = None
     pos_only_period_count = 0
     cnv_only_period_count = 0
 
     if date_from and date_to:
-        new_pos = pos_base.filter(registration_date__gte=date_from, registration_date__lte=date_to)
-        new_pos_count = new_pos.count()
-        pos_only_period_count = new_pos.exclude(phone__in=Subquery(cnv_base.values('phone'))).count()
+        pos_period = Q(registration_date__gte=date_from, registration_date__lte=date_to)
+        cnv_period = Q(cnv_created_at__gte=date_from, cnv_created_at__lte=date_to)
+
+    # Total and new-in-period counts come from one aggregate per side
+    total_pos, new_pos_count = _total_and_period_counts(pos_base, pos_period)
+    total_cnv, new_cnv_count = _total_and_period_counts(cnv_base, cnv_period)
+
+    # Only the exported columns are fetched (values_list, streamed with
+    # .iterator()) so no model instances are built for the large sheets
+    pos_fields = ('vip_id', 'phone', 'name', 'vip_grade', 'email', 'registration_date', 'points')
+    # Points come back as floats with NULL -> 0 already applied in SQL
+    cnv_fields = ('cnv_id', 'phone', 'last_name', 'first_name', 'level_name', 'email',
+                  'cnv_created_at', _float_or_zero('total_points'), _float_or_zero('used_points'))
+    pos_headers = ['VIP ID', 'Phone', 'Name', 'Grade', 'Email', 'Registration Date', 'Points']
+    cnv_headers = ['Customer ID', 'Phone', 'Name', 'Level', 'Email', 'Registration Date', 'Points', 'Used Points']
+
+    def pos_row(ws, vip_id, phone, name, vip_grade, email, registration_date, points):
+        return [
+            vip_id,
+            phone,
+            name,
+            vip_grade or '-',
+            email or '-',
+            _date_cell(ws, registration_date),
+            points or 0,
+        ]
+
+    def cnv_row(ws, cnv_id, phone, last_name, first_name, level_name, email,
+                cnv_created_at, total_points, used_points):
+        return [
+            cnv_id,
+            phone,
+            f"{last_name or ''} {first_name or ''}".strip() or '-',
+            level_name or '-',
+            email or '-',
+            _date_cell(ws, cnv_created_at and cnv_created_at.date()),
+            total_points,
+            used_points,
+        ]
 
-        new_cnv = cnv_base.filter(cnv_created_at__gte=date_from, cnv_created_at__lte=date_to)
-        new_cnv_count = new_cnv.count()
-        cnv_only_period_count = new_cnv.exclude(phone__in=Subquery(pos_base.values('phone'))).count()
-    
     # ========================================================================
     # OVERVIEW SHEET
     # ========================================================================
-    ws = wb.active
-    ws.title = "Overview"
-    
-    ws['A1'] = "Customer Analytics - POS vs CNV Comparison"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws.merge_cells('A1:B1')
-    
-    row = 3
-    
-    # Filter info
-    if date_from and date_to:
-        ws[f'A{row}'] = "Period Filter:"
-        ws[f'B{row}'] = f"{date_from} to {date_to}"
-        ws[f'B{row}'].font = Font(bold=True, color="0066CC")
-        row += 1
-    
-    row += 1
-    
-    # All-Time Metrics
-    ws[f'A{row}'] = "All-Time Metrics"
-    ws[f'A{row}'].font = Font(bold=True)
-    row += 1
-    
-    metrics_all = [
-        ("Total Customers (POS System)", total_pos),
-        ("Total CNV Customers", total_cnv),
-        ("POS Only (Not in CNV)", pos_only_count),
-        ("CNV Only (Not in POS)", cnv_only_count),
-    ]
-    
-    for label, value in metrics_all:
-        ws[f'A{row}'] = label
-        ws[f'B{row}'] = value
-        row += 1
-    
-    # Period Metrics (if filtered)
-    if date_from and date_to:
-        row += 1
-        ws[f'A{row}'] = "Period Metrics"
-        ws[f'A{row}'].font = Font(bold=True)
-        row += 1
-        
-        metrics_period = [
-            ("New Customers (POS)", new_pos_count),
-            ("New CNV Customers", new_cnv_count),
-            ("New POS Only (Period)", pos_only_period_count),
-            ("New CNV Only (Period)", cnv_only_period_count),
-        ]
-        
-        for label, value in metrics_period:
-            ws[f'A{row}'] = label
-            ws[f'B{row}'] = value
-            row += 1
-    
-    # Zalo All-Time Metrics
-    if zalo_stats:
-        row += 1
-        ws[f'A{row}'] = "Zalo Metrics (All-Time)"
-        ws[f'A{row}'].font = Font(bold=True, color="0068FF")
-        row += 1
-        zalo_metrics = [
-            ("Active Zalo Mini App", zalo_stats.get('zalo_app_all_count', 0)),
-            ("% Active Zalo / CNV", f"{zalo_stats.get('zalo_app_all_pct', 0)}%"),
-            ("Follow Zalo OA", zalo_stats.get('zalo_oa_all_count', 0)),
-            ("% Follow OA / CNV", f"{zalo_stats.get('zalo_oa_all_pct', 0)}%"),
-        ]
-        for label, value in zalo_metrics:
-            ws[f'A{row}'] = label
-            ws[f'B{row}'] = value
-            row += 1
-
-        if date_from and date_to:
-            row += 1
-            ws[f'A{row}'] = "Zalo Metrics (Period)"
-            ws[f'A{row}'].font = Font(bold=True, color="0068FF")
-            row += 1
-            zalo_period_metrics = [
-                ("Active Zalo Mini App (Period)", zalo_stats.get('zalo_app_period_count', 0)),
-                ("% Zalo App / CNV (Period)", f"{zalo_stats.get('zalo_app_period_pct', 0)}%"),
-                ("Follow Zalo OA (Period)", zalo_stats.get('zalo_oa_period_count', 0)),
-                ("% Follow OA / CNV (Period)", f"{zalo_stats.get('zalo_oa_period_pct', 0)}%"),
-            ]
-            for label, value in zalo_period_metrics:
-                ws[f'A{row}'] = label
-                ws[f'B{row}'] = value
-                row += 1
+    # Created first so it stays the first tab; its rows are appended at the
+    # end once the "only" counts are known. Write-only sheets are filled top
+    # to bottom and column widths must be set before the first row
+    ws = wb.create_sheet("Overview")
+    _set_widths(ws, _OVERVIEW_WIDTHS)
 
-    ws.column_dimensions['A'].width = 35
-    ws.column_dimensions['B'].width = 20
+    # (values_list fields, headers, widths, row builder) per customer source
+    pos_spec = (pos_fields, pos_headers, _POS_ONLY_WIDTHS, pos_row)
+    cnv_spec = (cnv_fields, cnv_headers, _CNV_ONLY_WIDTHS, cnv_row)
 
     # ========================================================================
-    # POS ONLY - ALL TIME SHEET
+    # POS / CNV ONLY - ALL TIME SHEETS (always present)
     # ========================================================================
-    ws_pos_all = wb.create_sheet("POS Only - All Time")
-    
-    # Header
-    headers = ['VIP ID', 'Phone', 'Name', 'Grade', 'Email', 'Registration Date', 'Points']
-    for col_idx, header in enumerate(headers, 1):
-        cell = ws_pos_all.cell(1, col_idx, header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-    
-    # Data — subquery, no large __in set
-    pos_only_customers = pos_base.exclude(
-        phone__in=Subquery(cnv_base.values('phone'))
-    ).order_by('registration_date')
-    row = 2
-    for cust in pos_only_customers:
-        ws_pos_all.cell(row, 1, cust.vip_id)
-        ws_pos_all.cell(row, 2, cust.phone)
-        ws_pos_all.cell(row, 3, cust.name)
-        ws_pos_all.cell(row, 4, cust.vip_grade or '-')
-        ws_pos_all.cell(row, 5, cust.email or '-')
-        ws_pos_all.cell(row, 6, str(cust.registration_date) if cust.registration_date else '-')
-        ws_pos_all.cell(row, 7, cust.points or 0)
-        row += 1
-    
-    # Column widths
-    ws_pos_all.column_dimensions['A'].width = 12
-    ws_pos_all.column_dimensions['B'].width = 15
-    ws_pos_all.column_dimensions['C'].width = 25
-    ws_pos_all.column_dimensions['D'].width = 12
-    ws_pos_all.column_dimensions['E'].width = 30
-    ws_pos_all.column_dimensions['F'].width = 18
-    ws_pos_all.column_dimensions['G'].width = 10
-    
-    # ========================================================================
-    # CNV ONLY - ALL TIME SHEET
-    # ========================================================================
-    ws_cnv_all = wb.create_sheet("CNV Only - All Time")
-    
-    # Header (8 columns)
-    headers = ['Customer ID', 'Phone', 'Name', 'Level', 'Email', 'Registration Date', 'Points', 'Used Points']
-    for col_idx, header in enumerate(headers, 1):
-        cell = ws_cnv_all.cell(1, col_idx, header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-    
-    # Data — subquery
-    cnv_only_customers = cnv_base.exclude(
-        phone__in=Subquery(pos_base.values('phone'))
-    ).order_by('cnv_created_at')
-    row = 2
-    for cust in cnv_only_customers:
-        ws_cnv_all.cell(row, 1, cust.cnv_id)
-        ws_cnv_all.cell(row, 2, cust.phone)
-        ws_cnv_all.cell(row, 3, cust.full_name or '-')
-        ws_cnv_all.cell(row, 4, cust.level_name or '-')
-        ws_cnv_all.cell(row, 5, cust.email or '-')
-        ws_cnv_all.cell(row, 6, str(cust.cnv_created_at.date()) if cust.cnv_created_at else '-')
-        ws_cnv_all.cell(row, 7, float(cust.total_points) if cust.total_points else 0)
-        ws_cnv_all.cell(row, 8, float(cust.used_points) if cust.used_points else 0)
-        row += 1
-    
-    # Column widths
-    ws_cnv_all.column_dimensions['A'].width = 15
-    ws_cnv_all.column_dimensions['B'].width = 15
-    ws_cnv_all.column_dimensions['C'].width = 25
-    ws_cnv_all.column_dimensions['D'].width = 12
-    ws_cnv_all.column_dimensions['E'].width = 30
-    ws_cnv_all.column_dimensions['F'].width = 18
-    ws_cnv_all.column_dimensions['G'].width = 12
-    ws_cnv_all.column_dimensions['H'].width = 12
-    
+    pos_only_count = _stream_customer_sheet(wb, "POS Only - All Time", pos_only_customers, *pos_spec)
+    cnv_only_count = _stream_customer_sheet(wb, "CNV Only - All Time", cnv_only_customers, *cnv_spec)
+
     # ========================================================================
-    # PERIOD SHEETS (if filtered)
+    # PERIOD SHEETS (if filtered; only created when the period has rows)
     # ========================================================================
     if date_from and date_to:
-        # POS Only - Period
-        pos_period_qs = pos_base.filter(
-            registration_date__gte=date_from,
-            registration_date__lte=date_to
-        ).exclude(phone__in=Subquery(cnv_base.values('phone'))).order_by('registration_date')
-
-        if pos_period_qs.exists():
-            ws_pos_period = wb.create_sheet("POS Only - Period")
-            headers = ['VIP ID', 'Phone', 'Name', 'Grade', 'Email', 'Registration Date', 'Points']
-            for col_idx, header in enumerate(headers, 1):
-                cell = ws_pos_period.cell(1, col_idx, header)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = header_align
-            row = 2
-            for cust in pos_period_qs:
-                ws_pos_period.cell(row, 1, cust.vip_id)
-                ws_pos_period.cell(row, 2, cust.phone)
-                ws_pos_period.cell(row, 3, cust.name)
-                ws_pos_period.cell(row, 4, cust.vip_grade or '-')
-                ws_pos_period.cell(row, 5, cust.email or '-')
-                ws_pos_period.cell(row, 6, str(cust.registration_date) if cust.registration_date else '-')
-                ws_pos_period.cell(row, 7, cust.points or 0)
-                row += 1
-            for col, w in zip('ABCDEFG', [12, 15, 25, 12, 30, 18, 10]):
-                ws_pos_period.column_dimensions[col].width = w
-
-        # CNV Only - Period
-        cnv_period_qs = cnv_base.filter(
-            cnv_created_at__gte=date_from,
-            cnv_created_at__lte=date_to
-        ).exclude(phone__in=Subquery(pos_base.values('phone'))).order_by('cnv_created_at')
-
-        if cnv_period_qs.exists():
-            ws_cnv_period = wb.create_sheet("CNV Only - Period")
-            headers = ['Customer ID', 'Phone', 'Name', 'Level', 'Email', 'Registration Date', 'Points', 'Used Points']
-            for col_idx, header in enumerate(headers, 1):
-                cell = ws_cnv_period.cell(1, col_idx, header)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = header_align
-            row = 2
-            for cust in cnv_period_qs:
-                ws_cnv_period.cell(row, 1, cust.cnv_id)
-                ws_cnv_period.cell(row, 2, cust.phone)
-                ws_cnv_period.cell(row, 3, cust.full_name or '-')
-                ws_cnv_period.cell(row, 4, cust.level_name or '-')
-                ws_cnv_period.cell(row, 5, cust.email or '-')
-                ws_cnv_period.cell(row, 6, str(cust.cnv_created_at.date()) if cust.cnv_created_at else '-')
-                ws_cnv_period.cell(row, 7, float(cust.total_points) if cust.total_points else 0)
-                ws_cnv_period.cell(row, 8, float(cust.used_points) if cust.used_points else 0)
-                row += 1
-            for col, w in zip('ABCDEFGH', [15, 15, 25, 12, 30, 18, 12, 12]):
-                ws_cnv_period.column_dimensions[col].width = w
+        pos_only_period_count = _stream_customer_sheet(
+            wb, "POS Only - Period",
+            pos_only_customers.filter(pos_period),
+            *pos_spec, skip_empty=True,
+        )
+        cnv_only_period_count = _stream_customer_sheet(
+            wb, "CNV Only - Period",
+            cnv_only_customers.filter(cnv_period),
+            *cnv_spec, skip_empty=True,
+        )
 
     # ========================================================================
     # POINTS MISMATCH SHEET
     # ========================================================================
-    ws_mismatch = wb.create_sheet("Points Mismatch")
-
     mismatch_headers = [
         'Phone', 'POS VIP ID', 'POS Name', 'POS Grade', 'POS Points', 'POS Used Points',
         'CNV ID', 'CNV Name', 'CNV Level', 'CNV Points', 'CNV Total Points', 'CNV Used Points',
         'Diff Value', 'Diff Note'
     ]
-    orange_fill = PatternFill(start_color="C65911", end_color="C65911", fill_type="solid")
-    for col_idx, header in enumerate(mismatch_headers, 1):
-        cell = ws_mismatch.cell(1, col_idx, header)
-        cell.fill = orange_fill
-        cell.font = header_font
-        cell.alignment = header_align
-
-    row = 2
-    for m in (points_mismatch or []):
-        ws_mismatch.cell(row, 1, m.get('phone', ''))
-        ws_mismatch.cell(row, 2, m.get('pos_vip_id', ''))
-        ws_mismatch.cell(row, 3, m.get('pos_name', ''))
-        ws_mismatch.cell(row, 4, m.get('pos_grade', ''))
-        ws_mismatch.cell(row, 5, m.get('pos_points', 0))
-        ws_mismatch.cell(row, 6, m.get('pos_used_points', 0))
-        ws_mismatch.cell(row, 7, m.get('cnv_id', ''))
-        ws_mismatch.cell(row, 8, m.get('cnv_name', ''))
-        ws_mismatch.cell(row, 9, m.get('cnv_level', ''))
-        ws_mismatch.cell(row, 10, m.get('cnv_points', 0))
-        ws_mismatch.cell(row, 11, m.get('cnv_total_points', 0))
-        ws_mismatch.cell(row, 12, m.get('cnv_used_points', 0))
-        diff = m.get('diff', 0)
-        diff_cell = ws_mismatch.cell(row, 13, diff)
-        diff_cell.font = Font(bold=True, color="16A34A" if diff > 0 else "DC2626")
-        note = "Run camp to reduce point in CNV" if diff > 0 else "Run camp to increase point in CNV"
-        ws_mismatch.cell(row, 14, note)
-        row += 1
+    ws_mismatch = _data_sheet(wb, "Points Mismatch", mismatch_headers, _MISMATCH_WIDTHS, _MISMATCH_FILL)
 
-    for col_letter, width in zip('ABCDEFGHIJKLMN', [15, 12, 25, 12, 10, 12, 12, 25, 12, 10, 14, 12, 10, 35]):
-        ws_mismatch.column_dimensions[col_letter].width = width
+    for m in (points_mismatch or []):
+        diff = m['diff']
+        ws_mismatch.append([
+            *_MISMATCH_FIELDS(m),
+            _styled_cell(ws_mismatch, diff, font=_DIFF_UP_FONT if diff > 0 else _DIFF_DOWN_FONT),
+            "Run camp to reduce point in CNV" if diff > 0 else "Run camp to increase point in CNV",
+        ])
 
     # ========================================================================
     # CNV USED POINTS > 0 SHEET
     # ========================================================================
-    ws_used = wb.create_sheet("CNV Used Points")
-
-    green_fill = PatternFill(start_color="166534", end_color="166534", fill_type="solid")
     used_headers = ['Customer ID', 'Phone', 'Name', 'Level', 'Email', 'Registration Date', 'Points', 'Used Points', 'Total Points']
-    for col_idx, header in enumerate(used_headers, 1):
-        cell = ws_used.cell(1, col_idx, header)
-        cell.fill = green_fill
-        cell.font = header_font
-        cell.alignment = header_align
-
-    row = 2
-    for cust in (cnv_used_points or []):
-        ws_used.cell(row, 1, cust.cnv_id)
-        ws_used.cell(row, 2, cust.phone)
-        ws_used.cell(row, 3, cust.full_name or '-')
-        ws_used.cell(row, 4, cust.level_name or '-')
-        ws_used.cell(row, 5, cust.email or '-')
-        ws_used.cell(row, 6, str(cust.cnv_created_at.date()) if cust.cnv_created_at else '-')
-        ws_used.cell(row, 7, float(cust.points or 0))
-        used_cell = ws_used.cell(row, 8, float(cust.used_points or 0))
-        used_cell.font = Font(bold=True, color="166534")
-        ws_used.cell(row, 9, float(cust.total_points or 0))
-        row += 1
-
-    ws_used.column_dimensions['A'].width = 15
-    ws_used.column_dimensions['B'].width = 15
-    ws_used.column_dimensions['C'].width = 25
-    ws_used.column_dimensions['D'].width = 12
-    ws_used.column_dimensions['E'].width = 30
-    ws_used.column_dimensions['F'].width = 18
-    ws_used.column_dimensions['G'].width = 12
-    ws_used.column_dimensions['H'].width = 14
-    ws_used.column_dimensions['I'].width = 14
+    ws_used = _data_sheet(wb, "CNV Used Points", used_headers, _USED_POINTS_WIDTHS, _USED_POINTS_FILL)
+
+    used_fields = ('cnv_id', 'phone', 'last_name', 'first_name', 'level_name', 'email', 'cnv_created_at',
+                   _float_or_zero('points'), _float_or_zero('used_points'), _float_or_zero('total_points'))
+    used_rows = (
+        cnv_used_points.values_list(*used_fields).iterator(chunk_size=2000)
+        if cnv_used_points is not None else ()
+    )
+    for (cnv_id, phone, last_name, first_name, level_name, email, cnv_created_at,
+         points, used_points, total_points) in used_rows:
+        ws_used.append([
+            cnv_id,
+            phone,
+            f"{last_name or ''} {first_name or ''}".strip() or '-',
+            level_name or '-',
+            email or '-',
+            _date_cell(ws_used, cnv_created_at and cnv_created_at.date()),
+            points,
+            _styled_cell(ws_used, used_points, font=_USED_POINTS_FONT),
+            total_points,
+        ])
 
     # ========================================================================
     # TOTAL POINTS MISMATCH SHEET  (POS.net_points vs CNV.total_points)
     # ========================================================================
-    ws_total_mismatch = wb.create_sheet("Total Points Mismatch")
+    ws_total_mismatch = _data_sheet(wb, "Total Points Mismatch", mismatch_headers, _MISMATCH_WIDTHS, _TOTAL_MISMATCH_FILL)
 
-    total_mismatch_headers = [
-        'Phone', 'POS VIP ID', 'POS Name', 'POS Grade', 'POS Points', 'POS Used Points',
-        'CNV ID', 'CNV Name', 'CNV Level', 'CNV Points', 'CNV Total Points', 'CNV Used Points',
-        'Diff Value', 'Diff Note'
-    ]
-    purple_fill = PatternFill(start_color="7C3AED", end_color="7C3AED", fill_type="solid")
-    for col_idx, header in enumerate(total_mismatch_headers, 1):
-        cell = ws_total_mismatch.cell(1, col_idx, header)
-        cell.fill = purple_fill
-        cell.font = header_font
-        cell.alignment = header_align
-
-    row = 2
     for m in (total_points_mismatch or []):
-        ws_total_mismatch.cell(row, 1, m.get('phone', ''))
-        ws_total_mismatch.cell(row, 2, m.get('pos_vip_id', ''))
-        ws_total_mismatch.cell(row, 3, m.get('pos_name', ''))
-        ws_total_mismatch.cell(row, 4, m.get('pos_grade', ''))
-        ws_total_mismatch.cell(row, 5, m.get('pos_points', 0))
-        ws_total_mismatch.cell(row, 6, m.get('pos_used_points', 0))
-        ws_total_mismatch.cell(row, 7, m.get('cnv_id', ''))
-        ws_total_mismatch.cell(row, 8, m.get('cnv_name', ''))
-        ws_total_mismatch.cell(row, 9, m.get('cnv_level', ''))
-        ws_total_mismatch.cell(row, 10, m.get('cnv_points', 0))
-        ws_total_mismatch.cell(row, 11, m.get('cnv_total_points', 0))
-        ws_total_mismatch.cell(row, 12, m.get('cnv_used_points', 0))
-        diff = m.get('diff', 0)
-        diff_cell = ws_total_mismatch.cell(row, 13, diff)
-        diff_cell.font = Font(bold=True, color="16A34A" if diff > 0 else "DC2626")
-        note = "Run camp to reduce point in CNV" if diff > 0 else "Run camp to increase point in CNV"
-        ws_total_mismatch.cell(row, 14, note)
-        row += 1
-
-    for col_letter, width in zip('ABCDEFGHIJKLMN', [15, 12, 25, 12, 10, 12, 12, 25, 12, 10, 14, 12, 10, 35]):
-        ws_total_mismatch.column_dimensions[col_letter].width = width
+        diff = m['diff']
+        ws_total_mismatch.append([
+            *_MISMATCH_FIELDS(m),
+            _styled_cell(ws_total_mismatch, diff, font=_DIFF_UP_FONT if diff > 0 else _DIFF_DOWN_FONT),
+            "Run camp to reduce point in CNV" if diff > 0 else "Run camp to increase point in CNV",
+        ])
 
     # ========================================================================
     # ZALO MINI APP SHEET
     # ========================================================================
-    zalo_blue_fill = PatternFill(start_color="0068FF", end_color="0068FF", fill_type="solid")
     zalo_headers = [
         'Customer ID', 'Phone', 'Full Name', 'Level', 'Email',
         'Reg Date', 'Points', 'Mini App', 'Follow OA', 'In POS'
     ]
 
-    ws_zalo_app = wb.create_sheet("Zalo Mini App")
-    for col_idx, header in enumerate(zalo_headers, 1):
-        cell = ws_zalo_app.cell(1, col_idx, header)
-        cell.fill = zalo_blue_fill
-        cell.font = header_font
-        cell.alignment = header_align
-    row = 2
-    for c in (zalo_mini_app_list or []):
+    def zalo_row(ws, c):
         full_name = f"{c.get('last_name') or ''} {c.get('first_name') or ''}".strip()
         reg_date = c.get('cnv_created_at')
-        reg_date_str = str(reg_date.date()) if hasattr(reg_date, 'date') else (str(reg_date)[:10] if reg_date else '-')
-        ws_zalo_app.cell(row, 1, c.get('cnv_id', ''))
-        ws_zalo_app.cell(row, 2, c.get('phone', ''))
-        ws_zalo_app.cell(row, 3, full_name or '-')
-        ws_zalo_app.cell(row, 4, c.get('level_name') or '-')
-        ws_zalo_app.cell(row, 5, c.get('email') or '-')
-        ws_zalo_app.cell(row, 6, reg_date_str)
-        ws_zalo_app.cell(row, 7, float(c.get('points') or 0))
-        ws_zalo_app.cell(row, 8, 'Yes' if c.get('zalo_app_id') else 'No')
-        ws_zalo_app.cell(row, 9, 'Yes' if c.get('zalo_oa_id') else 'No')
-        ws_zalo_app.cell(row, 10, 'Yes' if c.get('in_pos') else 'No')
-        row += 1
-    for col, w in zip('ABCDEFGHIJ', [15, 15, 25, 12, 30, 12, 10, 10, 10, 8]):
-        ws_zalo_app.column_dimensions[col].width = w
+        if hasattr(reg_date, 'date'):
+            reg_date_cell = _date_cell(ws, reg_date.date())
+        else:
+            reg_date_cell = str(reg_date)[:10] if reg_date else '-'
+        return [
+            c.get('cnv_id', ''),
+            c.get('phone', ''),
+            full_name or '-',
+            c.get('level_name') or '-',
+            c.get('email') or '-',
+            reg_date_cell,
+            float(c.get('points') or 0),
+            'Yes' if c.get('zalo_app_id') else 'No',
+            'Yes' if c.get('zalo_oa_id') else 'No',
+            'Yes' if c.get('in_pos') else 'No',
+        ]
+
+    ws_zalo_app = _data_sheet(wb, "Zalo Mini App", zalo_headers, _ZALO_WIDTHS, _ZALO_APP_FILL)
+    for c in (zalo_mini_app_list or []):
+        ws_zalo_app.append(zalo_row(ws_zalo_app, c))
 
     # ========================================================================
     # ZALO FOLLOW OA SHEET
     # ========================================================================
-    zalo_cyan_fill = PatternFill(start_color="00AAFF", end_color="00AAFF", fill_type="solid")
-    ws_zalo_oa = wb.create_sheet("Zalo Follow OA")
-    for col_idx, header in enumerate(zalo_headers, 1):
-        cell = ws_zalo_oa.cell(1, col_idx, header)
-        cell.fill = zalo_cyan_fill
-        cell.font = header_font
-        cell.alignment = header_align
-    row = 2
+    ws_zalo_oa = _data_sheet(wb, "Zalo Follow OA", zalo_headers, _ZALO_WIDTHS, _ZALO_OA_FILL)
     for c in (zalo_oa_list or []):
-        full_name = f"{c.get('last_name') or ''} {c.get('first_name') or ''}".strip()
-        reg_date = c.get('cnv_created_at')
-        reg_date_str = str(reg_date.date()) if hasattr(reg_date, 'date') else (str(reg_date)[:10] if reg_date else '-')
-        ws_zalo_oa.cell(row, 1, c.get('cnv_id', ''))
-        ws_zalo_oa.cell(row, 2, c.get('phone', ''))
-        ws_zalo_oa.cell(row, 3, full_name or '-')
-        ws_zalo_oa.cell(row, 4, c.get('level_name') or '-')
-        ws_zalo_oa.cell(row, 5, c.get('email') or '-')
-        ws_zalo_oa.cell(row, 6, reg_date_str)
-        ws_zalo_oa.cell(row, 7, float(c.get('points') or 0))
-        ws_zalo_oa.cell(row, 8, 'Yes' if c.get('zalo_app_id') else 'No')
-        ws_zalo_oa.cell(row, 9, 'Yes' if c.get('zalo_oa_id') else 'No')
-        ws_zalo_oa.cell(row, 10, 'Yes' if c.get('in_pos') else 'No')
-        row += 1
-    for col, w in zip('ABCDEFGHIJ', [15, 15, 25, 12, 30, 12, 10, 10, 10, 8]):
-        ws_zalo_oa.column_dimensions[col].width = w
+        ws_zalo_oa.append(zalo_row(ws_zalo_oa, c))
 
     # ========================================================================
     # ALL CNV CUSTOMERS SHEET (filtered by period if dates provided)
     # ========================================================================
-    cnv_all_fill = PatternFill(start_color="1D3557", end_color="1D3557", fill_type="solid")
     cnv_all_headers = [
         'Customer ID', 'Phone', 'Full Name', 'Level', 'Email',
         'Reg Date', 'Points', 'Used Points', 'Total Points',
@@ -1594,39 +1178,83 @@ def export_customer_comparison_to_excel(
     if len(sheet_title) > 31:
         sheet_title = sheet_title[:31]
 
-    ws_cnv_all_full = wb.create_sheet(sheet_title)
-    for col_idx, header in enumerate(cnv_all_headers, 1):
-        cell = ws_cnv_all_full.cell(1, col_idx, header)
-        cell.fill = cnv_all_fill
-        cell.font = header_font
-        cell.alignment = header_align
+    ws_cnv_all_full = _data_sheet(wb, sheet_title, cnv_all_headers, _CNV_ALL_WIDTHS, _CNV_ALL_FILL)
 
     cnv_all_qs = cnv_base.order_by('cnv_created_at')
     if date_from and date_to:
         cnv_all_qs = cnv_all_qs.filter(cnv_created_at__gte=date_from, cnv_created_at__lte=date_to)
 
-    row = 2
-    for cust in cnv_all_qs:
-        full_name = getattr(cust, 'full_name', None) or (
-            f"{cust.last_name or ''} {cust.first_name or ''}".strip()
-        )
-        ws_cnv_all_full.cell(row, 1, cust.cnv_id)
-        ws_cnv_all_full.cell(row, 2, cust.phone or '-')
-        ws_cnv_all_full.cell(row, 3, full_name or '-')
-        ws_cnv_all_full.cell(row, 4, cust.level_name or '-')
-        ws_cnv_all_full.cell(row, 5, cust.email or '-')
-        ws_cnv_all_full.cell(row, 6, str(cust.cnv_created_at.date()) if cust.cnv_created_at else '-')
-        ws_cnv_all_full.cell(row, 7, float(cust.points or 0))
-        ws_cnv_all_full.cell(row, 8, float(cust.used_points or 0))
-        ws_cnv_all_full.cell(row, 9, float(cust.total_points or 0))
-        ws_cnv_all_full.cell(row, 10, cust.zalo_app_id or '')
-        ws_cnv_all_full.cell(row, 11, cust.zalo_oa_id or '')
-        zalo_dt = cust.zalo_app_created_at
-        ws_cnv_all_full.cell(row, 12, str(zalo_dt.date()) if zalo_dt else '')
-        row += 1
+    cnv_all_fields = ('cnv_id', 'phone', 'last_name', 'first_name', 'level_name', 'email',
+                      'cnv_created_at', _float_or_zero('points'), _float_or_zero('used_points'),
+                      _float_or_zero('total_points'), 'zalo_app_id', 'zalo_oa_id', 'zalo_app_created_at')
+    for values in cnv_all_qs.values_list(*cnv_all_fields).iterator(chunk_size=2000):
+        (cnv_id, phone, last_name, first_name, level_name, email, cnv_created_at,
+         points, used_points, total_points, zalo_app_id, zalo_oa_id, zalo_dt) = values
+        ws_cnv_all_full.append([
+            cnv_id,
+            phone or '-',
+            f"{last_name or ''} {first_name or ''}".strip() or '-',
+            level_name or '-',
+            email or '-',
+            _date_cell(ws_cnv_all_full, cnv_created_at and cnv_created_at.date()),
+            points,
+            used_points,
+            total_points,
+            zalo_app_id or '',
+            zalo_oa_id or '',
+            _date_cell(ws_cnv_all_full, zalo_dt and zalo_dt.date(), default=''),
+        ])
+
+    # ========================================================================
+    # OVERVIEW SHEET (rows)
+    # ========================================================================
+    ws.append([_styled_cell(ws, "Customer Analytics - POS vs CNV Comparison", font=_TITLE_FONT)])
+    ws.merged_cells.add('A1:B1')
+    ws.append([])
+    
+    # Filter info
+    if date_from and date_to:
+        ws.append(["Period Filter:", _styled_cell(ws, f"{date_from} to {date_to}", font=_HIGHLIGHT_FONT)])
+    
+    ws.append([])
+    
+    # All-Time Metrics
+    ws.append([_styled_cell(ws, "All-Time Metrics", font=_BOLD_FONT)])
+    ws.append(["Total Customers (POS System)", total_pos])
+    ws.append(["Total CNV Customers", total_cnv])
+    ws.append(["POS Only (Not in CNV)", pos_only_count])
+    ws.append(["CNV Only (Not in POS)", cnv_only_count])
+    
+    # Period Metrics (if filtered)
+    if date_from and date_to:
+        ws.append([])
+        ws.append([_styled_cell(ws, "Period Metrics", font=_BOLD_FONT)])
+        ws.append(["New Customers (POS)", new_pos_count])
+        ws.append(["New CNV Customers", new_cnv_count])
+        ws.append(["New POS Only (Period)", pos_only_period_count])
+        ws.append(["New CNV Only (Period)", cnv_only_period_count])
+    
+    # Zalo All-Time Metrics
+    if zalo_stats:
+        ws.append([])
+        ws.append([_styled_cell(ws, "Zalo Metrics (All-Time)", font=_ZALO_FONT)])
+        ws.append(["Active Zalo Mini App", zalo_stats.get('zalo_app_all_count', 0)])
+        ws.append(["% Active Zalo / CNV", _percent_cell(ws, zalo_stats.get('zalo_app_all_pct', 0))])
+        ws.append(["Follow Zalo OA", zalo_stats.get('zalo_oa_all_count', 0)])
+        ws.append(["% Follow OA / CNV", _percent_cell(ws, zalo_stats.get('zalo_oa_all_pct', 0))])
 
-    for col, w in zip('ABCDEFGHIJKL', [15, 15, 25, 12, 30, 12, 10, 12, 12, 15, 15, 16]):
-        ws_cnv_all_full.column_dimensions[col].width = w
+        if date_from and date_to:
+            ws.append([])
+            ws.append([_styled_cell(ws, "Zalo Metrics (Period)", font=_ZALO_FONT)])
+            ws.append(["Active Zalo Mini App (Period)", zalo_stats.get('zalo_app_period_count', 0)])
+            ws.append(["% Zalo App / CNV (Period)", _percent_cell(ws, zalo_stats.get('zalo_app_period_pct', 0))])
+            ws.append(["Follow Zalo OA (Period)", zalo_stats.get('zalo_oa_period_count', 0)])
+            ws.append(["% Follow OA / CNV (Period)", _percent_cell(ws, zalo_stats.get('zalo_oa_period_pct', 0))])
+
+    if output is not None:
+        wb.save(output)
+        return None
+    return wb
 
 
 # ── Per-tab export ─────────────────────────────────────────────────────────────
@@ -1645,20 +1273,16 @@ _TAB_SHEETS = {
 }
 
 
-def _prepend_filter_info(wb, date_from=None, date_to=None, shop_group=None):
-    """Insert a filter-info row at the top of every sheet in the workbook."""
+def _filter_info_line(date_from=None, date_to=None, shop_group=None):
+    """Filter summary written as row 1 of every tab sheet, or None when unfiltered."""
     parts = []
     if date_from and date_to:
         parts.append(f"Period: {date_from} → {date_to}")
     if shop_group:
         parts.append(f"Shop Group: {shop_group}")
     if not parts:
-        return
-    line = "  |  ".join(parts)
-    for ws in wb.worksheets:
-        ws.insert_rows(1)
-        ws["A1"] = line
-        ws["A1"].font = Font(italic=True, color="888888", size=9)
+        return None
+    return "  |  ".join(parts)
 
 
 def export_tab_to_excel(tab, data, date_from=None, date_to=None, shop_group=None):
@@ -1666,121 +1290,141 @@ def export_tab_to_excel(tab, data, date_from=None, date_to=None, shop_group=None
     if tab not in _TAB_SHEETS:
         return None
 
-    wb = Workbook()
-    wb.remove(wb.active)  # drop default blank sheet
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    header_align = Alignment(horizontal="center", vertical="center")
-
+    wb = Workbook(write_only=True)
+    filter_line = _filter_info_line(date_from=date_from, date_to=date_to, shop_group=shop_group)
     creators, _ = _TAB_SHEETS[tab]
     for fn in creators:
-        fn(wb, data, header_fill, header_font, header_align)
+        fn(wb, data, filter_line=filter_line)
 
-    _prepend_filter_info(wb, date_from=date_from, date_to=date_to, shop_group=shop_group)
     return wb
 
 
+def export_analytics_to_excel_bytes(data, date_from=None, date_to=None, shop_group=None, tab=None):
+    """
+    Build the analytics workbook and return the saved .xlsx bytes.
+
+    With a known ``tab`` only that tab is exported (see export_tab_to_excel),
+    otherwise the full workbook. Bytes can be cached and served again
+    without rebuilding or re-serialising the workbook.
+    """
+    if tab in _TAB_SHEETS:
+        wb = export_tab_to_excel(tab, data, date_from=date_from, date_to=date_to, shop_group=shop_group)
+    else:
+        wb = export_analytics_to_excel(data, date_from=date_from, date_to=date_to, shop_group=shop_group)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
 # ── CNV per-tab export ────────────────────────────────────────────────────────
 
-def _cnv_hdr(ws, headers, fill, font, align):
-    for i, h in enumerate(headers, 1):
-        c = ws.cell(row=1, column=i, value=h)
-        c.fill = fill; c.font = font; c.alignment = align
-
-
-def _build_cnv_used_points_ws(wb, data, hf, font, align):
-    ws = wb.create_sheet("CNV Used Points")
-    _cnv_hdr(ws, ["Customer ID", "Phone", "Full Name", "Level", "Email",
-                  "Reg Date", "Points", "Used Pts", "Total Pts", "In POS"], hf, font, align)
-    for r, c in enumerate(data.get("cnv_used_points_list") or [], 2):
-        ws.cell(r, 1, c.get("cnv_id", ""))
-        ws.cell(r, 2, c.get("phone", ""))
-        ws.cell(r, 3, f"{c.get('last_name') or ''} {c.get('first_name') or ''}".strip())
-        ws.cell(r, 4, c.get("level_name", ""))
-        ws.cell(r, 5, c.get("email", "") or "")
-        ws.cell(r, 6, str(c["cnv_created_at"].date()) if c.get("cnv_created_at") else "")
-        ws.cell(r, 7, c.get("points") or 0)
-        ws.cell(r, 8, c.get("used_points") or 0)
-        ws.cell(r, 9, c.get("total_points") or 0)
-        ws.cell(r, 10, "Yes" if c.get("in_pos") else "No")
-    for col, w in zip("ABCDEFGHIJ", [14, 14, 22, 10, 28, 12, 10, 10, 10, 8]):
-        ws.column_dimensions[col].width = w
-
-
-def _build_mismatch_ws(wb, data, key, title, hf, font, align):
-    ws = wb.create_sheet(title)
-    _cnv_hdr(ws, ["Phone", "POS VIP ID", "POS Name", "POS Grade", "POS Pts", "POS Used Pts",
-                  "CNV ID", "CNV Name", "CNV Level", "CNV Pts", "CNV Total Pts", "CNV Used Pts", "Diff"],
-             hf, font, align)
-    for r, c in enumerate(data.get(key) or [], 2):
-        ws.cell(r, 1, c.get("phone", ""))
-        ws.cell(r, 2, c.get("pos_vip_id", ""))
-        ws.cell(r, 3, c.get("pos_name", ""))
-        ws.cell(r, 4, c.get("pos_grade", ""))
-        ws.cell(r, 5, c.get("pos_points") or 0)
-        ws.cell(r, 6, c.get("pos_used_points") or 0)
-        ws.cell(r, 7, c.get("cnv_id", ""))
-        ws.cell(r, 8, c.get("cnv_name", ""))
-        ws.cell(r, 9, c.get("cnv_level", ""))
-        ws.cell(r, 10, c.get("cnv_points") or 0)
-        ws.cell(r, 11, c.get("cnv_total_points") or 0)
-        ws.cell(r, 12, c.get("cnv_used_points") or 0)
-        ws.cell(r, 13, c.get("diff") or 0)
-    for col, w in zip("ABCDEFGHIJKLM", [14, 12, 22, 10, 10, 12, 14, 22, 10, 10, 12, 12, 10]):
-        ws.column_dimensions[col].width = w
-
-
-def _build_zalo_ws(wb, data, key, title, hf, font, align):
-    ws = wb.create_sheet(title)
-    _cnv_hdr(ws, ["Customer ID", "Phone", "Full Name", "Level", "Email",
-                  "Reg Date", "Points", "Zalo App ID", "Zalo OA ID", "In POS"], hf, font, align)
-    for r, c in enumerate(data.get(key) or [], 2):
-        ws.cell(r, 1, c.get("cnv_id", ""))
-        ws.cell(r, 2, c.get("phone", ""))
-        ws.cell(r, 3, f"{c.get('last_name') or ''} {c.get('first_name') or ''}".strip())
-        ws.cell(r, 4, c.get("level_name", ""))
-        ws.cell(r, 5, c.get("email", "") or "")
-        ws.cell(r, 6, str(c["cnv_created_at"].date()) if c.get("cnv_created_at") else "")
-        ws.cell(r, 7, c.get("points") or 0)
-        ws.cell(r, 8, c.get("zalo_app_id", "") or "")
-        ws.cell(r, 9, c.get("zalo_oa_id", "") or "")
-        ws.cell(r, 10, "Yes" if c.get("in_pos") else "No")
-    for col, w in zip("ABCDEFGHIJ", [14, 14, 22, 10, 28, 12, 10, 20, 20, 8]):
-        ws.column_dimensions[col].width = w
-
-
-def _build_pos_only_ws(wb, data, key, title, hf, font, align):
-    ws = wb.create_sheet(title)
-    _cnv_hdr(ws, ["VIP ID", "Phone", "Name", "Grade", "Email", "Reg Date", "Points"],
-             hf, font, align)
-    for r, c in enumerate(data.get(key) or [], 2):
-        ws.cell(r, 1, c.get("vip_id", ""))
-        ws.cell(r, 2, c.get("phone", ""))
-        ws.cell(r, 3, c.get("name", ""))
-        ws.cell(r, 4, c.get("vip_grade", ""))
-        ws.cell(r, 5, c.get("email", "") or "")
-        ws.cell(r, 6, str(c["registration_date"]) if c.get("registration_date") else "")
-        ws.cell(r, 7, c.get("points") or 0)
-    for col, w in zip("ABCDEFG", [12, 14, 22, 10, 28, 12, 10]):
-        ws.column_dimensions[col].width = w
-
-
-def _build_cnv_only_ws(wb, data, key, title, hf, font, align):
-    ws = wb.create_sheet(title)
-    _cnv_hdr(ws, ["Customer ID", "Phone", "Full Name", "Level", "Email",
-                  "Reg Date", "Points", "Used Pts", "Total Pts"], hf, font, align)
-    for r, c in enumerate(data.get(key) or [], 2):
-        ws.cell(r, 1, c.get("cnv_id", ""))
-        ws.cell(r, 2, c.get("phone", ""))
-        ws.cell(r, 3, f"{c.get('last_name') or ''} {c.get('first_name') or ''}".strip())
-        ws.cell(r, 4, c.get("level_name", ""))
-        ws.cell(r, 5, c.get("email", "") or "")
-        ws.cell(r, 6, str(c["cnv_created_at"].date()) if c.get("cnv_created_at") else "")
-        ws.cell(r, 7, c.get("points") or 0)
-        ws.cell(r, 8, c.get("used_points") or 0)
-        ws.cell(r, 9, c.get("total_points") or 0)
-    for col, w in zip("ABCDEFGHI", [14, 14, 22, 10, 28, 12, 10, 10, 10]):
-        ws.column_dimensions[col].width = w
+def _cnv_tab_sheet(wb, title, headers, widths, hf, font, align, filter_line=None):
+    """Write-only CNV tab sheet: widths, optional filter row, then the header row."""
+    ws = _analytics_sheet(wb, title, widths, filter_line)
+    ws.append(_header_cells(ws, headers, hf, font, align))
+    return ws
+
+
+def _cnv_full_name(c):
+    return f"{c.get('last_name') or ''} {c.get('first_name') or ''}".strip()
+
+
+def _build_cnv_used_points_ws(wb, data, hf, font, align, filter_line=None):
+    ws = _cnv_tab_sheet(wb, "CNV Used Points",
+                        ["Customer ID", "Phone", "Full Name", "Level", "Email",
+                         "Reg Date", "Points", "Used Pts", "Total Pts", "In POS"],
+                        [14, 14, 22, 10, 28, 12, 10, 10, 10, 8], hf, font, align, filter_line)
+    for c in data.get("cnv_used_points_list") or []:
+        ws.append([
+            c.get("cnv_id", ""),
+            c.get("phone", ""),
+            _cnv_full_name(c),
+            c.get("level_name", ""),
+            c.get("email", "") or "",
+            _date_cell(ws, c.get("cnv_created_at") and c["cnv_created_at"].date(), default=""),
+            c.get("points") or 0,
+            c.get("used_points") or 0,
+            c.get("total_points") or 0,
+            "Yes" if c.get("in_pos") else "No",
+        ])
+
+
+def _build_mismatch_ws(wb, data, key, title, hf, font, align, filter_line=None):
+    ws = _cnv_tab_sheet(wb, title,
+                        ["Phone", "POS VIP ID", "POS Name", "POS Grade", "POS Pts", "POS Used Pts",
+                         "CNV ID", "CNV Name", "CNV Level", "CNV Pts", "CNV Total Pts", "CNV Used Pts", "Diff"],
+                        [14, 12, 22, 10, 10, 12, 14, 22, 10, 10, 12, 12, 10], hf, font, align, filter_line)
+    for c in data.get(key) or []:
+        ws.append([
+            c.get("phone", ""),
+            c.get("pos_vip_id", ""),
+            c.get("pos_name", ""),
+            c.get("pos_grade", ""),
+            c.get("pos_points") or 0,
+            c.get("pos_used_points") or 0,
+            c.get("cnv_id", ""),
+            c.get("cnv_name", ""),
+            c.get("cnv_level", ""),
+            c.get("cnv_points") or 0,
+            c.get("cnv_total_points") or 0,
+            c.get("cnv_used_points") or 0,
+            c.get("diff") or 0,
+        ])
+
+
+def _build_zalo_ws(wb, data, key, title, hf, font, align, filter_line=None):
+    ws = _cnv_tab_sheet(wb, title,
+                        ["Customer ID", "Phone", "Full Name", "Level", "Email",
+                         "Reg Date", "Points", "Zalo App ID", "Zalo OA ID", "In POS"],
+                        [14, 14, 22, 10, 28, 12, 10, 20, 20, 8], hf, font, align, filter_line)
+    for c in data.get(key) or []:
+        ws.append([
+            c.get("cnv_id", ""),
+            c.get("phone", ""),
+            _cnv_full_name(c),
+            c.get("level_name", ""),
+            c.get("email", "") or "",
+            _date_cell(ws, c.get("cnv_created_at") and c["cnv_created_at"].date(), default=""),
+            c.get("points") or 0,
+            c.get("zalo_app_id", "") or "",
+            c.get("zalo_oa_id", "") or "",
+            "Yes" if c.get("in_pos") else "No",
+        ])
+
+
+def _build_pos_only_ws(wb, data, key, title, hf, font, align, filter_line=None):
+    ws = _cnv_tab_sheet(wb, title,
+                        ["VIP ID", "Phone", "Name", "Grade", "Email", "Reg Date", "Points"],
+                        [12, 14, 22, 10, 28, 12, 10], hf, font, align, filter_line)
+    for c in data.get(key) or []:
+        ws.append([
+            c.get("vip_id", ""),
+            c.get("phone", ""),
+            c.get("name", ""),
+            c.get("vip_grade", ""),
+            c.get("email", "") or "",
+            _date_cell(ws, c.get("registration_date"), default=""),
+            c.get("points") or 0,
+        ])
+
+
+def _build_cnv_only_ws(wb, data, key, title, hf, font, align, filter_line=None):
+    ws = _cnv_tab_sheet(wb, title,
+                        ["Customer ID", "Phone", "Full Name", "Level", "Email",
+                         "Reg Date", "Points", "Used Pts", "Total Pts"],
+                        [14, 14, 22, 10, 28, 12, 10, 10, 10], hf, font, align, filter_line)
+    for c in data.get(key) or []:
+        ws.append([
+            c.get("cnv_id", ""),
+            c.get("phone", ""),
+            _cnv_full_name(c),
+            c.get("level_name", ""),
+            c.get("email", "") or "",
+            _date_cell(ws, c.get("cnv_created_at") and c["cnv_created_at"].date(), default=""),
+            c.get("points") or 0,
+            c.get("used_points") or 0,
+            c.get("total_points") or 0,
+        ])
 
 
 _CNV_TAB_SHEETS = {
@@ -1795,22 +1439,23 @@ def export_cnv_tab_to_excel(tab, data, date_from=None, date_to=None):
     if tab not in _CNV_TAB_SHEETS:
         return None
 
-    wb = Workbook()
-    wb.remove(wb.active)
-    hf  = PatternFill(start_color="2c3e50", end_color="2c3e50", fill_type="solid")
-    fnt = Font(bold=True, color="FFFFFF")
-    aln = Alignment(horizontal="center", vertical="center")
+    wb = Workbook(write_only=True)
+    hf  = _CNV_TAB_FILL
+    fnt = _HEADER_FONT
+    aln = _HEADER_ALIGN
+    # Written as row 1 of every sheet; write-only sheets cannot insert rows later
+    fl  = _filter_info_line(date_from=date_from, date_to=date_to)
 
     builders = {
-        "cnv_used_points":     lambda: _build_cnv_used_points_ws(wb, data, hf, fnt, aln),
-        "points_mismatch":     lambda: _build_mismatch_ws(wb, data, "points_mismatch",       "Points Mismatch",       hf, fnt, aln),
-        "total_points_mismatch": lambda: _build_mismatch_ws(wb, data, "total_points_mismatch", "Total Points Mismatch", hf, fnt, aln),
-        "zalo_mini_app":       lambda: _build_zalo_ws(wb, data, "zalo_mini_app_list", "Zalo Mini App", hf, fnt, aln),
-        "zalo_oa":             lambda: _build_zalo_ws(wb, data, "zalo_oa_list",       "Zalo Follow OA",  hf, fnt, aln),
-        "pos_only_all":        lambda: _build_pos_only_ws(wb, data, "pos_only_all",    "POS Only - All Time",    hf, fnt, aln),
-        "cnv_only_all":        lambda: _build_cnv_only_ws(wb, data, "cnv_only_all",    "CNV Only - All Time",    hf, fnt, aln),
-        "pos_only_period":     lambda: _build_pos_only_ws(wb, data, "pos_only_period", "POS Only - Period",      hf, fnt, aln),
-        "cnv_only_period":     lambda: _build_cnv_only_ws(wb, data, "cnv_only_period", "CNV Only - Period",      hf, fnt, aln),
+        "cnv_used_points":     lambda: _build_cnv_used_points_ws(wb, data, hf, fnt, aln, fl),
+        "points_mismatch":     lambda: _build_mismatch_ws(wb, data, "points_mismatch",       "Points Mismatch",       hf, fnt, aln, fl),
+        "total_points_mismatch": lambda: _build_mismatch_ws(wb, data, "total_points_mismatch", "Total Points Mismatch", hf, fnt, aln, fl),
+        "zalo_mini_app":       lambda: _build_zalo_ws(wb, data, "zalo_mini_app_list", "Zalo Mini App", hf, fnt, aln, fl),
+        "zalo_oa":             lambda: _build_zalo_ws(wb, data, "zalo_oa_list",       "Zalo Follow OA",  hf, fnt, aln, fl),
+        "pos_only_all":        lambda: _build_pos_only_ws(wb, data, "pos_only_all",    "POS Only - All Time",    hf, fnt, aln, fl),
+        "cnv_only_all":        lambda: _build_cnv_only_ws(wb, data, "cnv_only_all",    "CNV Only - All Time",    hf, fnt, aln, fl),
+        "pos_only_period":     lambda: _build_pos_only_ws(wb, data, "pos_only_period", "POS Only - Period",      hf, fnt, aln, fl),
+        "cnv_only_period":     lambda: _build_cnv_only_ws(wb, data, "cnv_only_period", "CNV Only - Period",      hf, fnt, aln, fl),
     }
 
     for key in _CNV_TAB_SHEETS[tab]:
@@ -1819,15 +1464,4 @@ def export_cnv_tab_to_excel(tab, data, date_from=None, date_to=None):
             continue
         builders[key]()
 
-    # filter info row
-    parts = []
-    if date_from and date_to:
-        parts.append(f"Period: {date_from} → {date_to}")
-    if parts:
-        line = "  |  ".join(parts)
-        for ws in wb.worksheets:
-            ws.insert_rows(1)
-            ws["A1"] = line
-            ws["A1"].font = Font(italic=True, color="888888", size=9)
-
-    return wb
\ No newline at end of file
+    return wb
@@ -7,6 +7,7 @@ Pure functions with no database or model dependencies.
 Version: 3.3
 """
 import datetime
+from functools import lru_cache
 
 # Season definitions
 SEASON_DEFS = [
@@ -16,6 +17,17 @@ SEASON_DEFS = [
     ('M11-1', [11, 12, 1]),    # Nov-Jan (crosses year boundary)
 ]
 
+# Month number (1-12) -> season prefix, built from SEASON_DEFS; index 0 unused
+_MONTH_TO_SEASON = [None] * 13
+for _prefix, _months in SEASON_DEFS:
+    for _m in _months:
+        _MONTH_TO_SEASON[_m] = _prefix
+_MONTH_TO_SEASON = tuple(_MONTH_TO_SEASON)
+del _prefix, _months, _m
+
+# Season prefix -> position within its year, for chronological sorting
+_SEASON_ORDER = {prefix: i for i, (prefix, _) in enumerate(SEASON_DEFS)}
+
 
 def get_session_key(d):
     """
@@ -37,20 +49,21 @@ def get_session_key(d):
     """
     if not d:
         return 'Unknown'
-    
-    m, y = d.month, d.year
-    
-    for prefix, months in SEASON_DEFS:
-        if m in months:
-            if prefix == 'M11-1':
-                # Cross-year season: Nov-Jan
-                # If January, belongs to Nov-Dec of previous year
-                return f"M11-1 {y-1}-{y}" if m == 1 else f"M11-1 {y}-{y+1}"
-            return f"{prefix} {y}"
-    
-    return 'Unknown'
+    return _session_label(d.year, d.month)
+
+
+@lru_cache(maxsize=None)
+def _session_label(y, m):
+    """Season label for a (year, month); every day of a month shares it."""
+    prefix = _MONTH_TO_SEASON[m]
+    if prefix == 'M11-1':
+        # Cross-year season: Nov-Jan
+        # If January, belongs to Nov-Dec of previous year
+        return f"M11-1 {y-1}-{y}" if m == 1 else f"M11-1 {y}-{y+1}"
+    return f"{prefix} {y}"
 
 
+@lru_cache(maxsize=None)
 def session_sort_key(label):
     """
     Generate sort key for season labels to order chronologically.
@@ -79,8 +92,7 @@ def session_sort_key(label):
         return (9999, 99)
     
     # Season order within a year
-    order_map = {'M2-4': 0, 'M5-7': 1, 'M8-10': 2, 'M11-1': 3}
-    season_order = order_map.get(prefix, 99)
+    season_order = _SEASON_ORDER.get(prefix, 99)
     
     return (first_year, season_order)
 
@@ -89,7 +101,13 @@ def get_month_key(d):
     """Convert a date to a month label like '2025-01'."""
     if not d:
         return 'Unknown'
-    return d.strftime('%Y-%m')
+    return _month_label(d.year, d.month)
+
+
+@lru_cache(maxsize=None)
+def _month_label(y, m):
+    """Month label for a (year, month), formatted once per month."""
+    return datetime.date(y, m, 1).strftime('%Y-%m')
 
 
 def month_sort_key(label):
@@ -136,24 +154,20 @@ def get_session_for_range(date_from, date_to):
     """
     if not date_from or not date_to:
         return None
-    
-    # Get all months in the range
-    months = set()
-    cur = date_from.replace(day=1)
-    
-    while cur <= date_to:
-        months.add(cur.month)
-        # Move to next month
-        if cur.month == 12:
-            cur = cur.replace(year=cur.year + 1, month=1)
-        else:
-            cur = cur.replace(month=cur.month + 1)
-    
-    # Check if all months fit in a single season
-    for label, m_list in SEASON_DEFS:
-        if months.issubset(set(m_list)):
-            return label
 
+    # Months as a running index (year * 12 + month - 1); a season is three
+    # months long, so a span touching four or more months never fits one
+    start = date_from.year * 12 + date_from.month - 1
+    end = date_to.year * 12 + date_to.month - 1
+    if end < start:
+        # No month in range; the empty set fits the first season
+        return SEASON_DEFS[0][0]
+    if end - start >= 3:
+        return None
+
+    prefixes = {_MONTH_TO_SEASON[i % 12 + 1] for i in range(start, end + 1)}
+    if len(prefixes) == 1:
+        return prefixes.pop()
     return None
 
 
@@ -5,6 +5,7 @@ CORRECTED: Safe argv checking to prevent IndexError.
 """
 from django.apps import AppConfig
 import logging
+import os
 import sys
 
 logger = logging.getLogger(__name__)
@@ -19,22 +20,26 @@ class AppConfig(AppConfig):
         Called when Django starts.
         Auto-start CNV sync scheduler in production.
         """
-        # Safe check for runserver or gunicorn
-        should_start_scheduler = False
-        
-        if 'runserver' in sys.argv:
-            should_start_scheduler = True
-        elif sys.argv and len(sys.argv) > 0:
-            # Check if gunicorn (safely)
-            if 'gunicorn' in sys.argv[0]:
-                should_start_scheduler = True
-        
+        # Safe check for runserver or gunicorn (argv may be empty)
+        is_runserver = 'runserver' in sys.argv
+        should_start_scheduler = is_runserver or (
+            bool(sys.argv) and 'gunicorn' in sys.argv[0]
+        )
+
+        # With the autoreloader, ready() also runs in the watcher parent,
+        # which never reloads; only the serving child (RUN_MAIN) may own
+        # the scheduler so jobs pick up reloaded code
+        if is_runserver and '--noreload' not in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+            should_start_scheduler = False
+
         if should_start_scheduler:
             try:
                 from App.cnv.scheduler import start_scheduler
                 logger.info("Starting CNV sync scheduler...")
-                start_scheduler()
-                logger.info("CNV sync scheduler started successfully")
+                if start_scheduler() is not None:
+                    logger.info("CNV sync scheduler started successfully")
+                else:
+                    logger.info("CNV sync scheduler runs in another process")
             except Exception as e:
                 logger.error(f"Failed to start CNV scheduler: {e}", exc_info=True)
         else:
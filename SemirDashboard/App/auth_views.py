@@ -1,4 +1,4 @@
-from django.contrib.auth import login, logout, authenticate
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.shortcuts import render, redirect
@@ -25,24 +25,21 @@ def login_view(request):
 
     if request.method == 'POST':
         form = AuthenticationForm(request, data=request.POST)
+        # is_valid() already runs authenticate(); reuse its user instead of
+        # hashing the password a second time
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
-
-            if user is not None:
-                login(request, user)
-                logger.info(f'User {username} logged in successfully')
+            user = form.get_user()
+            username = user.get_username()
+            login(request, user)
+            logger.info(f'User {username} logged in successfully')
 
-                # Regenerate session key for security
-                request.session.cycle_key()
+            # Regenerate session key for security
+            request.session.cycle_key()
 
-                next_url = request.GET.get('next', 'analytics_dashboard')
-                return redirect(next_url)
-            else:
-                logger.warning(f'Failed login attempt for username: {username}')
-                messages.error(request, 'Invalid username or password')
+            next_url = request.GET.get('next', 'analytics_dashboard')
+            return redirect(next_url)
         else:
+            logger.warning(f"Failed login attempt for username: {request.POST.get('username', '')}")
             messages.error(request, 'Invalid username or password')
     else:
         form = AuthenticationForm()
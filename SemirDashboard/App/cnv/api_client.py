@@ -5,16 +5,41 @@ Production-ready CNV Loyalty API client.
 Handles OAuth2 authorization code flow and API requests.
 """
 import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import requests
 from datetime import datetime, timezone
 from typing import Dict, List, Optional
 from django.core.cache import cache
-from urllib.parse import urlparse, parse_qs
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib.parse import unquote_plus
+from urllib3.util.retry import Retry
+from lxml import etree, html as lxml_html
 import secrets
+import time
 
 logger = logging.getLogger(__name__)
 
+# Authorization code query parameter in a redirect URL
+_CODE_RE = re.compile(r'[?&]code=([^&#\s]+)')
+
+
+def _extract_code(url: str) -> Optional[str]:
+    """Return the decoded ?code= value from a URL, if present."""
+    match = _CODE_RE.search(url)
+    return unquote_plus(match.group(1)) if match else None
+
+
+def _format_utc(dt: Optional[datetime]) -> Optional[str]:
+    """Format a datetime for API filters as UTC with Z suffix (naive = UTC)."""
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
 
 class CNVAPIClient:
     """
@@ -27,12 +52,21 @@ class CNVAPIClient:
     - Support for customers and orders endpoints
     
     Usage:
-        client = CNVAPIClient(username="user@example.com", password="secret")
-        customers = client.fetch_all_customers(max_pages=5)
+        with CNVAPIClient(username="user@example.com", password="secret") as client:
+            customers = client.fetch_all_customers(max_pages=5)
     """
     
     # API configuration
     PAGE_SIZE = 100  # Records per page
+    POOL_MAXSIZE = 20  # Keep-alive connections per host
+    FETCH_WORKERS = 8  # Pages requested concurrently (must not exceed POOL_MAXSIZE)
+    TOKEN_REFRESH_SKEW = 300  # Refresh tokens this many seconds before expiry
+    TOKEN_MIN_VALIDITY = 60  # Requests never go out with less validity than this
+    
+    # One lock per username, shared by every client in the process, so
+    # concurrent cache misses run a single OAuth login between them
+    _auth_locks: Dict[str, threading.Lock] = {}
+    _auth_locks_guard = threading.Lock()
     
     def __init__(self, username: str, password: str):
         """
@@ -52,41 +86,161 @@ class CNVAPIClient:
         self.client_secret = "***REDACTED_CLIENT_SECRET***"
         self.redirect_uri = "http://localhost:5000/callback"
         
+        # One keep-alive session for every API and token call, so paginated
+        # fetches reuse TCP/TLS connections instead of reconnecting per page.
+        # Only idempotent requests are retried (urllib3 default methods).
+        self._session = requests.Session()
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.POOL_MAXSIZE, max_retries=retry)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._session.headers.update({
+            'Accept': 'application/json',
+            'User-Agent': 'SemirDashboard/1.0',
+        })
+        
+        # Token in use by this client and its monotonic deadline, so page
+        # requests skip the cache backend until the token nears expiry
+        self._token: Optional[str] = None
+        self._token_exp: float = 0.0
+        
+        # First endpoint that answered for each resource, so paginated
+        # fetches stop probing the fallback on every page
+        self._customer_endpoint: Optional[str] = None
+        self._order_endpoint: Optional[str] = None
+        
         logger.info(f"CNVAPIClient initialized for user: {username}")
     
+    def close(self):
+        """Close the pooled HTTP session."""
+        self._session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def _get_cached_entry(self) -> Optional[tuple]:
+        """Return the cached (token, expires_at_epoch) pair, if any."""
+        entry = cache.get(f'cnv_token_{self.username}')
+        if isinstance(entry, str):
+            # Token cached before expiry was stored alongside it
+            return (entry, None)
+        return entry
+    
     def _get_cached_token(self) -> Optional[str]:
-        """Retrieve cached access token if available and valid."""
-        cache_key = f'cnv_token_{self.username}'
-        return cache.get(cache_key)
+        """Retrieve cached access token if available and still usable."""
+        entry = self._get_cached_entry()
+        if not entry:
+            return None
+        token, expires_at = entry
+        if expires_at is not None and expires_at - time.time() < self.TOKEN_MIN_VALIDITY:
+            return None
+        return token
+    
+    def _current_token(self) -> str:
+        """Return the token for the next request, re-reading the cache only near expiry."""
+        # Read once: a page worker that gets a 401 clears self._token
+        token, token_exp = self._token, self._token_exp
+        if token and time.monotonic() < token_exp:
+            return token
+        
+        token = self._get_cached_token() or self.authenticate()
+        entry = self._get_cached_entry()
+        expires_at = entry[1] if entry and entry[0] == token else None
+        if expires_at is not None:
+            ttl = expires_at - time.time() - self.TOKEN_MIN_VALIDITY
+        else:
+            ttl = self.TOKEN_REFRESH_SKEW  # Unknown expiry: check again later
+        
+        self._token = token
+        self._token_exp = time.monotonic() + ttl
+        return token
+    
+    def _token_needs_refresh(self, skew: int = TOKEN_REFRESH_SKEW) -> bool:
+        """True if there is no cached token or it expires within skew seconds."""
+        entry = self._get_cached_entry()
+        if not entry:
+            return True
+        expires_at = entry[1]
+        return expires_at is not None and expires_at - time.time() < skew
     
     def _cache_token(self, token: str, expires_in: int):
         """
-        Cache access token with expiration.
+        Cache access token together with its expiry time.
         
         Args:
             token: Access token to cache
             expires_in: Token lifetime in seconds
         """
         cache_key = f'cnv_token_{self.username}'
-        cache_duration = max(expires_in - 300, 300)  # 5 min buffer
-        cache.set(cache_key, token, cache_duration)
+        cache.set(cache_key, (token, time.time() + expires_in), expires_in)
         logger.info(f"Token cached (expires in ~{expires_in/86400:.0f} days)")
     
-    def authenticate(self) -> str:
+    def _reusable_token(self, skew: int, rejected_token: Optional[str] = None) -> Optional[str]:
+        """Return the cached token unless it is near expiry or was rejected."""
+        if self._token_needs_refresh(skew):
+            return None
+        cached = self._get_cached_token()
+        if cached and cached != rejected_token:
+            return cached
+        return None
+    
+    def authenticate(self, force: bool = False, skew: int = TOKEN_REFRESH_SKEW,
+                     rejected_token: Optional[str] = None) -> str:
         """
         Authenticate and obtain access token via OAuth2 authorization code flow.
         
+        The cached token is reused unless it expires within ``skew`` seconds.
+        The scheduler calls this with a wide skew so tokens are renewed in the
+        background before API requests ever see them expire.
+        
+        Args:
+            force: Log in again even if the cached token looks valid
+            skew: Refresh window in seconds before the token expires
+            rejected_token: Token the API just refused; only that token is
+                replaced, so concurrent 401s share one login
+        
         Returns:
             Access token string
         """
         # Check cache first
-        cached = self._get_cached_token()
-        if cached:
-            return cached
+        if not force:
+            cached = self._reusable_token(skew, rejected_token)
+            if cached:
+                return cached
+        
+        # Slow path: re-check under the per-user lock, since another thread
+        # may have finished logging in while this one waited
+        with self._get_auth_lock():
+            if not force:
+                cached = self._reusable_token(skew, rejected_token)
+                if cached:
+                    return cached
+            return self._oauth_login()
+    
+    def _get_auth_lock(self) -> threading.Lock:
+        """Return the process-wide authentication lock for this username."""
+        with self._auth_locks_guard:
+            return self._auth_locks.setdefault(self.username, threading.Lock())
+    
+    def _oauth_login(self) -> str:
+        """
+        Run the full OAuth2 login and cache the resulting token.
         
+        Returns:
+            Access token string
+        """
         logger.info("Starting OAuth2 authentication...")
         
         session = requests.Session()
+        session.max_redirects = 5
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
@@ -106,11 +260,13 @@ class CNVAPIClient:
             response = session.get(oauth_url, params=oauth_params, allow_redirects=True)
             logger.info(f"OAuth initiated (status: {response.status_code})")
             
-            # Step 2: Parse login form
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.find('form')
+            # Step 2: Parse login form (lxml, C parser)
+            try:
+                form = lxml_html.fromstring(response.content).find('.//form')
+            except (etree.ParserError, ValueError):
+                form = None
             
-            if not form:
+            if form is None:
                 raise ValueError("Login form not found")
             
             # Get form action URL
@@ -125,31 +281,29 @@ class CNVAPIClient:
             else:
                 login_url = response.url
             
-            # Build form data from actual form fields
+            # Build form data from actual form fields, in a single pass:
+            # all hidden fields, plus the first username and password inputs
             form_data = {}
+            username_field = password_field = None
+            username_found = password_found = False
             
-            # Add all hidden fields
-            for hidden_field in form.find_all('input', type='hidden'):
-                field_name = hidden_field.get('name')
-                field_value = hidden_field.get('value', '')
-                if field_name:
-                    form_data[field_name] = field_value
-            
-            # Find username field
-            username_field = None
-            for input_field in form.find_all('input'):
-                input_type = input_field.get('type', '').lower()
-                input_name = input_field.get('name', '').lower()
+            for input_field in form.iter('input'):
+                field_type = input_field.get('type', '')
+                field_name = input_field.get('name')
                 
-                if input_type in ['text', 'email'] or 'user' in input_name or 'email' in input_name or 'login' in input_name:
-                    username_field = input_field.get('name')
-                    break
-            
-            # Find password field
-            password_field = None
-            for input_field in form.find_all('input', type='password'):
-                password_field = input_field.get('name')
-                break
+                if field_type == 'hidden' and field_name:
+                    form_data[field_name] = input_field.get('value', '')
+                
+                if not username_found:
+                    input_type = field_type.lower()
+                    input_name = (field_name or '').lower()
+                    if input_type in ['text', 'email'] or 'user' in input_name or 'email' in input_name or 'login' in input_name:
+                        username_field = field_name
+                        username_found = True
+                
+                if not password_found and field_type == 'password':
+                    password_field = field_name
+                    password_found = True
             
             # Add credentials to form data
             if username_field:
@@ -163,55 +317,49 @@ class CNVAPIClient:
             else:
                 form_data['password'] = self.password
             
-            # Step 3: Submit login form
-            response = session.post(
-                login_url,
-                data=form_data,
-                allow_redirects=False,  # Don't follow - need to extract code
-                timeout=30
-            )
-            logger.info(f"Login submitted (status: {response.status_code})")
+            # Step 3: Submit login form and let requests follow the redirects.
+            # The hook takes the code from the Location that points at
+            # redirect_uri and drops that header, so the walk stops there
+            # instead of calling the (unserved) local callback. Every other
+            # hop is followed with a body-less GET, as the old manual loop did.
+            captured_codes = []
             
-            # Step 4: Follow redirects to extract authorization code
-            authorization_code = None
-            max_redirects = 5
-            redirect_count = 0
+            def _capture_code(resp, *args, **kwargs):
+                location = resp.headers.get('Location')
+                if not (resp.is_redirect and location):
+                    return resp
+                if location.startswith(self.redirect_uri):
+                    code = _extract_code(location)
+                    if code:
+                        captured_codes.append(code)
+                        del resp.headers['Location']
+                        return resp
+                if resp.status_code in (307, 308):
+                    # requests would re-send the POST body (the credentials)
+                    # on a 307/308; as a 303 it follows with a plain GET
+                    resp.status_code = 303
+                return resp
             
-            while redirect_count < max_redirects:
-                if response.status_code not in [301, 302, 303, 307, 308]:
-                    break
-                
-                redirect_url = response.headers.get('Location', '')
-                if not redirect_url:
-                    break
-                
-                # Make redirect URL absolute
-                if redirect_url.startswith('http'):
-                    full_redirect_url = redirect_url
-                elif redirect_url.startswith('/'):
-                    full_redirect_url = f"{self.sso_url}{redirect_url}"
-                else:
-                    full_redirect_url = f"{self.sso_url}/{redirect_url}"
-                
-                # Parse query parameters from redirect URL
-                parsed = urlparse(full_redirect_url)
-                query_params = parse_qs(parsed.query)
-                
-                # Check if code is in this redirect
-                code_in_url = query_params.get('code', [None])[0]
-                if code_in_url:
-                    authorization_code = code_in_url
-                    logger.info(f"Authorization code obtained (redirect #{redirect_count + 1})")
-                    break
-                
-                # Follow this redirect
-                response = session.get(
-                    full_redirect_url,
-                    allow_redirects=False,
+            try:
+                response = session.post(
+                    login_url,
+                    data=form_data,
+                    hooks={'response': _capture_code},
                     timeout=30
                 )
-                
-                redirect_count += 1
+                logger.info(f"Login submitted (status: {response.status_code})")
+                history = response.history + [response]
+            except requests.TooManyRedirects:
+                history = []
+            
+            # Step 4: Take the captured code, else any landing URL carrying one
+            authorization_code = captured_codes[0] if captured_codes else None
+            for resp in history:
+                if authorization_code:
+                    break
+                authorization_code = _extract_code(resp.url)
+            if authorization_code:
+                logger.info(f"Authorization code obtained (after {len(history)} responses)")
             
             if not authorization_code:
                 raise ValueError("Failed to obtain authorization code")
@@ -226,7 +374,7 @@ class CNVAPIClient:
             }
             
             token_url = f"{self.sso_url}/oauth/token"
-            token_response = requests.get(
+            token_response = self._session.get(
                 token_url,
                 params=token_params,
                 timeout=30
@@ -235,7 +383,7 @@ class CNVAPIClient:
             if token_response.status_code != 200:
                 raise ValueError(f"Token exchange failed: {token_response.status_code}")
             
-            token_data = token_response.json()
+            token_data = orjson.loads(token_response.content)
             access_token = token_data.get('access_token')
             expires_in = token_data.get('expires_in', 2592000)
             
@@ -251,8 +399,81 @@ class CNVAPIClient:
             logger.error(f"Authentication failed: {e}")
             raise
         finally:
+            # Only the throwaway login session; the pooled API session stays open
             session.close()
     
+    def _iter_pages(self, fetch_page, items_key: str, max_pages: int):
+        """
+        Fetch consecutive pages concurrently, FETCH_WORKERS pages at a time.
+        
+        Pages are yielded in page order with the same stop rules as a
+        sequential loop (empty page, no more pages, or an error), so the last
+        window may request a few pages past the end that are then discarded.
+        At most one window of responses is held at a time.
+        
+        Args:
+            fetch_page: Callable taking a page number and returning the response
+            items_key: Response key holding the records ('customers', 'orders')
+            max_pages: Highest page number to fetch
+            
+        Yields:
+            List of record dicts, one list per page
+        """
+        total = 0
+        page = 1
+        
+        # Resolve the token once up front rather than in every worker
+        try:
+            self._current_token()
+        except Exception as e:
+            logger.error(f"Failed to fetch page {page}: {e}")
+            return
+        
+        with ThreadPoolExecutor(max_workers=self.FETCH_WORKERS) as executor:
+            while page <= max_pages:
+                window = range(page, min(page + self.FETCH_WORKERS, max_pages + 1))
+                futures = [executor.submit(fetch_page, p) for p in window]
+                
+                for i, page in enumerate(window):
+                    try:
+                        response = futures[i].result()
+                    except Exception as e:
+                        logger.error(f"Failed to fetch page {page}: {e}")
+                        return
+                    futures[i] = None  # Drop the response once consumed
+                    
+                    # Extract records from response
+                    items = []
+                    if isinstance(response, list):
+                        items = response
+                    elif isinstance(response, dict):
+                        items = response.get('data') or response.get(items_key) or []
+                    
+                    if not items:
+                        logger.info(f"  Page {page}: No more {items_key}")
+                        return
+                    
+                    total += len(items)
+                    logger.info(f"  Page {page}: {len(items)} {items_key} (total: {total})")
+                    yield items
+                    
+                    # Check if more pages exist
+                    has_more = False
+                    if isinstance(response, dict):
+                        pagination = response.get('pagination', {})
+                        has_more = pagination.get('has_more') or pagination.get('hasMore') or False
+                        
+                        if not pagination and len(items) >= self.PAGE_SIZE:
+                            has_more = True
+                    
+                    if not has_more:
+                        logger.info(f"  No more pages available")
+                        return
+                
+                page = window.stop
+        
+        logger.info(f"Reached max pages limit ({max_pages})")
+    
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict:
         """
         Make authenticated API request.
@@ -265,16 +486,15 @@ class CNVAPIClient:
         Returns:
             Parsed JSON response
         """
-        token = self.authenticate()
+        # Any still-valid token will do here; renewal ahead of expiry is the
+        # scheduler's job, so pagination loops never wait on a login
+        token = self._current_token()
         
         url = f"{self.base_url}{endpoint}"
         headers = kwargs.pop('headers', {})
-        headers.update({
-            'Authorization': f'TOKEN {token}',
-            'Accept': 'application/json',
-        })
+        headers['Authorization'] = f'TOKEN {token}'
         
-        response = requests.request(
+        response = self._session.request(
             method=method,
             url=url,
             headers=headers,
@@ -282,15 +502,72 @@ class CNVAPIClient:
             **kwargs
         )
         
+        if response.status_code == 401:
+            # Token revoked or expired early: log in again and retry once.
+            # Other page workers may hit the same 401; whichever takes the
+            # auth lock first logs in and the rest reuse its token.
+            logger.warning("API returned 401 - refreshing token")
+            self._token = None
+            token = self.authenticate(rejected_token=token)
+            headers['Authorization'] = f'TOKEN {token}'
+            response = self._session.request(
+                method=method,
+                url=url,
+                headers=headers,
+                timeout=60,
+                **kwargs
+            )
+        
         if response.status_code != 200:
             logger.error(f"API error {response.status_code}: {response.text[:200]}")
             response.raise_for_status()
         
-        return response.json()
+        # orjson decodes large order pages several times faster than json
+        return orjson.loads(response.content)
+    
+    def _get_resource(self, attr: str, endpoints: List[str], params: Dict, label: str) -> Dict:
+        """
+        GET from the endpoint learned for a resource, discovering it if needed.
+        
+        The learned endpoint (stored on ``attr``) is used directly; it is only
+        forgotten when it answers 404/410, after which the candidates are tried
+        again in order.
+        
+        Args:
+            attr: Instance attribute holding the learned endpoint
+            endpoints: Candidate endpoints, preferred first
+            params: Query parameters
+            label: Resource name for error messages
+            
+        Returns:
+            Parsed JSON response
+        """
+        endpoint = getattr(self, attr)
+        if endpoint:
+            try:
+                return self._make_request('GET', endpoint, params=params)
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in (404, 410):
+                    raise
+                logger.warning(f"{endpoint} returned {status} - trying other {label} endpoints")
+                setattr(self, attr, None)
+        
+        for endpoint in endpoints:
+            try:
+                response = self._make_request('GET', endpoint, params=params)
+            except Exception as e:
+                logger.warning(f"{endpoint} failed: {e}")
+                continue
+            setattr(self, attr, endpoint)
+            return response
+        
+        raise ValueError(f"All {label} endpoints failed")
     
     def get_customers(self, page: int = 1, page_size: int = 100,
                      updated_since: Optional[datetime] = None,
-                     ids: Optional[List[int]] = None) -> Dict:
+                     ids: Optional[List[int]] = None,
+                     updated_at_from: Optional[str] = None) -> Dict:
         """
         Fetch single page of customers.
         
@@ -299,6 +576,7 @@ class CNVAPIClient:
             page_size: Number of records per page
             updated_since: Only return customers updated after this datetime
             ids: List of customer IDs to fetch (max 100)
+            updated_at_from: Pre-formatted updated_since (see _format_utc)
             
         Returns:
             API response dict with customer data
@@ -313,31 +591,22 @@ class CNVAPIClient:
             # Pass ids as comma-separated string
             params['ids'] = ','.join(map(str, ids))
         
-        if updated_since:
-            # Format datetime for API (use Z suffix for UTC)
-            if updated_since.tzinfo is not None:
-                # Convert to UTC and format with Z suffix
-                utc_dt = updated_since.astimezone(timezone.utc)
-                params['updated_at_from'] = utc_dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            else:
-                # Assume UTC if naive
-                params['updated_at_from'] = updated_since.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        updated_at_from = updated_at_from or _format_utc(updated_since)
+        if updated_at_from:
+            params['updated_at_from'] = updated_at_from
         
         # Try .json endpoint first (per Swagger docs)
-        for endpoint in ['/customers.json', '/api/customers']:
-            try:
-                return self._make_request('GET', endpoint, params=params)
-            except Exception as e:
-                logger.warning(f"{endpoint} failed: {e}")
-                continue
-        
-        raise ValueError("All customer endpoints failed")
+        return self._get_resource(
+            '_customer_endpoint', ['/customers.json', '/api/customers'], params, 'customer'
+        )
     
     def get_orders(self, page: int = 1, page_size: int = 100,
                   start_date: Optional[datetime] = None,
                   end_date: Optional[datetime] = None,
                   updated_since: Optional[datetime] = None,
-                  updated_until: Optional[datetime] = None) -> Dict:
+                  updated_until: Optional[datetime] = None,
+                  updated_at_from: Optional[str] = None,
+                  updated_at_to: Optional[str] = None) -> Dict:
         """
         Fetch single page of orders.
         
@@ -348,6 +617,8 @@ class CNVAPIClient:
             end_date: Filter orders until this date
             updated_since: Only return orders updated after this datetime
             updated_until: Only return orders updated before this datetime
+            updated_at_from: Pre-formatted updated_since (see _format_utc)
+            updated_at_to: Pre-formatted updated_until (see _format_utc)
             
         Returns:
             API response dict with order data
@@ -362,32 +633,41 @@ class CNVAPIClient:
             params['start_date'] = start_date.strftime('%Y-%m-%d')
         if end_date:
             params['end_date'] = end_date.strftime('%Y-%m-%d')
-        if updated_since:
-            # Format datetime for API (use Z suffix for UTC)
-            if updated_since.tzinfo is not None:
-                # Convert to UTC and format with Z suffix
-                utc_dt = updated_since.astimezone(timezone.utc)
-                params['updated_at_from'] = utc_dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            else:
-                # Assume UTC if naive
-                params['updated_at_from'] = updated_since.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        if updated_until:
-            # Format datetime for API (use Z suffix for UTC)
-            if updated_until.tzinfo is not None:
-                utc_dt = updated_until.astimezone(timezone.utc)
-                params['updated_at_to'] = utc_dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            else:
-                params['updated_at_to'] = updated_until.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        updated_at_from = updated_at_from or _format_utc(updated_since)
+        if updated_at_from:
+            params['updated_at_from'] = updated_at_from
+        updated_at_to = updated_at_to or _format_utc(updated_until)
+        if updated_at_to:
+            params['updated_at_to'] = updated_at_to
         
         # Try .json endpoint first (per Swagger docs)
-        for endpoint in ['/orders.json', '/api/orders']:
-            try:
-                return self._make_request('GET', endpoint, params=params)
-            except Exception as e:
-                logger.warning(f"{endpoint} failed: {e}")
-                continue
+        return self._get_resource(
+            '_order_endpoint', ['/orders.json', '/api/orders'], params, 'order'
+        )
+    
+    def iter_customer_pages(self, updated_since: Optional[datetime] = None,
+                            max_pages: int = 100):
+        """
+        Yield customers page by page, for callers that process as they go.
         
-        raise ValueError("All order endpoints failed")
+        Args:
+            updated_since: Continue from this checkpoint (updated_at)
+            max_pages: Max pages to fetch (API limit: 100)
+            
+        Yields:
+            List of customer dicts per page
+        """
+        # Filter values are the same for every page: format them once
+        updated_at_from = _format_utc(updated_since)
+        return self._iter_pages(
+            lambda page: self.get_customers(
+                page=page,
+                page_size=self.PAGE_SIZE,
+                updated_at_from=updated_at_from
+            ),
+            'customers',
+            max_pages
+        )
     
     def fetch_all_customers(self, updated_since: Optional[datetime] = None,
                            max_pages: Optional[int] = None) -> List[Dict]:
@@ -413,53 +693,12 @@ class CNVAPIClient:
         logger.info(f"Fetching customers (max {max_pages} pages, checkpoint: {updated_since})")
         
         all_customers = []
-        page = 1
-        
-        while page <= max_pages:
-            try:
-                response = self.get_customers(
-                    page=page,
-                    page_size=self.PAGE_SIZE,
-                    updated_since=updated_since
-                )
-                
-                # Extract customers from response
-                customers = []
-                if isinstance(response, list):
-                    customers = response
-                elif isinstance(response, dict):
-                    customers = response.get('data') or response.get('customers') or []
-                
-                if not customers:
-                    logger.info(f"  Page {page}: No more customers")
-                    break
-                
-                all_customers.extend(customers)
-                logger.info(f"  Page {page}: {len(customers)} customers (total: {len(all_customers)})")
-                
-                # Check if more pages exist
-                has_more = False
-                if isinstance(response, dict):
-                    pagination = response.get('pagination', {})
-                    has_more = pagination.get('has_more') or pagination.get('hasMore') or False
-                    
-                    if not pagination and len(customers) >= self.PAGE_SIZE:
-                        has_more = True
-                
-                if not has_more:
-                    logger.info(f"  No more pages available")
-                    break
-                
-                page += 1
-                
-            except Exception as e:
-                logger.error(f"Failed to fetch page {page}: {e}")
-                break
-        
-        if page >= max_pages:
-            logger.info(f"Reached max pages limit ({max_pages})")
+        pages = 0
+        for customers in self.iter_customer_pages(updated_since, max_pages):
+            all_customers.extend(customers)
+            pages += 1
         
-        logger.info(f"Fetched {len(all_customers)} customers ({page-1} pages)")
+        logger.info(f"Fetched {len(all_customers)} customers ({pages} pages)")
         return all_customers
     
     def fetch_customers_by_ids(self, customer_ids: List[int], batch_size: int = 100) -> List[Dict]:
@@ -500,6 +739,40 @@ class CNVAPIClient:
         logger.info(f"Fetched {len(all_customers)} customers by IDs")
         return all_customers
     
+    def iter_order_pages(self, start_date: Optional[datetime] = None,
+                         end_date: Optional[datetime] = None,
+                         updated_since: Optional[datetime] = None,
+                         updated_until: Optional[datetime] = None,
+                         max_pages: int = 100):
+        """
+        Yield orders page by page, for callers that process as they go.
+        
+        Args:
+            start_date: Filter orders from this date
+            end_date: Filter orders until this date
+            updated_since: Continue from this checkpoint (updated_at)
+            updated_until: Stop at this datetime (updated_at)
+            max_pages: Max pages to fetch (API limit: 100)
+            
+        Yields:
+            List of order dicts per page
+        """
+        # Filter values are the same for every page: format them once
+        updated_at_from = _format_utc(updated_since)
+        updated_at_to = _format_utc(updated_until)
+        return self._iter_pages(
+            lambda page: self.get_orders(
+                page=page,
+                page_size=self.PAGE_SIZE,
+                start_date=start_date,
+                end_date=end_date,
+                updated_at_from=updated_at_from,
+                updated_at_to=updated_at_to
+            ),
+            'orders',
+            max_pages
+        )
+    
     def fetch_all_orders(self, start_date: Optional[datetime] = None,
                         end_date: Optional[datetime] = None,
                         updated_since: Optional[datetime] = None,
@@ -529,56 +802,13 @@ class CNVAPIClient:
         logger.info(f"Fetching orders (max {max_pages} pages, checkpoint: {updated_since}, until: {updated_until})")
         
         all_orders = []
-        page = 1
-        
-        while page <= max_pages:
-            try:
-                response = self.get_orders(
-                    page=page,
-                    page_size=self.PAGE_SIZE,
-                    start_date=start_date,
-                    end_date=end_date,
-                    updated_since=updated_since,
-                    updated_until=updated_until
-                )
-                
-                # Extract orders from response
-                orders = []
-                if isinstance(response, list):
-                    orders = response
-                elif isinstance(response, dict):
-                    orders = response.get('data') or response.get('orders') or []
-                
-                if not orders:
-                    logger.info(f"  Page {page}: No more orders")
-                    break
-                
-                all_orders.extend(orders)
-                logger.info(f"  Page {page}: {len(orders)} orders (total: {len(all_orders)})")
-                
-                # Check if more pages exist
-                has_more = False
-                if isinstance(response, dict):
-                    pagination = response.get('pagination', {})
-                    has_more = pagination.get('has_more') or pagination.get('hasMore') or False
-                    
-                    if not pagination and len(orders) >= self.PAGE_SIZE:
-                        has_more = True
-                
-                if not has_more:
-                    logger.info(f"  No more pages available")
-                    break
-                
-                page += 1
-                
-            except Exception as e:
-                logger.error(f"Failed to fetch page {page}: {e}")
-                break
-        
-        if page >= max_pages:
-            logger.info(f"Reached max pages limit ({max_pages})")
+        pages = 0
+        for orders in self.iter_order_pages(start_date, end_date, updated_since,
+                                            updated_until, max_pages):
+            all_orders.extend(orders)
+            pages += 1
         
-        logger.info(f"Fetched {len(all_orders)} orders ({page-1} pages)")
+        logger.info(f"Fetched {len(all_orders)} orders ({pages} pages)")
         return all_orders
     
     
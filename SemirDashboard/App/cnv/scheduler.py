@@ -6,12 +6,19 @@ Uses CNV_USERNAME and CNV_PASSWORD from settings.
 """
 
 import logging
+import os
+import tempfile
+import threading
+from typing import Optional
+
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from django_apscheduler.jobstores import DjangoJobStore
 from django_apscheduler.models import DjangoJobExecution
 from django.conf import settings
+from django.db.models import Count, Q
 
+from .api_client import CNVAPIClient
 from .sync_service import CNVSyncService
 
 logger = logging.getLogger(__name__)
@@ -21,6 +28,36 @@ logger = logging.getLogger(__name__)
 CNV_USERNAME = settings.CNV_USERNAME
 CNV_PASSWORD = settings.CNV_PASSWORD
 
+# Two refresh intervals plus jitter
+TOKEN_REFRESH_WINDOW = 2 * 30 * 60 + 180
+
+# One scheduler per process, and one process (per host) running it
+SCHEDULER_LOCK_PATH = os.path.join(tempfile.gettempdir(), "cnv_scheduler.lock")
+_scheduler_instance: Optional[BackgroundScheduler] = None
+_scheduler_lock = threading.Lock()
+_scheduler_lock_file = None
+
+# Held while a sync job runs in this process
+_running_flags = {"customers": threading.Lock(), "orders": threading.Lock()}
+
+
+def _sync_state(sync_type):
+    """
+    Return (is_running, has_checkpoint) for a sync type in one query.
+
+    is_running: a sync log is still marked running (possibly by another process)
+    has_checkpoint: a completed sync left a checkpoint to resume from
+    """
+    from App.models_cnv import CNVSyncLog
+
+    state = CNVSyncLog.objects.filter(sync_type=sync_type).aggregate(
+        running=Count("id", filter=Q(status="running")),
+        checkpoints=Count(
+            "id", filter=Q(status="completed", checkpoint_updated_at__isnull=False)
+        ),
+    )
+    return state["running"] > 0, state["checkpoints"] > 0
+
 
 def sync_cnv_customers_only():
     """Sync customers only. Runs every 10 minutes at :05, :15, :25, :35, :45, :55."""
@@ -28,36 +65,29 @@ def sync_cnv_customers_only():
     logger.info("STARTING CUSTOMERS SYNC JOB")
     logger.info("=" * 60)
 
-    try:
-        # Check if already running
-        from App.models_cnv import CNVSyncLog
+    lock = _running_flags["customers"]
+    if not lock.acquire(blocking=False):
+        logger.warning("Customers sync already running in this process - skipping")
+        return
 
-        running = CNVSyncLog.objects.filter(
-            sync_type="customers", status="running"
-        ).exists()
+    try:
+        # Check if already running (any process) and whether a checkpoint exists
+        running, has_checkpoint = _sync_state("customers")
 
         if running:
             logger.warning("Customers sync already running - skipping")
             return
 
-        # Check if initial sync needed (no checkpoint exists)
-        has_checkpoint = CNVSyncLog.objects.filter(
-            sync_type="customers",
-            status="completed",
-            checkpoint_updated_at__isnull=False,
-        ).exists()
-
         logger.info(f"CNV Username: {CNV_USERNAME}")
         logger.info("Creating sync service...")
 
-        service = CNVSyncService(CNV_USERNAME, CNV_PASSWORD)
-
-        if not has_checkpoint:
-            logger.info("No checkpoint found - running INITIAL SYNC from IDs file...")
-            created, updated, failed = service.initial_sync_customers_from_ids()
-        else:
-            logger.info("Checkpoint exists - running INCREMENTAL SYNC...")
-            created, updated, failed = service.sync_customers(incremental=True)
+        with CNVSyncService(CNV_USERNAME, CNV_PASSWORD) as service:
+            if not has_checkpoint:
+                logger.info("No checkpoint found - running INITIAL SYNC from IDs file...")
+                created, updated, failed = service.initial_sync_customers_from_ids()
+            else:
+                logger.info("Checkpoint exists - running INCREMENTAL SYNC...")
+                created, updated, failed = service.sync_customers(incremental=True)
 
         logger.info("=" * 60)
         logger.info("CUSTOMERS SYNC COMPLETED")
@@ -73,6 +103,8 @@ def sync_cnv_customers_only():
         logger.error(f"CUSTOMERS SYNC FAILED: {e}")
         logger.error("=" * 60)
         logger.exception("Full traceback:")
+    finally:
+        lock.release()
 
 
 def sync_cnv_orders_only():
@@ -81,36 +113,31 @@ def sync_cnv_orders_only():
     logger.info("STARTING ORDERS SYNC JOB")
     logger.info("=" * 60)
 
-    try:
-        # Check if already running
-        from App.models_cnv import CNVSyncLog
+    lock = _running_flags["orders"]
+    if not lock.acquire(blocking=False):
+        logger.warning("Orders sync already running in this process - skipping")
+        return
 
-        running = CNVSyncLog.objects.filter(
-            sync_type="orders", status="running"
-        ).exists()
+    try:
+        # Check if already running (any process) and whether a checkpoint exists
+        running, has_checkpoint = _sync_state("orders")
 
         if running:
             logger.warning("Orders sync already running - skipping")
             return
 
-        # Check if initial sync needed (no checkpoint exists)
-        has_checkpoint = CNVSyncLog.objects.filter(
-            sync_type="orders", status="completed", checkpoint_updated_at__isnull=False
-        ).exists()
-
         logger.info(f"CNV Username: {CNV_USERNAME}")
         logger.info("Creating sync service...")
 
-        service = CNVSyncService(CNV_USERNAME, CNV_PASSWORD)
-
-        if not has_checkpoint:
-            logger.info(
-                "No checkpoint found - running INITIAL SYNC from June 2024 by month..."
-            )
-            created, updated, failed = service.initial_sync_orders_by_month()
-        else:
-            logger.info("Checkpoint exists - running INCREMENTAL SYNC...")
-            created, updated, failed = service.sync_orders(incremental=True)
+        with CNVSyncService(CNV_USERNAME, CNV_PASSWORD) as service:
+            if not has_checkpoint:
+                logger.info(
+                    "No checkpoint found - running INITIAL SYNC from June 2024 by month..."
+                )
+                created, updated, failed = service.initial_sync_orders_by_month()
+            else:
+                logger.info("Checkpoint exists - running INCREMENTAL SYNC...")
+                created, updated, failed = service.sync_orders(incremental=True)
 
         logger.info("=" * 60)
         logger.info("ORDERS SYNC COMPLETED")
@@ -126,6 +153,19 @@ def sync_cnv_orders_only():
         logger.error(f"ORDERS SYNC FAILED: {e}")
         logger.error("=" * 60)
         logger.exception("Full traceback:")
+    finally:
+        lock.release()
+
+
+def refresh_cnv_token():
+    """Renew the CNV token ahead of expiry. Runs every 30 minutes."""
+    try:
+        with CNVAPIClient(CNV_USERNAME, CNV_PASSWORD) as client:
+            # Renew anything expiring before the run after next, so syncs
+            # never have to log in mid-pagination
+            client.authenticate(skew=TOKEN_REFRESH_WINDOW)
+    except Exception as e:
+        logger.error(f"CNV token refresh failed: {e}")
 
 
 def delete_old_job_executions(max_age=604_800):
@@ -137,13 +177,62 @@ def delete_old_job_executions(max_age=604_800):
         logger.error(f"Failed to delete old job executions: {e}")
 
 
+def _acquire_process_lock():
+    """
+    Take the scheduler file lock without blocking.
+
+    The lock is held for the life of the process (the file stays open), so
+    only one gunicorn worker or runserver process owns the scheduler.
+    Returns True if this process owns it, or if file locking is unavailable.
+    """
+    global _scheduler_lock_file
+
+    try:
+        import fcntl
+    except ImportError:  # Windows: no flock, every process schedules
+        return True
+
+    lock_file = open(SCHEDULER_LOCK_PATH, "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    _scheduler_lock_file = lock_file
+    return True
+
+
 def start_scheduler():
     """
     Start APScheduler with CNV sync jobs.
 
-    Note: In development mode, this may be called twice due to Django auto-reload.
-    This is normal. Jobs will still only execute once due to max_instances=1.
+    Safe to call more than once (Django auto-reload, gunicorn workers): the
+    running scheduler is reused within a process, and a file lock lets only
+    one process on the host start it. Returns None in processes that do not
+    own the scheduler.
     """
+    global _scheduler_instance
+
+    with _scheduler_lock:
+        if _scheduler_instance is not None and _scheduler_instance.running:
+            logger.info("Scheduler already running in this process - reusing it")
+            return _scheduler_instance
+
+        if not _acquire_process_lock():
+            logger.info("Scheduler owned by another process - not starting")
+            return None
+
+        _scheduler_instance = _start_scheduler()
+        return _scheduler_instance
+
+
+def _start_scheduler():
+    """Create, register jobs on and start the BackgroundScheduler."""
     logger.info("Initializing scheduler...")
 
     scheduler = BackgroundScheduler(
@@ -174,6 +263,17 @@ def start_scheduler():
     )
     logger.info("Registered job: CNV Orders Sync ( every 1 hour at :35)")
 
+    # Token refresh every 30 minutes, jittered across instances
+    scheduler.add_job(
+        refresh_cnv_token,
+        trigger=CronTrigger(minute="*/30", jitter=180),
+        id="refresh_cnv_token",
+        max_instances=1,
+        replace_existing=True,
+        name="Refresh CNV Token",
+    )
+    logger.info("Registered job: Refresh CNV Token (every 30 min)")
+
     # Cleanup daily at 2 AM
     scheduler.add_job(
         delete_old_job_executions,
@@ -199,7 +299,8 @@ def start_scheduler():
         logger.info(
             "  [2] CNV Orders Sync - Every 10 min at :00, :10, :20, :30, :40, :50"
         )
-        logger.info("  [3] Cleanup Old Logs - Daily at 2:00 AM")
+        logger.info("  [3] Refresh CNV Token - Every 30 min")
+        logger.info("  [4] Cleanup Old Logs - Daily at 2:00 AM")
         logger.info("=" * 60)
 
         return scheduler
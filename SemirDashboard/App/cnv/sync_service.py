@@ -12,7 +12,7 @@ UPDATED: 2026-02-27
 import logging
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
@@ -34,8 +34,8 @@ class CNVSyncService:
     - Membership data integration
     
     Usage:
-        service = CNVSyncService(username="user@example.com", password="secret")
-        created, updated, failed = service.sync_customers(incremental=True)
+        with CNVSyncService(username="user@example.com", password="secret") as service:
+            created, updated, failed = service.sync_customers(incremental=True)
     """
     
     BATCH_SIZE = 500  # Records per database batch
@@ -51,6 +51,16 @@ class CNVSyncService:
         """
         self.client = CNVAPIClient(username, password)
     
+    def close(self):
+        """Close the API client's pooled HTTP session."""
+        self.client.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
     def _parse_datetime(self, dt_str: Optional[str]) -> Optional[datetime]:
         """
         Parse datetime string to timezone-aware datetime.
@@ -385,6 +395,34 @@ class CNVSyncService:
 
         return created_count, updated_count, failed_count
 
+    def _iter_batches(self, pages: Iterable[List[Dict]], sync_log: CNVSyncLog) -> Iterator[List[Dict]]:
+        """
+        Regroup API pages into BATCH_SIZE batches as they arrive.
+        
+        Only the current batch and page are held in memory. The sync log's
+        total_records grows with each page, so progress is visible while the
+        sync is still fetching.
+        
+        Args:
+            pages: Iterable of record lists, one per API page
+            sync_log: Sync log whose total_records is kept up to date
+            
+        Yields:
+            Lists of at most BATCH_SIZE records
+        """
+        batch = []
+        for page in pages:
+            batch.extend(page)
+            sync_log.total_records += len(page)
+            sync_log.save(update_fields=['total_records'])
+            
+            while len(batch) >= self.BATCH_SIZE:
+                yield batch[:self.BATCH_SIZE]
+                batch = batch[self.BATCH_SIZE:]
+        
+        if batch:
+            yield batch
+
     def sync_customers(
         self,
         incremental: bool = True,
@@ -423,35 +461,23 @@ class CNVSyncService:
                 else:
                     logger.info("No checkpoint found - starting full sync")
             
-            # Fetch data from API (max 100 pages)
-            logger.info("Fetching customers from CNV API...")
-            customers_data = self.client.fetch_all_customers(
+            # Fetch from API (max 100 pages) and process each batch as its
+            # pages arrive - only track checkpoint from fully successful batches
+            logger.info("Fetching and processing customers from CNV API...")
+            pages = self.client.iter_customer_pages(
                 updated_since=checkpoint,
-                max_pages=max_pages
+                max_pages=max_pages if max_pages is not None else 100
             )
             
-            total = len(customers_data)
-            sync_log.total_records = total
-            sync_log.save()
-            
-            if total == 0:
-                logger.info("No new customers to sync")
-                sync_log.mark_completed()
-                return 0, 0, 0
-            
-            logger.info(f"Processing {total} customers...")
-            
-            # Process in batches - only track checkpoint from fully successful batches
             total_created = 0
             total_updated = 0
             total_failed = 0
+            processed = 0
             latest_updated_at = None
             
-            for i in range(0, total, self.BATCH_SIZE):
-                batch = customers_data[i:i + self.BATCH_SIZE]
-                batch_size = len(batch)
-                
+            for batch in self._iter_batches(pages, sync_log):
                 created, updated, failed = self._process_customer_batch(batch)
+                processed += len(batch)
                 
                 total_created += created
                 total_updated += updated
@@ -471,8 +497,13 @@ class CNVSyncService:
                     logger.warning(f"Batch had {failed} failures - checkpoint not advanced for this batch")
                 
                 # Log progress
-                if (i + self.BATCH_SIZE) % self.LOG_INTERVAL == 0:
-                    logger.info(f"  Processed {i + self.BATCH_SIZE}/{total} customers")
+                if processed % self.LOG_INTERVAL == 0:
+                    logger.info(f"  Processed {processed} customers")
+            
+            if processed == 0:
+                logger.info("No new customers to sync")
+                sync_log.mark_completed()
+                return 0, 0, 0
             
             # Save checkpoint for next sync
             if latest_updated_at:
@@ -523,42 +554,38 @@ class CNVSyncService:
         try:
             logger.info(f"Syncing customers from {updated_since} to {updated_until}")
             
-            # Fetch data for this date range (max 100 pages)
-            customers_data = self.client.fetch_all_customers(
+            # Fetch this date range page by page (max 100 pages)
+            pages = self.client.iter_customer_pages(
                 updated_since=updated_since,
                 max_pages=100
             )
             
             # Filter by updated_until (API might not support updated_at_to)
             if updated_until:
-                customers_data = [
-                    c for c in customers_data
-                    if self._parse_datetime(c.get('updated_at') or c.get('created_at')) <= updated_until
-                ]
-            
-            total = len(customers_data)
-            sync_log.total_records = total
-            sync_log.save()
-            
-            if total == 0:
-                logger.info("No customers in this date range")
-                sync_log.mark_completed()
-                return 0, 0, 0
-            
-            logger.info(f"Processing {total} customers...")
+                pages = (
+                    [
+                        c for c in page
+                        if self._parse_datetime(c.get('updated_at') or c.get('created_at')) <= updated_until
+                    ]
+                    for page in pages
+                )
             
-            # Process all batches
+            # Process all batches as they arrive
             total_created = 0
             total_updated = 0
             total_failed = 0
             
-            for i in range(0, total, self.BATCH_SIZE):
-                batch = customers_data[i:i + self.BATCH_SIZE]
+            for batch in self._iter_batches(pages, sync_log):
                 created, updated, failed = self._process_customer_batch(batch)
                 total_created += created
                 total_updated += updated
                 total_failed += failed
             
+            if sync_log.total_records == 0:
+                logger.info("No customers in this date range")
+                sync_log.mark_completed()
+                return 0, 0, 0
+            
             # Save checkpoint = end of date range
             sync_log.checkpoint_updated_at = updated_until
             sync_log.created_count = total_created
@@ -619,46 +646,34 @@ class CNVSyncService:
                 else:
                     logger.info("No checkpoint found - starting full sync")
             
-            # Fetch data from API (max 100 pages)
-            logger.info("Fetching orders from CNV API...")
-            orders_data = self.client.fetch_all_orders(
+            # Fetch from API (max 100 pages) and process each batch as its
+            # pages arrive - only track checkpoint from fully successful batches
+            logger.info("Fetching and processing orders from CNV API...")
+            pages = self.client.iter_order_pages(
                 start_date=start_date,
                 end_date=end_date,
                 updated_since=checkpoint,
-                max_pages=max_pages
+                max_pages=max_pages if max_pages is not None else 100
             )
             
-            total = len(orders_data)
-            sync_log.total_records = total
-            sync_log.save()
-            
-            if total == 0:
-                logger.info("No new orders to sync")
-                sync_log.mark_completed()
-                return 0, 0, 0
-            
-            logger.info(f"Processing {total} orders...")
-            
-            # Process in batches - only track checkpoint from fully successful batches
             total_created = 0
             total_updated = 0
             total_failed = 0
+            processed = 0
             latest_updated_at = None
             
-            # DEBUG: Check if orders have updated_at field
-            if orders_data:
-                sample_order = orders_data[0]
-                logger.info(f"Sample order keys: {list(sample_order.keys())}")
-                if 'updated_at' in sample_order:
-                    logger.info(f"Sample order updated_at: {sample_order.get('updated_at')}")
-                else:
-                    logger.warning("Orders do NOT have 'updated_at' field!")
-            
-            for i in range(0, total, self.BATCH_SIZE):
-                batch = orders_data[i:i + self.BATCH_SIZE]
-                batch_size = len(batch)
+            for batch in self._iter_batches(pages, sync_log):
+                # DEBUG: Check if orders have updated_at field
+                if processed == 0:
+                    sample_order = batch[0]
+                    logger.info(f"Sample order keys: {list(sample_order.keys())}")
+                    if 'updated_at' in sample_order:
+                        logger.info(f"Sample order updated_at: {sample_order.get('updated_at')}")
+                    else:
+                        logger.warning("Orders do NOT have 'updated_at' field!")
                 
                 created, updated, failed = self._process_order_batch(batch)
+                processed += len(batch)
                 
                 total_created += created
                 total_updated += updated
@@ -685,8 +700,13 @@ class CNVSyncService:
                     logger.warning(f"Batch had {failed} failures - checkpoint not advanced for this batch")
                 
                 # Log progress
-                if (i + self.BATCH_SIZE) % self.LOG_INTERVAL == 0:
-                    logger.info(f"  Processed {i + self.BATCH_SIZE}/{total} orders")
+                if processed % self.LOG_INTERVAL == 0:
+                    logger.info(f"  Processed {processed} orders")
+            
+            if processed == 0:
+                logger.info("No new orders to sync")
+                sync_log.mark_completed()
+                return 0, 0, 0
             
             # Save checkpoint for next sync
             logger.info(f"DEBUG: Final latest_updated_at for orders: {latest_updated_at}")
@@ -741,36 +761,29 @@ class CNVSyncService:
         try:
             logger.info(f"Syncing orders from {updated_since} to {updated_until}")
             
-            # Fetch data for this date range (max 100 pages)
-            orders_data = self.client.fetch_all_orders(
+            # Fetch this date range page by page (max 100 pages)
+            pages = self.client.iter_order_pages(
                 updated_since=updated_since,
                 updated_until=updated_until,
                 max_pages=100
             )
             
-            total = len(orders_data)
-            sync_log.total_records = total
-            sync_log.save()
-            
-            if total == 0:
-                logger.info("No orders in this date range")
-                sync_log.mark_completed()
-                return 0, 0, 0
-            
-            logger.info(f"Processing {total} orders...")
-            
-            # Process all batches
+            # Process all batches as they arrive
             total_created = 0
             total_updated = 0
             total_failed = 0
             
-            for i in range(0, total, self.BATCH_SIZE):
-                batch = orders_data[i:i + self.BATCH_SIZE]
+            for batch in self._iter_batches(pages, sync_log):
                 created, updated, failed = self._process_order_batch(batch)
                 total_created += created
                 total_updated += updated
                 total_failed += failed
             
+            if sync_log.total_records == 0:
+                logger.info("No orders in this date range")
+                sync_log.mark_completed()
+                return 0, 0, 0
+            
             # Save checkpoint = end of date range
             sync_log.checkpoint_updated_at = updated_until
             sync_log.created_count = total_created
@@ -922,33 +935,19 @@ class CNVSyncService:
             sync_log = CNVSyncLog.objects.create(sync_type='orders')
             
             try:
-                # Fetch orders for this month (max 100 pages)
-                orders_data = self.client.fetch_all_orders(
+                # Fetch orders for this month page by page (max 100 pages)
+                pages = self.client.iter_order_pages(
                     updated_since=month_start,
                     updated_until=month_end,
                     max_pages=100
                 )
                 
-                total = len(orders_data)
-                sync_log.total_records = total
-                sync_log.save()
-                
-                if total == 0:
-                    logger.info(f"  No orders for {month_start.strftime('%Y-%m')}")
-                    sync_log.mark_completed()
-                    current_month = next_month
-                    continue
-                
-                logger.info(f"  Processing {total} orders...")
-                
-                # Process batches
+                # Process batches as they arrive
                 month_created = 0
                 month_updated = 0
                 month_failed = 0
                 
-                for i in range(0, total, self.BATCH_SIZE):
-                    batch = orders_data[i:i + self.BATCH_SIZE]
-                    
+                for batch in self._iter_batches(pages, sync_log):
                     created, updated, failed = self._process_order_batch(batch)
                     
                     month_created += created
@@ -968,6 +967,12 @@ class CNVSyncService:
                                 if not latest_updated_at or order_dt > latest_updated_at:
                                     latest_updated_at = order_dt
                 
+                if sync_log.total_records == 0:
+                    logger.info(f"  No orders for {month_start.strftime('%Y-%m')}")
+                    sync_log.mark_completed()
+                    current_month = next_month
+                    continue
+                
                 total_created += month_created
                 total_updated += month_updated
                 total_failed += month_failed
@@ -102,7 +102,7 @@ def _get_cnv_comparison_data(start_date, end_date):
         logger.info("CNV comparison cache HIT (%s)", cache_key)
         return cached, cache_key
 
-    from django.db.models import Subquery
+    from django.db.models import Exists, OuterRef, Subquery
 
     period_filter = {}
     has_filter = False
@@ -130,10 +130,18 @@ def _get_cnv_comparison_data(start_date, end_date):
     )
     total_cnv_all = CNVCustomer.objects.count()
 
-    pos_phones_all = set(pos_all.values_list("phone", flat=True))
-    cnv_phones_all = set(cnv_all.values_list("phone", flat=True))
-    pos_only_phones_all = pos_phones_all - cnv_phones_all
-    cnv_only_phones_all = cnv_phones_all - pos_phones_all
+    # Distinct "only" phones, counted by the DB as anti-joins instead of
+    # pulling both phone columns into Python sets
+    pos_only_all_count = (
+        pos_all.exclude(phone__in=Subquery(cnv_all.values("phone")))
+        .values("phone").distinct().count()
+    )
+    cnv_only_all_count = (
+        cnv_all.exclude(phone__in=Subquery(pos_all.values("phone")))
+        .values("phone").distinct().count()
+    )
+    # Per-row "is this phone also in POS" flag, as a correlated EXISTS
+    in_pos = Exists(pos_all.filter(phone=OuterRef("phone")))
 
     pos_only_all = list(
         pos_all.exclude(phone__in=Subquery(cnv_all.values("phone")))
@@ -185,7 +193,6 @@ def _get_cnv_comparison_data(start_date, end_date):
         pos_only_period_qs = pos_period.exclude(
             phone__in=Subquery(cnv_all.values("phone"))
         )
-        pos_only_period_count = pos_only_period_qs.count()
         pos_only_period = list(
             pos_only_period_qs.values(
                 "vip_id",
@@ -197,11 +204,11 @@ def _get_cnv_comparison_data(start_date, end_date):
                 "points",
             ).order_by("-registration_date")
         )
+        pos_only_period_count = len(pos_only_period)
 
         cnv_only_period_qs = cnv_period.exclude(
             phone__in=Subquery(pos_all.values("phone"))
         )
-        cnv_only_period_count = cnv_only_period_qs.count()
         cnv_only_period = list(
             cnv_only_period_qs.values(
                 "cnv_id",
@@ -216,6 +223,7 @@ def _get_cnv_comparison_data(start_date, end_date):
                 "used_points",
             ).order_by("-cnv_created_at")
         )
+        cnv_only_period_count = len(cnv_only_period)
 
     # Points mismatch — single Python join
     pos_map = {
@@ -273,8 +281,9 @@ def _get_cnv_comparison_data(start_date, end_date):
     total_points_mismatch.sort(key=lambda x: abs(x["diff"]), reverse=True)
 
     # CNV used points
-    cnv_used_qs = (
+    cnv_used_points_list = list(
         cnv_all.filter(used_points__gt=0)
+        .annotate(in_pos=in_pos)
         .values(
             "cnv_id",
             "phone",
@@ -286,17 +295,11 @@ def _get_cnv_comparison_data(start_date, end_date):
             "points",
             "total_points",
             "used_points",
+            "in_pos",
         )
         .order_by("-used_points")
     )
-    cnv_used_points_count = cnv_all.filter(used_points__gt=0).count()
-    _used_phones = [r["phone"] for r in cnv_used_qs if r["phone"]]
-    _pos_phones_set = set(
-        pos_all.filter(phone__in=_used_phones).values_list("phone", flat=True)
-    )
-    cnv_used_points_list = [
-        {**r, "in_pos": r["phone"] in _pos_phones_set} for r in cnv_used_qs
-    ]
+    cnv_used_points_count = len(cnv_used_points_list)
 
     # Zalo stats
     zalo_app_qs = CNVCustomer.objects.filter(zalo_app_id__isnull=False).exclude(
@@ -350,27 +353,21 @@ def _get_cnv_comparison_data(start_date, end_date):
         "zalo_app_created_at",
     }
     zalo_app_list = list(
-        zalo_app_qs.order_by("-zalo_app_created_at").values(*_zf)
+        zalo_app_qs.annotate(in_pos=in_pos)
+        .order_by("-zalo_app_created_at").values(*_zf, "in_pos")
     )
-    zalo_oa_list = list(zalo_oa_qs.order_by("-zalo_app_created_at").values(*_zf))
-    _all_z_phones = {r["phone"] for r in zalo_app_list + zalo_oa_list if r["phone"]}
-    _pos_z_phones = (
-        set(pos_all.filter(phone__in=_all_z_phones).values_list("phone", flat=True))
-        if _all_z_phones
-        else set()
+    zalo_oa_list = list(
+        zalo_oa_qs.annotate(in_pos=in_pos)
+        .order_by("-zalo_app_created_at").values(*_zf, "in_pos")
     )
-    for r in zalo_app_list:
-        r["in_pos"] = r["phone"] in _pos_z_phones
-    for r in zalo_oa_list:
-        r["in_pos"] = r["phone"] in _pos_z_phones
 
     result = {
         "has_filter": has_filter,
         "period_label": f"{start_date} to {end_date}" if has_filter else "All Time",
         "total_pos": total_pos_all,
         "total_cnv": total_cnv_all,
-        "pos_only_all_count": len(pos_only_phones_all),
-        "cnv_only_all_count": len(cnv_only_phones_all),
+        "pos_only_all_count": pos_only_all_count,
+        "cnv_only_all_count": cnv_only_all_count,
         "new_pos_count": new_pos_count,
         "new_cnv_count": new_cnv_count,
         "pos_only_period_count": pos_only_period_count,
@@ -454,18 +451,22 @@ def export_customer_comparison(request):
     ts = datetime.now().strftime('%H%M%S')
     period = f"{date_from}_{date_to}" if date_from and date_to else datetime.now().strftime('%Y%m%d')
 
+    response = HttpResponse(
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
     if tab and tab in _CNV_TAB_SHEETS:
         wb = export_cnv_tab_to_excel(tab, d, date_from=date_from, date_to=date_to)
+        wb.save(response)
         filename = f"customer_analytics_{tab}_{period}_{ts}.xlsx"
     else:
-        cnv_used_points_export = list(
-            CNVCustomer.objects.filter(used_points__gt=0).order_by("-used_points")
-        )
+        cnv_used_points_export = CNVCustomer.objects.filter(used_points__gt=0).order_by("-used_points")
         zalo_stats_export = {k: d[k] for k in (
             "zalo_app_all_count", "zalo_oa_all_count", "zalo_app_all_pct", "zalo_oa_all_pct",
             "zalo_app_period_count", "zalo_oa_period_count", "zalo_app_period_pct", "zalo_oa_period_pct",
         )}
-        wb = export_customer_comparison_to_excel(
+        # Write-only workbook streams straight into the response
+        export_customer_comparison_to_excel(
             Customer.objects.all(), CNVCustomer.objects.all(), date_from, date_to,
             points_mismatch=d["points_mismatch"],
             total_points_mismatch=d["total_points_mismatch"],
@@ -473,14 +474,11 @@ def export_customer_comparison(request):
             zalo_mini_app_list=d["zalo_mini_app_list"],
             zalo_oa_list=d["zalo_oa_list"],
             zalo_stats=zalo_stats_export,
+            output=response,
         )
         filename = f"customer_analytics_{period}_{ts}.xlsx"
 
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
-    wb.save(response)
     return response
 
 
@@ -508,39 +506,40 @@ def sync_cnv_points(request):
     if not cnv_ids:
         return JsonResponse({"error": "No cnv_ids provided"}, status=400)
 
-    client = CNVAPIClient(settings.CNV_USERNAME, settings.CNV_PASSWORD)
-    results = []
-
-    for cnv_id in cnv_ids:
-        try:
-            response = client.get_customer_membership(int(cnv_id))
-            if response and "membership" in response:
-                m = response["membership"]
-                points = Decimal(str(m.get("points", 0)))
-                total_pts = Decimal(str(m.get("total_points", 0)))
-                used_pts = Decimal(str(m.get("used_points", 0)))
-                level_name = m.get("level_name")
-
-                CNVCustomer.objects.filter(cnv_id=cnv_id).update(
-                    points=points,
-                    total_points=total_pts,
-                    used_points=used_pts,
-                    level_name=level_name,
-                )
-                results.append(
-                    {
-                        "cnv_id": cnv_id,
-                        "status": "ok",
-                        "points": float(points),
-                        "total_points": float(total_pts),
-                        "used_points": float(used_pts),
-                        "level_name": level_name,
-                    }
-                )
-            else:
-                results.append({"cnv_id": cnv_id, "status": "no_data"})
-        except Exception as e:
-            results.append({"cnv_id": cnv_id, "status": "error", "error": str(e)})
+    # One pooled connection for the whole batch, closed when done
+    with CNVAPIClient(settings.CNV_USERNAME, settings.CNV_PASSWORD) as client:
+        results = []
+
+        for cnv_id in cnv_ids:
+            try:
+                response = client.get_customer_membership(int(cnv_id))
+                if response and "membership" in response:
+                    m = response["membership"]
+                    points = Decimal(str(m.get("points", 0)))
+                    total_pts = Decimal(str(m.get("total_points", 0)))
+                    used_pts = Decimal(str(m.get("used_points", 0)))
+                    level_name = m.get("level_name")
+
+                    CNVCustomer.objects.filter(cnv_id=cnv_id).update(
+                        points=points,
+                        total_points=total_pts,
+                        used_points=used_pts,
+                        level_name=level_name,
+                    )
+                    results.append(
+                        {
+                            "cnv_id": cnv_id,
+                            "status": "ok",
+                            "points": float(points),
+                            "total_points": float(total_pts),
+                            "used_points": float(used_pts),
+                            "level_name": level_name,
+                        }
+                    )
+                else:
+                    results.append({"cnv_id": cnv_id, "status": "no_data"})
+            except Exception as e:
+                results.append({"cnv_id": cnv_id, "status": "error", "error": str(e)})
 
     return JsonResponse({"results": results})
 
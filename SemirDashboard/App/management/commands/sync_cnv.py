@@ -82,9 +82,6 @@ class Command(BaseCommand):
             self.stdout.write('Please set CNV_USERNAME and CNV_PASSWORD')
             return
         
-        # Initialize service
-        service = CNVSyncService(username, password)
-        
         # Parse dates
         start_date = None
         end_date = None
@@ -121,87 +118,89 @@ class Command(BaseCommand):
         if max_pages:
             self.stdout.write(self.style.WARNING(f'Limited to {max_pages} pages (testing mode)'))
         
-        try:
-            # Check if initial sync requested
-            if options['initial']:
-                self.stdout.write(self.style.WARNING('Running INITIAL sync'))
+        # Initialize service; its HTTP session is closed when the sync ends
+        with CNVSyncService(username, password) as service:
+            try:
+                # Check if initial sync requested
+                if options['initial']:
+                    self.stdout.write(self.style.WARNING('Running INITIAL sync'))
+                    
+                    if options['customers']:
+                        # Initial sync: customers from IDs file
+                        self.stdout.write(self.style.SUCCESS('\n[SYNC] INITIAL SYNC: Reading customer IDs from file...'))
+                        created, updated, failed = service.initial_sync_customers_from_ids()
+                        
+                        self.stdout.write(self.style.SUCCESS('\n[OK] INITIAL CUSTOMERS SYNC COMPLETED'))
+                        self.stdout.write(f'  Created: {created}')
+                        self.stdout.write(f'  Updated: {updated}')
+                        self.stdout.write(f'  Failed: {failed}')
+                    
+                    if options['orders']:
+                        # Initial sync: orders from June 2024 by month
+                        self.stdout.write(self.style.SUCCESS('\n[SYNC] INITIAL SYNC: Scanning orders from June 2024...'))
+                        created, updated, failed = service.initial_sync_orders_by_month()
+                        
+                        self.stdout.write(self.style.SUCCESS('\n[OK] INITIAL ORDERS SYNC COMPLETED'))
+                        self.stdout.write(f'  Created: {created}')
+                        self.stdout.write(f'  Updated: {updated}')
+                        self.stdout.write(f'  Failed: {failed}')
+                    
+                    self.stdout.write(self.style.SUCCESS('\n' + '=' * 60))
+                    return
                 
+                # Normal sync based on options
                 if options['customers']:
-                    # Initial sync: customers from IDs file
-                    self.stdout.write(self.style.SUCCESS('\n[SYNC] INITIAL SYNC: Reading customer IDs from file...'))
-                    created, updated, failed = service.initial_sync_customers_from_ids()
+                    # Customers only
+                    self.stdout.write(self.style.SUCCESS('\n[SYNC] Syncing CUSTOMERS...'))
+                    created, updated, failed = service.sync_customers(
+                        incremental=incremental,
+                        max_pages=max_pages
+                    )
                     
-                    self.stdout.write(self.style.SUCCESS('\n[OK] INITIAL CUSTOMERS SYNC COMPLETED'))
+                    self.stdout.write(self.style.SUCCESS('\n[OK] CUSTOMERS SYNC COMPLETED'))
                     self.stdout.write(f'  Created: {created}')
                     self.stdout.write(f'  Updated: {updated}')
                     self.stdout.write(f'  Failed: {failed}')
-                
-                if options['orders']:
-                    # Initial sync: orders from June 2024 by month
-                    self.stdout.write(self.style.SUCCESS('\n[SYNC] INITIAL SYNC: Scanning orders from June 2024...'))
-                    created, updated, failed = service.initial_sync_orders_by_month()
                     
-                    self.stdout.write(self.style.SUCCESS('\n[OK] INITIAL ORDERS SYNC COMPLETED'))
+                elif options['orders']:
+                    # Orders only
+                    self.stdout.write(self.style.SUCCESS('\n[SYNC] Syncing ORDERS...'))
+                    created, updated, failed = service.sync_orders(
+                        incremental=incremental,
+                        start_date=start_date,
+                        end_date=end_date,
+                        max_pages=max_pages
+                    )
+                    
+                    self.stdout.write(self.style.SUCCESS('\n[OK] ORDERS SYNC COMPLETED'))
                     self.stdout.write(f'  Created: {created}')
                     self.stdout.write(f'  Updated: {updated}')
                     self.stdout.write(f'  Failed: {failed}')
+                    
+                else:
+                    # Full sync (both)
+                    self.stdout.write(self.style.SUCCESS('\n[SYNC] Syncing CUSTOMERS & ORDERS...'))
+                    results = service.sync_all(
+                        incremental=incremental,
+                        max_pages=max_pages
+                    )
+                    
+                    self.stdout.write(self.style.SUCCESS('\n[OK] FULL SYNC COMPLETED'))
+                    self.stdout.write('\nCustomers:')
+                    self.stdout.write(f"  Created: {results['customers']['created']}")
+                    self.stdout.write(f"  Updated: {results['customers']['updated']}")
+                    self.stdout.write(f"  Failed: {results['customers']['failed']}")
+                    
+                    self.stdout.write('\nOrders:')
+                    self.stdout.write(f"  Created: {results['orders']['created']}")
+                    self.stdout.write(f"  Updated: {results['orders']['updated']}")
+                    self.stdout.write(f"  Failed: {results['orders']['failed']}")
                 
                 self.stdout.write(self.style.SUCCESS('\n' + '=' * 60))
-                return
-            
-            # Normal sync based on options
-            if options['customers']:
-                # Customers only
-                self.stdout.write(self.style.SUCCESS('\n[SYNC] Syncing CUSTOMERS...'))
-                created, updated, failed = service.sync_customers(
-                    incremental=incremental,
-                    max_pages=max_pages
-                )
-                
-                self.stdout.write(self.style.SUCCESS('\n[OK] CUSTOMERS SYNC COMPLETED'))
-                self.stdout.write(f'  Created: {created}')
-                self.stdout.write(f'  Updated: {updated}')
-                self.stdout.write(f'  Failed: {failed}')
-                
-            elif options['orders']:
-                # Orders only
-                self.stdout.write(self.style.SUCCESS('\n[SYNC] Syncing ORDERS...'))
-                created, updated, failed = service.sync_orders(
-                    incremental=incremental,
-                    start_date=start_date,
-                    end_date=end_date,
-                    max_pages=max_pages
-                )
-                
-                self.stdout.write(self.style.SUCCESS('\n[OK] ORDERS SYNC COMPLETED'))
-                self.stdout.write(f'  Created: {created}')
-                self.stdout.write(f'  Updated: {updated}')
-                self.stdout.write(f'  Failed: {failed}')
                 
-            else:
-                # Full sync (both)
-                self.stdout.write(self.style.SUCCESS('\n[SYNC] Syncing CUSTOMERS & ORDERS...'))
-                results = service.sync_all(
-                    incremental=incremental,
-                    max_pages=max_pages
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR(f'\n[ERROR] Sync failed: {e}')
                 )
-                
-                self.stdout.write(self.style.SUCCESS('\n[OK] FULL SYNC COMPLETED'))
-                self.stdout.write('\nCustomers:')
-                self.stdout.write(f"  Created: {results['customers']['created']}")
-                self.stdout.write(f"  Updated: {results['customers']['updated']}")
-                self.stdout.write(f"  Failed: {results['customers']['failed']}")
-                
-                self.stdout.write('\nOrders:')
-                self.stdout.write(f"  Created: {results['orders']['created']}")
-                self.stdout.write(f"  Updated: {results['orders']['updated']}")
-                self.stdout.write(f"  Failed: {results['orders']['failed']}")
-            
-            self.stdout.write(self.style.SUCCESS('\n' + '=' * 60))
-            
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'\n[ERROR] Sync failed: {e}')
-            )
-            logger.error('Sync failed', exc_info=True)
-            raise
\ No newline at end of file
+                logger.error('Sync failed', exc_info=True)
+                raise
\ No newline at end of file
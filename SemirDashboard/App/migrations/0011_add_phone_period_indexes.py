@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0010_alter_couponcampaign_prefix'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customer',
+            name='App_custome_registr_4bfb38_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cnvcustomer',
+            index=models.Index(fields=['cnv_created_at', 'phone'], name='cnv_custome_cnv_cre_dfb67f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['registration_date', 'phone'], name='App_custome_registr_0f1347_idx'),
+        ),
+    ]
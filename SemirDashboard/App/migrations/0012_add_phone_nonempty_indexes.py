@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0011_add_phone_period_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cnvcustomer',
+            index=models.Index(condition=models.Q(('phone__isnull', False), models.Q(('phone', ''), _negated=True)), fields=['phone'], name='cnv_phone_nonempty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('phone__isnull', False), models.Q(('phone', ''), _negated=True)), fields=['phone'], name='customer_phone_nonempty_idx'),
+        ),
+    ]
@@ -29,7 +29,15 @@ class Customer(models.Model):
         unique_together = ("vip_id", "phone")
         indexes = [
             models.Index(fields=["vip_id", "phone"]),
-            models.Index(fields=["registration_date"]),
+            # Period filter + phone anti-join in the POS vs CNV comparison
+            models.Index(fields=["registration_date", "phone"]),
+            # Only customers with a phone take part in the comparison; the
+            # condition mirrors the queryset filter so the planner can use it
+            models.Index(
+                fields=["phone"],
+                name="customer_phone_nonempty_idx",
+                condition=models.Q(phone__isnull=False) & ~models.Q(phone=""),
+            ),
         ]
 
     def __str__(self):
@@ -74,6 +74,13 @@ class CNVCustomer(models.Model):
             models.Index(fields=['level_name']),
             models.Index(fields=['-last_synced_at']),
             models.Index(fields=['-cnv_updated_at']),
+            # Period filter + phone anti-join in the POS vs CNV comparison
+            models.Index(fields=['cnv_created_at', 'phone']),
+            models.Index(
+                fields=['phone'],
+                name='cnv_phone_nonempty_idx',
+                condition=models.Q(phone__isnull=False) & ~models.Q(phone=''),
+            ),
         ]
     
     def __str__(self):
@@ -1,3 +1,204 @@
-from django.test import TestCase
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.apps import apps
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from App.cnv.api_client import CNVAPIClient
+from App.cnv.sync_service import CNVSyncService
+from App.models_cnv import CNVSyncLog
+
+
+class CNVTokenRefreshTests(SimpleTestCase):
+    """Token refresh in CNVAPIClient._make_request."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_concurrent_401s_share_one_login(self):
+        workers = CNVAPIClient.FETCH_WORKERS
+        client = CNVAPIClient(username='refresh@example.com', password='secret')
+        self.addCleanup(client.close)
+        client._cache_token('old-token', 3600)
+
+        # Hold every request made with the old token until all workers have
+        # sent one, so they all see the 401 before anyone logs in again
+        barrier = threading.Barrier(workers)
+
+        def fake_request(method, url, headers, **kwargs):
+            response = mock.Mock(content=b'{}', text='')
+            if headers['Authorization'] == 'TOKEN old-token':
+                barrier.wait(timeout=5)
+                response.status_code = 401
+            else:
+                response.status_code = 200
+            return response
+
+        logins = []
+
+        def fake_login():
+            logins.append(1)
+            time.sleep(0.05)  # Let the other workers queue on the auth lock
+            client._cache_token('new-token', 3600)
+            return 'new-token'
+
+        with mock.patch.object(client._session, 'request', side_effect=fake_request), \
+                mock.patch.object(client, '_oauth_login', side_effect=fake_login):
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(client._make_request, 'GET', '/customers.json')
+                    for _ in range(workers)
+                ]
+                results = [f.result() for f in futures]
+
+        self.assertEqual(len(logins), 1)
+        self.assertEqual(results, [{}] * workers)
+
+    def test_token_cleared_while_being_read(self):
+        client = CNVAPIClient(username='reader@example.com', password='secret')
+        self.addCleanup(client.close)
+        client._cache_token('live-token', 3600)
+        self.assertEqual(client._current_token(), 'live-token')
+
+        # Another worker's 401 clears the token between the check and the return
+        real_monotonic = time.monotonic
+
+        def clear_then_tick():
+            client._token = None
+            return real_monotonic()
+
+        with mock.patch('App.cnv.api_client.time.monotonic', side_effect=clear_then_tick):
+            self.assertEqual(client._current_token(), 'live-token')
+
+
+class _FakeSSOAdapter(requests.adapters.BaseAdapter):
+    """Answers the SSO login flow from a {(method, url): (status, headers, body)} map."""
+
+    def __init__(self, routes):
+        super().__init__()
+        self.routes = routes
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        url = request.url.split('?')[0]
+        self.sent.append((request.method, url, request.body))
+        status, headers, body = self.routes[(request.method, url)]
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = body
+        response._content_consumed = True
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class CNVLoginRedirectTests(SimpleTestCase):
+    """Redirect handling after the SSO login POST."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_307_after_login_is_followed_without_the_credentials(self):
+        client = CNVAPIClient(username='login@example.com', password='s3cret')
+        self.addCleanup(client.close)
+        sso = client.sso_url
+        adapter = _FakeSSOAdapter({
+            ('GET', f'{sso}/oauth'): (200, {}, (
+                b'<html><body><form action="/login">'
+                b'<input type="email" name="email"><input type="password" name="pw">'
+                b'</form></body></html>'
+            )),
+            ('POST', f'{sso}/login'): (307, {'Location': f'{sso}/consent'}, b''),
+            ('GET', f'{sso}/consent'): (302, {'Location': f'{client.redirect_uri}?code=abc%2F1'}, b''),
+        })
+
+        real_session = requests.Session
+
+        def login_session():
+            session = real_session()
+            session.mount('https://', adapter)
+            return session
+
+        token_response = mock.Mock(status_code=200, content=b'{"access_token": "tok", "expires_in": 3600}')
+        with mock.patch('App.cnv.api_client.requests.Session', side_effect=login_session), \
+                mock.patch.object(client._session, 'get', return_value=token_response) as token_get:
+            self.assertEqual(client._oauth_login(), 'tok')
+
+        methods = [(method, url) for method, url, _ in adapter.sent]
+        self.assertEqual(methods, [
+            ('GET', f'{sso}/oauth'), ('POST', f'{sso}/login'), ('GET', f'{sso}/consent'),
+        ])
+        self.assertIn('s3cret', adapter.sent[1][2])
+        self.assertIsNone(adapter.sent[2][2])
+        self.assertEqual(token_get.call_args.kwargs['params']['code'], 'abc/1')
+
+
+class CNVSyncStreamingTests(TestCase):
+    """Sync paths process API pages as they arrive."""
+
+    def test_sync_customers_processes_batches_between_pages(self):
+        service = CNVSyncService(username='sync@example.com', password='secret')
+        self.addCleanup(service.close)
+        events = []
+
+        def pages(**kwargs):
+            for n in range(3):
+                events.append(('page', n))
+                yield [{'id': n * 2 + i} for i in range(2)]
+
+        def process(batch):
+            events.append(('batch', [c['id'] for c in batch]))
+            return 0, len(batch), 0
+
+        with mock.patch.object(CNVSyncService, 'BATCH_SIZE', 3), \
+                mock.patch.object(service.client, 'iter_customer_pages', side_effect=pages), \
+                mock.patch.object(service, '_process_customer_batch', side_effect=process):
+            result = service.sync_customers(incremental=False)
+
+        self.assertEqual(result, (0, 6, 0))
+        self.assertEqual(events, [
+            ('page', 0), ('page', 1), ('batch', [0, 1, 2]),
+            ('page', 2), ('batch', [3, 4, 5]),
+        ])
+        sync_log = CNVSyncLog.objects.get(sync_type='customers')
+        self.assertEqual(sync_log.total_records, 6)
+        self.assertEqual(sync_log.status, 'completed')
+
+
+class SchedulerStartupTests(SimpleTestCase):
+    """Where AppConfig.ready() starts the CNV scheduler."""
+
+    def _ready(self, argv, env, scheduler=None):
+        with mock.patch('sys.argv', argv), mock.patch.dict('os.environ', env, clear=False), \
+                mock.patch('App.cnv.scheduler.start_scheduler', return_value=scheduler) as start, \
+                self.assertLogs('App.apps', level='DEBUG') as logs:
+            apps.get_app_config('App').ready()
+        return start, logs.output
+
+    def test_runserver_starts_only_in_reloader_child(self):
+        with mock.patch.dict('os.environ'):
+            os.environ.pop('RUN_MAIN', None)
+            start, _ = self._ready(['manage.py', 'runserver'], {})
+        start.assert_not_called()
+
+        start, output = self._ready(['manage.py', 'runserver'], {'RUN_MAIN': 'true'}, scheduler=object())
+        start.assert_called_once()
+        self.assertTrue(any('started successfully' in line for line in output))
+
+    def test_worker_without_the_lock_does_not_report_started(self):
+        start, output = self._ready(['/usr/bin/gunicorn', 'SemirDashboard.wsgi'], {}, scheduler=None)
+        start.assert_called_once()
+        self.assertFalse(any('started successfully' in line for line in output))
@@ -114,7 +114,7 @@ from App.analytics.coupon_analytics import (
     export_coupon_tab_to_excel,
     _COUPON_TAB_SHEETS,
 )
-from App.analytics.excel_export import export_analytics_to_excel, export_tab_to_excel, _TAB_SHEETS
+from App.analytics.excel_export import export_analytics_to_excel_bytes, _TAB_SHEETS
 from .forms import CustomerUploadForm, SalesUploadForm, UsedPointsUploadForm
 from .utils import process_customer_file, process_sales_file, process_used_points_file
 from .models import Customer, SalesTransaction, Coupon
@@ -409,7 +409,7 @@ def export_analytics(request):
     date_from = _parse_date(start_date, "start date", request)
     date_to = _parse_date(end_date, "end date", request)
 
-    data, _ = _get_analytics_data(date_from, date_to, shop_group)
+    data, cache_key = _get_analytics_data(date_from, date_to, shop_group)
     if not data:
         messages.error(request, "No data to export")
         return redirect("analytics_dashboard")
@@ -419,18 +419,27 @@ def export_analytics(request):
 
     if tab and tab in _TAB_SHEETS:
         _, tab_title = _TAB_SHEETS[tab]
-        wb = export_tab_to_excel(tab, data, date_from=date_from, date_to=date_to, shop_group=shop_group)
         tab_slug = tab_title.replace(" ", "_").replace("-", "").replace("/", "")
         fn = f"analytics_{tab_slug}_{period}_{ts}.xlsx"
     else:
-        wb = export_analytics_to_excel(data, date_from=date_from, date_to=date_to, shop_group=shop_group)
+        tab = None
         fn = f"return_visit_rate_{period}_{ts}.xlsx"
 
+    # The workbook depends only on the cached data and filters, so its bytes
+    # share the data's versioned key and TTL
+    xlsx_key = f"{cache_key}:xlsx:{tab or 'all'}"
+    content = cache.get(xlsx_key)
+    if content is None:
+        content = export_analytics_to_excel_bytes(
+            data, date_from=date_from, date_to=date_to, shop_group=shop_group, tab=tab,
+        )
+        cache.set(xlsx_key, content, _ANALYTICS_TTL)
+
     resp = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        content,
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
     resp["Content-Disposition"] = f'attachment; filename="{fn}"'
-    wb.save(resp)
     return resp
 
 